@@ -3,7 +3,7 @@ from PyInstaller.utils.hooks import collect_all
 
 datas = [('D:\\Keg-Trading\\Stitch - The Coran Building\\backend\\static', 'static'), ('version.json', '.'), ('C:\\Users\\kelgh\\AppData\\Roaming\\Python\\Python314\\site-packages\\whisper\\assets', 'whisper/assets')]
 binaries = []
-hiddenimports = ['passlib.handlers.argon2', 'passlib.handlers.bcrypt', 'argon2', 'uvicorn.logging', 'uvicorn.loops.auto', 'uvicorn.protocols.http.auto', 'uvicorn.protocols.websockets.auto', 'uvicorn.lifespan.on', 'googleapiclient.discovery', 'google_auth_oauthlib.flow', 'sqlalchemy.dialects.postgresql', 'fasthtml', 'backend.app.services.audio_analysis', 'librosa', 'librosa.core', 'librosa.core.audio', 'librosa.feature', 'librosa.effects', 'librosa.util', 'soundfile', 'audioread', 'soxr', 'scipy', 'scipy.signal', 'scipy.fft', 'sklearn', 'numba', 'numba.core', 'llvmlite']
+hiddenimports = ['passlib.handlers.argon2', 'passlib.handlers.bcrypt', 'argon2', 'uvicorn.logging', 'uvicorn.loops.auto', 'uvicorn.protocols.http.auto', 'uvicorn.protocols.websockets.auto', 'uvicorn.lifespan.on', 'googleapiclient.discovery', 'google_auth_oauthlib.flow', 'sqlalchemy.dialects.postgresql', 'sqlalchemy.dialects.sqlite.aiosqlite', 'aiosqlite', 'fasthtml', 'backend.app.services.audio_analysis', 'librosa', 'librosa.core', 'librosa.core.audio', 'librosa.feature', 'librosa.effects', 'librosa.util', 'soundfile', 'audioread', 'soxr', 'scipy', 'scipy.signal', 'scipy.fft', 'sklearn', 'numba', 'numba.core', 'llvmlite']
 tmp_ret = collect_all('librosa')
 datas += tmp_ret[0]; binaries += tmp_ret[1]; hiddenimports += tmp_ret[2]
 tmp_ret = collect_all('numba')
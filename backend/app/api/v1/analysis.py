@@ -1,17 +1,24 @@
-from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, status
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from datetime import datetime
 import os
-import shutil
 import difflib
 import logging
 import json
+import secrets
 from typing import Optional
 
-from backend.app.core.database import get_db
+from backend.app.core.cache import LRUCache
+from backend.app.core.database import get_db, write_behind
+from backend.app.core.upsert import upsert_progress
+from backend.app.core.rule_stats import record_recitation
+from backend.app.core.recording_store import db_path, key_of, recording_store
+from backend.app.core.pagination import NEXT_CURSOR_HEADER, history_after, history_order, page_size, split_page
 from backend.app.core.security import get_current_user_optional, get_password_hash # Import the new optional auth
-from backend.app.models.models import User, Progress, Recording
+from backend.app.core.principal import Principal
+from backend.app.models.models import User, Progress, Recording, RecordingAnalysis, RuleStat, PageStat
 from backend.app.core.config import settings
 from backend.app.services.transcription import transcribe, transcribe_with_timestamps
 from backend.app.services.audio_analysis import (
@@ -19,22 +26,27 @@ from backend.app.services.audio_analysis import (
     extract_segment,
     estimate_beat_duration,
 )
-from backend.app.services.feedback import get_ai_feedback
+from backend.app.services.feedback import get_ai_feedback, stream_ai_feedback
 from backend.app.services.quran import get_quran_page_text, normalize_arabic
+from backend.app.services.passage_index import resolve_expected_pages, expected_text_for
 from backend.app.services.tajweed_engine import TajweedEngine
+from backend.app.services.vocabulary import vocabulary, encode_expected, encode_heard, normalize_heard
+from backend.app.services.analysis_codec import WORD_FEEDBACK_INVALID, decode_analysis, decode_header, encode_analysis
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-os.makedirs(settings.RECORDINGS_DIR, exist_ok=True)
+# Contextes de coaching en attente de streaming (jeton → arguments), cf. /analyze?stream_feedback
+_pending_feedback = LRUCache(maxsize=256, ttl=600)
 
 
 def _align_words(words_expected: list[str], transcribed_words: list[dict]) -> list[dict]:
     """
     Aligne les mots attendus avec les mots transcrits (+ leurs timestamps).
 
-    Utilise difflib.SequenceMatcher sur des listes normalisées pour gérer les
-    mots manquants, ajoutés ou mal prononcés — au lieu d'un simple index.
+    Utilise difflib.SequenceMatcher sur les identifiants entiers du vocabulaire
+    interné (services/vocabulary.py) pour gérer les mots manquants, ajoutés ou
+    mal prononcés — au lieu d'un simple index.
 
     Args:
         words_expected: liste des mots du texte de référence (avec diacritiques)
@@ -50,10 +62,10 @@ def _align_words(words_expected: list[str], transcribed_words: list[dict]) -> li
     """
     transcribed_texts = [w["word"] for w in transcribed_words]
 
-    norm_expected = [normalize_arabic(w) for w in words_expected]
-    norm_transcribed = [normalize_arabic(w) for w in transcribed_texts]
+    ids_expected = encode_expected(words_expected)
+    ids_transcribed = encode_heard([normalize_heard(w) for w in transcribed_texts])
 
-    matcher = difflib.SequenceMatcher(None, norm_expected, norm_transcribed, autojunk=False)
+    matcher = difflib.SequenceMatcher(None, ids_expected, ids_transcribed, autojunk=False)
 
     alignment = []
 
@@ -99,119 +111,192 @@ def _align_words(words_expected: list[str], transcribed_words: list[dict]) -> li
 
     return alignment
 
+def _run_detailed_analysis(file_path: str, page_id: int, difficulty_level: int) -> dict:
+    """Partie bloquante de /analyze (Whisper, audio, Tajwid) — exécutée dans le threadpool."""
+    # 1. Transcription Whisper avec timestamps mot par mot
+    logger.info(f"Analyzing audio for Page {page_id}")
+    transcription_result = transcribe_with_timestamps(file_path)
+    raw_text = transcription_result["text"]
+    transcribed_words = transcription_result["words"]
+    logger.info(f"Whisper: {len(transcribed_words)} mots avec timestamps")
+
+    # Chargement audio pour l'analyse acoustique (même fichier, via ffmpeg)
+    audio_data = load_audio_for_analysis(file_path)
+
+    # Passage réellement récité (page demandée, voisines, ou autre page)
+    pages, detected_passage = resolve_expected_pages(page_id, raw_text)
+
+    expected_text = expected_text_for(pages, get_quran_page_text)
+    if not expected_text:
+        raise HTTPException(status_code=404, detail="Texte Coranique introuvable")
+
+    words_expected = expected_text.split()
+
+    # 2. Alignement réel via difflib (remplace le faux i * 0.8)
+    aligned = _align_words(words_expected, transcribed_words)
+
+    beat_duration = estimate_beat_duration(aligned)
+    logger.info(f"Beat duration estimé : {beat_duration:.3f}s")
+
+    analysis_words = []
+    matched_count: int = 0
+
+    for idx, entry in enumerate(aligned):
+        next_entry = aligned[idx + 1] if idx + 1 < len(aligned) else None
+        next_word  = next_entry["expected"] if next_entry else None
+
+        # Extraire le segment audio du mot (None si timestamps absents)
+        segment = extract_segment(audio_data, entry["start"], entry["end"]) \
+                  if audio_data is not None else None
+
+        word_analysis = TajweedEngine.analyze_word(
+            word_expected=entry["expected"],
+            word_student=entry["transcribed"],
+            level=difficulty_level,
+            next_word=next_word,
+            audio_segment=segment,
+            beat_duration=beat_duration,
+        )
+
+        if word_analysis["valid"]:
+            matched_count += 1
+
+        analysis_words.append({
+            "text": entry["expected"],
+            "start": entry["start"],
+            "end": entry["end"],
+            "valid": word_analysis["valid"],
+            "confidence": word_analysis["confidence"],
+            "tajweed_rules": word_analysis["rules"],
+            "feedback": "" if word_analysis["valid"] else WORD_FEEDBACK_INVALID
+        })
+
+    return {
+        "raw_text": raw_text,
+        "pages": pages,
+        "detected_passage": detected_passage,
+        "recorded_page": page_id if page_id in pages else pages[0],
+        "expected_text": expected_text,
+        "analysis_words": analysis_words,
+        "similarity_ratio": matched_count / len(words_expected) if words_expected else 0,
+    }
+
+
+def _save_analysis_recording(
+    current_user: Optional[User], page: int, filename: str, score: int, feedback_text: str,
+    analysis: Optional[bytes] = None, analysis_words: Optional[list] = None,
+) -> None:
+    """Historique : insertion différée (write-behind), hors du chemin de la requête.
+
+    `analysis` : analyse mot-à-mot encodée (analysis_codec), relue par
+    GET /recording/{id}/analysis sans refaire l'analyse. `analysis_words`
+    alimente les statistiques par règle et par page (même transaction).
+    """
+    user_id = current_user.id if current_user else None
+
+    def insert(db: Session) -> None:
+        owner_id = user_id
+        if owner_id is None:
+            guest = db.query(User).filter(User.username == "guest").first()
+            if not guest:
+                return
+            owner_id = guest.id
+        recording = Recording(
+            user_id=owner_id,
+            page_number=page,
+            file_path=db_path(filename),
+            score=score,
+            feedback=feedback_text
+        )
+        if analysis is not None:
+            recording.analysis = RecordingAnalysis(data=analysis)
+        db.add(recording)
+        record_recitation(db, RuleStat, PageStat, owner_id, page, score, analysis_words)
+
+    write_behind.submit(insert)
+
+
+def _update_recording_feedback(filename: str, feedback_text: str) -> None:
+    """Enregistre le conseil streamé une fois complet (après l'insertion, même file d'écriture)."""
+    def update(db: Session) -> None:
+        # Fichier dédupliqué : plusieurs enregistrements peuvent le partager, on vise le dernier inséré
+        recording = db.query(Recording).filter(Recording.file_path == db_path(filename)).order_by(Recording.id.desc()).first()
+        if recording:
+            recording.feedback = feedback_text
+
+    write_behind.submit(update)
+
+
 @router.post("/analyze")
-def analyze_recitation(
+async def analyze_recitation(
     page_id: int = Form(...), 
     audio: UploadFile = File(...),
     difficulty_level: int = Form(1),
-    current_user: Optional[User] = Depends(get_current_user_optional),
+    stream_feedback: bool = Form(False),
+    current_user: Optional[Principal] = Depends(get_current_user_optional),
     db: Session = Depends(get_db)
 ):
     """
     Endpoint EXPERT : Fournit une analyse détaillée mot-à-mot avec règles de Tajweed.
+
+    Whisper et l'analyse Tajwid tournent dans le threadpool ; le coaching IA
+    est attendu sur la boucle d'événements sans bloquer de thread.
+
+    Avec `stream_feedback`, l'analyse est renvoyée sans attendre le LLM :
+    `feedback_stream` pointe vers le flux SSE du conseil (GET, usage unique).
     """
     # Keep server alive
     from backend.app.api.v1 import system
     import time
     system.last_heartbeat = time.time()
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"analysis_p{page_id}_{timestamp}.webm"
-    file_path = os.path.join(settings.RECORDINGS_DIR, filename)
-    
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(audio.file, buffer)
-            
-        # 1. Transcription Whisper avec timestamps mot par mot
-        logger.info(f"Analyzing audio for Page {page_id}")
-        transcription_result = transcribe_with_timestamps(file_path)
-        raw_text = transcription_result["text"]
-        transcribed_words = transcription_result["words"]
-        logger.info(f"Whisper: {len(transcribed_words)} mots avec timestamps")
-
-        # Chargement audio pour l'analyse acoustique (même fichier, via ffmpeg)
-        audio_data = load_audio_for_analysis(file_path)
-
-        expected_text = get_quran_page_text(page_id)
-        if not expected_text:
-            raise HTTPException(status_code=404, detail="Texte Coranique introuvable")
-
-        words_expected = expected_text.split()
-
-        # 2. Alignement réel via difflib (remplace le faux i * 0.8)
-        aligned = _align_words(words_expected, transcribed_words)
-
-        beat_duration = estimate_beat_duration(aligned)
-        logger.info(f"Beat duration estimé : {beat_duration:.3f}s")
-
-        analysis_words = []
-        matched_count: int = 0
-
-        for idx, entry in enumerate(aligned):
-            next_entry = aligned[idx + 1] if idx + 1 < len(aligned) else None
-            next_word  = next_entry["expected"] if next_entry else None
-
-            # Extraire le segment audio du mot (None si timestamps absents)
-            segment = extract_segment(audio_data, entry["start"], entry["end"]) \
-                      if audio_data is not None else None
-
-            word_analysis = TajweedEngine.analyze_word(
-                word_expected=entry["expected"],
-                word_student=entry["transcribed"],
-                level=difficulty_level,
-                next_word=next_word,
-                audio_segment=segment,
-                beat_duration=beat_duration,
-            )
-
-            if word_analysis["valid"]:
-                matched_count += 1
-
-            analysis_words.append({
-                "text": entry["expected"],
-                "start": entry["start"],
-                "end": entry["end"],
-                "valid": word_analysis["valid"],
-                "confidence": word_analysis["confidence"],
-                "tajweed_rules": word_analysis["rules"],
-                "feedback": "" if word_analysis["valid"] else "Améliorez la précision pour ce niveau."
-            })
+        # Écriture atomique, nommée par le contenu (core/recording_store.py)
+        stored = await run_in_threadpool(recording_store.save, audio.file)
+        file_path, filename = stored.path, stored.key
+        result = await run_in_threadpool(_run_detailed_analysis, file_path, page_id, difficulty_level)
+        similarity_ratio = result["similarity_ratio"]
 
-        similarity_ratio = matched_count / len(words_expected) if words_expected else 0
-        
         # 3. Coaching IA
-        feedback_text = get_ai_feedback(expected_text, raw_text, similarity_ratio)
+        invalid_indices = [i for i, w in enumerate(result["analysis_words"]) if not w["valid"]]
+        feedback_args = dict(
+            expected_text=result["expected_text"], student_text=result["raw_text"],
+            similarity_ratio=similarity_ratio, page=result["recorded_page"], level=difficulty_level,
+            missing_indices=invalid_indices, variant=f"analyze:{result['pages']}",
+            analysis_words=result["analysis_words"],
+        )
+        feedback_stream = None
+        if stream_feedback:
+            # Palier connu à la fin du flux (évènement `done`)
+            feedback_text, feedback_tier = "", None
+        else:
+            feedback_text, feedback_tier = await get_ai_feedback(**feedback_args)
         
-        # Sauvegarde Historique
-        try:
-            user_to_save = current_user
-            if not user_to_save:
-                 user_to_save = db.query(User).filter(User.username == "guest").first()
-            
-            if user_to_save:
-                new_recording = Recording(
-                    user_id=user_to_save.id,
-                    page_number=page_id,
-                    file_path=f"recordings/{filename}",
-                    score=int(similarity_ratio * 100),
-                    feedback=feedback_text
-                )
-                db.add(new_recording)
-                db.commit()
-        except Exception as e:
-            logger.error(f"Failed to save recording: {e}")
-            db.rollback()
+        # Sauvegarde Historique (analyse mot-à-mot encodée, ~1-2 Ko par page)
+        encoded = encode_analysis(result["analysis_words"], result["pages"], result["expected_text"], difficulty_level)
+        _save_analysis_recording(
+            current_user, result["recorded_page"], filename, int(similarity_ratio * 100), feedback_text,
+            encoded, result["analysis_words"],
+        )
+
+        if stream_feedback:
+            token = secrets.token_urlsafe(16)
+            _pending_feedback.put(token, (feedback_args, filename))
+            feedback_stream = f"/api/v1/recitation/feedback/{token}/stream"
 
         return {
             "status": "success",
             "overall_score": similarity_ratio,
-            "transcription": raw_text,
+            "transcription": result["raw_text"],
+            "pages": result["pages"],
+            "detected_passage": result["detected_passage"],
             "analysis": {
-                "words": analysis_words
+                "words": result["analysis_words"]
             },
             "audio_url": f"/recordings/{filename}",
             "feedback": feedback_text,
+            "feedback_tier": feedback_tier,
+            "feedback_stream": feedback_stream,
             "disclaimer": "Outil d'apprentissage assisté par IA. Ne remplace pas un enseignant certifié."
         }
 
@@ -219,11 +304,118 @@ def analyze_recitation(
         logger.exception("CRITICAL ERROR in analyze_recitation")
         return JSONResponse(status_code=500, content={"error": str(e)})
 
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.get("/feedback/{token}/stream")
+async def stream_recitation_feedback(token: str):
+    """
+    Conseil IA streamé (Server-Sent Events) pour une analyse lancée avec `stream_feedback`.
+
+    Évènements : `token` (fragment de texte, JSON string) puis `done`
+    ({"feedback", "cached", "error"?}). Le jeton n'est utilisable qu'une fois.
+    """
+    pending = _pending_feedback.get(token)
+    _pending_feedback.pop(token)
+    if pending is None:
+        raise HTTPException(status_code=404, detail="Flux de conseil introuvable ou expiré")
+    feedback_args, filename = pending
+
+    async def events():
+        async for item in stream_ai_feedback(**feedback_args):
+            yield _sse(item["event"], item["data"])
+            if item["event"] == "done":
+                _update_recording_feedback(filename, item["data"]["feedback"])
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _get_or_create_guest(db: Session) -> User:
+    guest_user = db.query(User).filter(User.username == "guest").first()
+    if not guest_user:
+        logger.info("Creating 'guest' user.")
+        guest_user = User(
+            username="guest", 
+            hashed_password=get_password_hash("guest"), 
+            mushaf_type="madani", 
+            difficulty_level=1
+        )
+        db.add(guest_user)
+        db.commit()
+        db.refresh(guest_user)
+    return guest_user
+
+
+def _missing_word_indices(expected_forms: list[str], heard_forms: list[str]) -> list[int]:
+    """Indices des mots attendus non retrouvés tels quels dans la transcription."""
+    ids_expected = [vocabulary.intern(w) for w in expected_forms]
+    matcher = difflib.SequenceMatcher(None, ids_expected, encode_heard(heard_forms), autojunk=False)
+    matched = set()
+    for block in matcher.get_matching_blocks():
+        matched.update(range(block.a, block.a + block.size))
+    return [i for i in range(len(ids_expected)) if i not in matched]
+
+
+def _compare_page_text(page: int, transcribed_text: str) -> Optional[dict]:
+    """Résolution du passage + ratio global (SequenceMatcher sur la page entière, coûteux)."""
+    pages, detected_passage = resolve_expected_pages(page, transcribed_text)
+    expected_text = expected_text_for(pages, get_quran_page_text)
+    if not expected_text:
+        return None
+
+    clean_expected = normalize_arabic(expected_text)
+    clean_student = normalize_arabic(transcribed_text)
+
+    matcher = difflib.SequenceMatcher(None, clean_expected, clean_student)
+    similarity_ratio = matcher.ratio()
+    logger.info(f"Similarity Ratio: {similarity_ratio:.2f}")
+    return {
+        "detected_passage": detected_passage,
+        "recorded_page": page if page in pages else pages[0],
+        "clean_expected": clean_expected,
+        "clean_student": clean_student,
+        "similarity_ratio": similarity_ratio,
+        "missing_indices": _missing_word_indices(clean_expected.split(), clean_student.split()),
+    }
+
+
+def _save_validation(db: Session, user: Principal, page: int, filename: str, score: int, feedback_text: str, is_valid: bool) -> None:
+    # L'historique passe par le write-behind ; seule la progression est validée ici.
+    db_file_path = db_path(filename)
+    user_id = user.id
+    def insert(session: Session) -> None:
+        session.add(Recording(
+            user_id=user_id,
+            page_number=page,
+            file_path=db_file_path,
+            score=score,
+            feedback=feedback_text
+        ))
+        record_recitation(session, RuleStat, PageStat, user_id, page, score)
+
+    write_behind.submit(insert)
+    if not is_valid:
+        return
+
+    try:
+        upsert_progress(db, Progress, user.id, [(page, "mastered")])
+        db.commit()
+    except Exception as e:
+        logger.exception("DB Save Error")
+        db.rollback()
+
+
 @router.post("/validate")
-def validate_recitation(
+async def validate_recitation(
     page: int = Form(...), 
     file: UploadFile = File(...),
-    current_user: Optional[User] = Depends(get_current_user_optional), # Optional Auth
+    current_user: Optional[Principal] = Depends(get_current_user_optional), # Optional Auth
     db: Session = Depends(get_db)
 ):
     # Keep server alive during analysis
@@ -236,34 +428,18 @@ def validate_recitation(
     # Handle Guest User
     if not current_user:
         logger.info("Unauthenticated user. Using 'guest' account.")
-        guest_user = db.query(User).filter(User.username == "guest").first()
-        if not guest_user:
-            logger.info("Creating 'guest' user.")
-            guest_user = User(
-                username="guest", 
-                hashed_password=get_password_hash("guest"), 
-                mushaf_type="madani", 
-                difficulty_level=1
-            )
-            db.add(guest_user)
-            db.commit()
-            db.refresh(guest_user)
-        current_user = guest_user
-
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"page_{page}_{timestamp}.webm"
-    file_path = os.path.join(settings.RECORDINGS_DIR, filename)
-    
+        current_user = Principal.from_user(await run_in_threadpool(_get_or_create_guest, db))
+
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
+        stored = await run_in_threadpool(recording_store.save, file.file)
+        file_path, filename = stored.path, stored.key
+
         logger.info(f"File saved: {file_path}")
         
         # 2. Transcription Whisper
         logger.info("Starting Whisper transcription...")
         try:
-            transcribed_text = transcribe(file_path)
+            transcribed_text = await run_in_threadpool(transcribe, file_path)
             logger.info(f"Whisper Transcription: {transcribed_text}")
         except Exception as e:
             logger.error(f"Whisper Transcription Error: {e}")
@@ -279,19 +455,14 @@ def validate_recitation(
                 "audio_url": f"/recordings/{filename}"
             }
 
-        expected_text = get_quran_page_text(page)
-        if not expected_text:
+        comparison = await run_in_threadpool(_compare_page_text, page, transcribed_text)
+        if comparison is None:
             return {"valid": True, "feedback": "Texte Coranique introuvable, validation simulée.", "audio_url": f"/recordings/{filename}"}
-
-        clean_expected = normalize_arabic(expected_text)
-        clean_student = normalize_arabic(transcribed_text)
-        
-        matcher = difflib.SequenceMatcher(None, clean_expected, clean_student)
-        similarity_ratio = matcher.ratio()
-        logger.info(f"Similarity Ratio: {similarity_ratio:.2f}")
+        similarity_ratio = comparison["similarity_ratio"]
 
         is_valid = False
         feedback_text = ""
+        feedback_tier = "static"
         
         THRESHOLD_PERFECT = 0.85
         THRESHOLD_REJECT = 0.50
@@ -304,39 +475,26 @@ def validate_recitation(
             feedback_text = "Trop d'écarts. Révisez bien."
         else:
             is_valid = (similarity_ratio >= 0.70)
-            feedback_text = get_ai_feedback(clean_expected, clean_student, similarity_ratio)
+            feedback_text, feedback_tier = await get_ai_feedback(
+                comparison["clean_expected"], comparison["clean_student"], similarity_ratio,
+                page=comparison["recorded_page"], level=current_user.difficulty_level or 1,
+                missing_indices=comparison["missing_indices"], variant="validate",
+            )
 
         # Save to DB
-        try:
-            db_file_path = f"recordings/{filename}"
-            new_recording = Recording(
-                user_id=current_user.id,
-                page_number=page,
-                file_path=db_file_path,
-                score=int(similarity_ratio * 100),
-                feedback=feedback_text
-            )
-            db.add(new_recording)
-            
-            if is_valid:
-                prog = db.query(Progress).filter(Progress.user_id==current_user.id, Progress.page_number==page).first()
-                if not prog:
-                    prog = Progress(user_id=current_user.id, page_number=page, status="mastered")
-                    db.add(prog)
-                else:
-                    prog.status = "mastered"
-                    prog.last_updated = datetime.now()
-            
-            db.commit()
-        except Exception as e:
-            logger.exception("DB Save Error")
-            db.rollback()
+        await run_in_threadpool(
+            _save_validation, db, current_user, comparison["recorded_page"],
+            filename, int(similarity_ratio * 100), feedback_text, is_valid,
+        )
 
         return {
             "valid": is_valid,
             "feedback": feedback_text,
+            "feedback_tier": feedback_tier,
             "audio_url": f"/recordings/{filename}",
-            "transcription": transcribed_text
+            "transcription": transcribed_text,
+            "page": comparison["recorded_page"],
+            "detected_passage": comparison["detected_passage"],
         }
 
     except Exception as e:
@@ -344,27 +502,48 @@ def validate_recitation(
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 @router.get("/history/{page}")
-def get_recording_history(page: int, current_user: Optional[User] = Depends(get_current_user_optional), db: Session = Depends(get_db)):
+def get_recording_history(
+    page: int,
+    response: Response,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    current_user: Optional[Principal] = Depends(get_current_user_optional),
+    db: Session = Depends(get_db)
+):
     if not current_user: 
         return [] # Empty history for guest
-        
+
+    # Keyset pagination on (timestamp, id): the next page's cursor is in X-Next-Cursor
+    size = page_size(limit, settings.HISTORY_PAGE_SIZE, settings.HISTORY_MAX_PAGE_SIZE)
+    after = history_after(Recording, cursor)
     try:
-        recordings = db.query(Recording).filter(
+        # L'analyse encodée n'est pas chargée ici, seulement sa présence
+        query = db.query(Recording, RecordingAnalysis.recording_id.isnot(None).label("has_analysis")).outerjoin(
+            RecordingAnalysis, RecordingAnalysis.recording_id == Recording.id
+        ).filter(
             Recording.user_id == current_user.id,
             Recording.page_number == page
-        ).order_by(Recording.timestamp.desc()).limit(5).all()
+        )
+        if after is not None:
+            query = query.filter(after)
+        rows, next_cursor = split_page(
+            query.order_by(*history_order(Recording)).limit(size + 1).all(), size, lambda row: (row[0].timestamp, row[0].id)
+        )
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
         
         history = []
-        for r in recordings:
-            filename = os.path.basename(r.file_path)
-            url = f"/recordings/{filename}"
+        for r, has_analysis in rows:
+            # Sans fichier : audio supprimé par la rétention / le quota, le score et l'analyse restent
+            url = f"/recordings/{key_of(r.file_path)}" if r.file_path else None
             
             history.append({
                 "id": r.id,
                 "url": url,
                 "timestamp": r.timestamp.isoformat() if r.timestamp else datetime.now().isoformat(),
                 "score": r.score,
-                "feedback": r.feedback
+                "feedback": r.feedback,
+                "has_analysis": bool(has_analysis)
             })
             
         return history
@@ -372,10 +551,31 @@ def get_recording_history(page: int, current_user: Optional[User] = Depends(get_
         logger.exception("History Error")
         return JSONResponse(status_code=500, content={"error": str(e)})
 
+@router.get("/recording/{recording_id}/analysis")
+def get_recording_analysis(
+    recording_id: int,
+    current_user: Optional[Principal] = Depends(get_current_user_optional),
+    db: Session = Depends(get_db)
+):
+    """Analyse mot-à-mot d'un enregistrement passé, décodée à la demande (pas de nouvelle analyse)."""
+    row = db.query(Recording.user_id, User.username, RecordingAnalysis.data).join(
+        RecordingAnalysis, RecordingAnalysis.recording_id == Recording.id
+    ).join(User, User.id == Recording.user_id).filter(Recording.id == recording_id).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Analyse introuvable pour cet enregistrement")
+    # Sans connexion : seules les analyses du compte invité sont lisibles
+    owner_ok = row.user_id == current_user.id if current_user else row.username == "guest"
+    if not owner_ok:
+        raise HTTPException(status_code=403, detail="Non autorisé")
+
+    # Texte des mots : index local du Mushaf (réseau seulement si absent)
+    expected_text = expected_text_for(decode_header(row.data)["pages"], get_quran_page_text)
+    return {"recording_id": recording_id, **decode_analysis(row.data, expected_text)}
+
 @router.delete("/recording/{recording_id}")
 def delete_recording(
     recording_id: int,
-    current_user: Optional[User] = Depends(get_current_user_optional),
+    current_user: Optional[Principal] = Depends(get_current_user_optional),
     db: Session = Depends(get_db)
 ):
     try:
@@ -387,13 +587,15 @@ def delete_recording(
         if current_user and recording.user_id != current_user.id:
             raise HTTPException(status_code=403, detail="Non autorisé")
 
-        # Delete file
-        file_path = os.path.join(settings.RECORDINGS_DIR, os.path.basename(recording.file_path))
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        
+        # Fichier partagé (déduplication) : supprimé seulement s'il n'est plus référencé
+        shared = db.query(Recording.id).filter(
+            Recording.file_path == recording.file_path, Recording.id != recording.id
+        ).first()
+        key = key_of(recording.file_path)
         db.delete(recording)
         db.commit()
+        if not shared and key:
+            recording_store.delete(key)
         return {"status": "success"}
     except Exception as e:
         logger.exception("Delete Error")
@@ -1,7 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from backend.app.core.database import get_db
-from backend.app.core.security import create_access_token, get_password_hash, verify_password
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.app.core.database import get_async_db
+from backend.app.core.passwords import password_hasher
+from backend.app.core.security import create_access_token
 from backend.app.models.models import User
 from backend.app.schemas.schemas import UserCreate, Token
 from fastapi.security import OAuth2PasswordRequestForm
@@ -10,35 +12,46 @@ from backend.app.core.config import settings
 
 router = APIRouter()
 
+# Argon2 runs on the bounded password executor, awaited here: a burst of
+# logins neither blocks the event loop nor takes threadpool threads / cores
+# from the analyses. Over capacity, password_hasher answers 503 + Retry-After.
+
 @router.post("/register", response_model=Token)
-def register(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.username == user.username).first()
-    if db_user:
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    existing = await db.execute(select(User.id).where(User.username == user.username))
+    if existing.first():
         raise HTTPException(status_code=400, detail="Username already registered")
-    
-    hashed_password = get_password_hash(user.password)
+
+    hashed_password = await password_hasher.hash_async(user.password)
     new_user = User(
-        username=user.username, 
-        hashed_password=hashed_password, 
+        username=user.username,
+        hashed_password=hashed_password,
         mushaf_type=user.mushaf_type,
         difficulty_level=user.difficulty_level
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    
+    await db.commit()
+
     access_token = create_access_token(data={"sub": new_user.username})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/token", response_model=Token)
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(select(User).where(User.username == form_data.username))
+    user = result.scalars().first()
+    valid, new_hash = False, None
+    if user:
+        valid, new_hash = await password_hasher.verify_and_update_async(form_data.password, user.hashed_password)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        # Stored hash made with other Argon2 costs: upgrade it now that we have the password
+        user.hashed_password = new_hash
+        await db.commit()
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user.username}, expires_delta=access_token_expires
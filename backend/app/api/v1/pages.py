@@ -1,27 +1,33 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
-import os
-from backend.app.core.config import settings
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from backend.app.core.file_responses import IMMUTABLE, serve_file
+from backend.app.services import page_images
 
 router = APIRouter()
 
 @router.get("/{page_request}")
-async def get_quran_page(page_request: str):
+def get_quran_page(
+    page_request: str,
+    request: Request,
+    w: Optional[int] = Query(None, description="Display width in px, snapped to PAGE_IMAGE_WIDTHS"),
+    fmt: Optional[str] = Query(None, alias="format", description="avif, webp, jpeg or auto (Accept header)"),
+):
     # The frontend might request "057.svg" or "57"
     # User provided files: Quran_Page_003.jpg = Page 1
-    # Logic from backend_server.py: target_num = page_num + 2
     try:
-        clean_name = page_request.split('.')[0]
-        page_num = int(clean_name)
-        
-        target_num = page_num + 2
-        filename = f"Quran_Page_{str(target_num).zfill(3)}.jpg"
-        
-        file_path = os.path.join(settings.QURAN_PAGES_DIR, filename)
-        if os.path.exists(file_path):
-            return FileResponse(file_path)
-            
-    except Exception as e:
-        print(f"Error serving local page {page_request}: {e}")
-        
-    raise HTTPException(status_code=404, detail="Page not found locally")
+        page_num = int(page_request.split('.')[0])
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Page not found locally")
+
+    filename = page_images.page_filename(page_num)
+    variant, from_accept = page_images.negotiate(request.headers.get("accept", ""), fmt, w)
+    # Page images never change: stat and hash once, then 304 / browser cache
+    resolved = page_images.resolve(filename, variant)
+    if resolved is None:
+        raise HTTPException(status_code=404, detail="Page not found locally")
+    info, variant = resolved
+    return serve_file(
+        request, info, variant.media_type, IMMUTABLE,
+        offload_path=page_images.offload_path(info.path, variant),
+        extra_headers={"Vary": "Accept"} if from_accept else None,
+    )
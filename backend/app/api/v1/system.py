@@ -1,4 +1,4 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 import time
 import threading
 import os
@@ -18,6 +18,23 @@ def heartbeat():
     last_heartbeat = time.time()
     return {"status": "alive"}
 
+@router.get("/ollama")
+async def ollama_status():
+    """Ollama client health: breaker state, in-flight calls, latency percentiles, current tier."""
+    from backend.app.services.ollama_client import ollama
+    from backend.app.services.llm_tiering import governor
+    return {**ollama.stats(), "tiering": governor.stats(), "health": await ollama.health()}
+
+@router.get("/db")
+def db_status(request: Request):
+    """Write-behind queue, pool checkout waits and slow queries per engine, auth cache, recording maintenance."""
+    from backend.app.core.database import write_behind
+    from backend.app.core.engine_profile import db_metrics
+    from backend.app.core.principal import principal_cache
+    from backend.app.core.passwords import password_hasher
+    return {"write_behind": write_behind.stats(), "engines": db_metrics(), "auth_cache": principal_cache.stats(), "password_hasher": password_hasher.stats(),
+            "maintenance": request.app.state.recording_maintenance.stats()}
+
 def monitor_shutdown():
     global last_heartbeat
     logger.info("Shutdown monitor started. Waiting for heartbeats...")
@@ -29,6 +46,8 @@ def monitor_shutdown():
         # If no heartbeat for 60 seconds, shut down
         if elapsed > 60:
             logger.warning(f"No heartbeat for {elapsed:.1f}s. Force shutting down...")
+            from backend.app.core.database import write_behind
+            write_behind.close()
             os._exit(0) # More reliable on Windows than SIGTERM
             break
 
@@ -1,92 +1,140 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Header, Response, status
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from datetime import datetime
-from backend.app.core.database import get_db
+from datetime import date, datetime
+from backend.app.core.database import get_db, get_async_db, write_behind
+from backend.app.core.activity import ActivityTracker, current_streak, streak_after_activity
+from backend.app.core.upsert import upsert_progress
+from backend.app.core.progress_snapshot import TOTAL_PAGES, build_snapshot, etag_matches, snapshot_etag
+from backend.app.core.pagination import NEXT_CURSOR_HEADER, page_size, split_page, users_after
+from backend.app.core.rule_stats import page_entry, rule_entry
 from backend.app.core.security import get_current_user
-from backend.app.models.models import User, Progress
+from backend.app.core.principal import Principal, principal_cache
+from backend.app.core.config import settings
+from backend.app.models.models import User, Progress, RuleStat, PageStat
 from backend.app.schemas.schemas import SettingsUpdate, User as UserSchema
-from typing import List
+from typing import List, Optional
 
 router = APIRouter()
+activity = ActivityTracker(write_behind, User)
 
 @router.get("/me", response_model=UserSchema)
-async def read_users_me(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    # Update Streak Logic
+async def read_users_me(current_user: Principal = Depends(get_current_user)):
+    # Pure read: the streak is kept up to date by activity events (POST /me/activity)
+    return {
+        "id": current_user.id,
+        "username": current_user.username,
+        "mushaf_type": current_user.mushaf_type,
+        "difficulty_level": current_user.difficulty_level,
+        "daily_streak": current_streak(current_user.daily_streak, current_user.last_active_date, date.today()),
+        "last_active_date": current_user.last_active_date,
+    }
+
+@router.post("/me/activity")
+async def record_activity(current_user: Principal = Depends(get_current_user)):
+    # At most one (write-behind) write per user and day, whatever the number of calls
     now = datetime.now()
-    today = now.date()
-    
-    if current_user.last_active_date:
-        last_active = current_user.last_active_date.date()
-        diff = (today - last_active).days
-        
-        if diff == 1:
-            current_user.daily_streak += 1
-            current_user.last_active_date = now
-        elif diff > 1:
-            current_user.daily_streak = 1
-            current_user.last_active_date = now
-        # If diff == 0, streak remains same, but update time? No need.
-    else:
-        current_user.daily_streak = 1
-        current_user.last_active_date = now
-    
-    db.commit()
-    db.refresh(current_user)
-    db.commit()
-    db.refresh(current_user)
-    return current_user
+    activity.record(current_user.id, now)
+    return {"daily_streak": streak_after_activity(current_user.daily_streak, current_user.last_active_date, now.date())}
 
 @router.get("/me/progress")
-def get_user_progress(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_user_progress(current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
     progress_records = db.query(Progress).filter(Progress.user_id == current_user.id).all()
     # Return as a dictionary {page_number: status}
     return {p.page_number: p.status for p in progress_records}
 
+@router.get("/me/progress/snapshot")
+async def get_progress_snapshot(
+    packed: bool = False,
+    if_none_match: Optional[str] = Header(None),
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # ETag = progress version, read fresh (the cached principal may lag a write):
+    # unchanged progress → 304 after one scalar lookup, no progress rows read
+    version = await db.scalar(select(User.progress_version).where(User.id == current_user.id))
+    etag = snapshot_etag(current_user.id, version, packed)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    rows = await db.execute(select(Progress.page_number, Progress.status).where(Progress.user_id == current_user.id))
+    return JSONResponse(build_snapshot(rows.all(), version, packed), headers=headers)
+
 @router.post("/me/progress")
 async def update_user_progress(
     data: dict, 
-    current_user: User = Depends(get_current_user), 
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user), 
+    db: AsyncSession = Depends(get_async_db)
 ):
     page = data.get("page")
     status = data.get("status")
     if page is None or status is None:
         raise HTTPException(status_code=400, detail="Missing page or status")
     
-    record = db.query(Progress).filter(
-        Progress.user_id == current_user.id,
-        Progress.page_number == page
-    ).first()
-    
-    if record:
-        record.status = status
-        record.last_updated = datetime.utcnow()
-    else:
-        record = Progress(user_id=current_user.id, page_number=page, status=status)
-        db.add(record)
-    
-    db.commit()
+    user_id = current_user.id
+    await db.run_sync(lambda session: upsert_progress(session, Progress, user_id, [(page, status)]))
+    await db.commit()
+    activity.record(user_id)
     return {"status": "saved"}
 
+@router.get("/me/stats")
+async def read_user_stats(
+    weak_pages: Optional[int] = None,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Precomputed aggregates (core/rule_stats.py): independent of the number of recordings
+    user_id = current_user.id
+    rules = (await db.execute(select(RuleStat).where(RuleStat.user_id == user_id))).scalars().all()
+    rules = sorted((rule_entry(r) for r in rules), key=lambda r: (r["success_rate"], -r["attempts"]))
+    limit = page_size(weak_pages, settings.STATS_WEAK_PAGES, TOTAL_PAGES)
+    pages = (await db.execute(
+        select(PageStat).where(PageStat.user_id == user_id).order_by(PageStat.score, PageStat.page_number).limit(limit)
+    )).scalars().all()
+    totals = (await db.execute(
+        select(func.count(PageStat.id), func.coalesce(func.sum(PageStat.attempts), 0)).where(PageStat.user_id == user_id)
+    )).one()
+    return {
+        "rules": rules,
+        "weak_pages": [page_entry(p) for p in pages],
+        "pages_recited": totals[0],
+        "recitations": totals[1],
+    }
+
 @router.put("/me/settings")
-async def update_settings(settings: SettingsUpdate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    current_user.mushaf_type = settings.mushaf_type
-    current_user.difficulty_level = settings.difficulty_level
-    db.commit()
-    return {"status": "updated", "mushaf_type": current_user.mushaf_type, "difficulty_level": current_user.difficulty_level}
+async def update_settings(settings: SettingsUpdate, current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    user = await db.get(User, current_user.id)
+    user.mushaf_type = settings.mushaf_type
+    user.difficulty_level = settings.difficulty_level
+    await db.commit()
+    principal_cache.invalidate(user.id)
+    return {"status": "updated", "mushaf_type": user.mushaf_type, "difficulty_level": user.difficulty_level}
 
 @router.delete("/me")
-async def delete_user(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    # Delete progress first
-    db.query(Progress).filter(Progress.user_id == current_user.id).delete()
+async def delete_user(current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    # Delete progress and stats first
+    await db.execute(delete(Progress).where(Progress.user_id == current_user.id))
+    await db.execute(delete(RuleStat).where(RuleStat.user_id == current_user.id))
+    await db.execute(delete(PageStat).where(PageStat.user_id == current_user.id))
     # Delete user
-    db.delete(current_user)
-    db.commit()
+    await db.execute(delete(User).where(User.id == current_user.id))
+    await db.commit()
+    principal_cache.invalidate(current_user.id)
     return {"status": "user deleted"}
 
 @router.get("/all")
-def get_all_users(db: Session = Depends(get_db)):
-    users = db.query(User).all()
+def get_all_users(response: Response, limit: Optional[int] = None, cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    # Keyset pagination on id: the next page's cursor is in X-Next-Cursor
+    size = page_size(limit, settings.USERS_PAGE_SIZE, settings.USERS_MAX_PAGE_SIZE)
+    query = db.query(User.id, User.username)
+    after = users_after(User, cursor)
+    if after is not None:
+        query = query.filter(after)
+    users, next_cursor = split_page(query.order_by(User.id).limit(size + 1).all(), size, lambda u: (u.id,))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     return [{"id": u.id, "username": u.username} for u in users]
 
 @router.delete("/admin/{user_id}")
@@ -96,6 +144,9 @@ def admin_delete_user(user_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="User not found")
     
     db.query(Progress).filter(Progress.user_id == user_id).delete()
+    db.query(RuleStat).filter(RuleStat.user_id == user_id).delete()
+    db.query(PageStat).filter(PageStat.user_id == user_id).delete()
     db.delete(user)
     db.commit()
+    principal_cache.invalidate(user_id)
     return {"status": "user deleted"}
@@ -0,0 +1,92 @@
+"""
+Daily activity events: streak bookkeeping out of the profile read.
+
+GET /users/me used to update daily_streak/last_active_date itself, so a read
+the frontend repeats on every page load was also a write. Streaks are now fed
+by an activity event (POST /users/me/activity, progress writes) recorded at
+most once per user and day:
+
+  - an in-process LRU remembers who was already recorded today, so repeated
+    events cost a dict lookup and no write at all;
+  - the first event of the day enqueues one conditional UPDATE on the
+    write-behind queue. Its WHERE clause only matches a row not yet active
+    today, which keeps it idempotent across restarts and processes. If the
+    write is dropped, the user is forgotten so the next event retries it.
+
+The profile read then derives the streak to display with `current_streak()`
+without writing anything: a streak whose last activity is older than
+yesterday is shown as 0.
+"""
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+
+from sqlalchemy import case, func, or_
+
+from .cache import LRUCache
+from .write_behind import WriteBehindQueue
+
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min)
+
+
+def current_streak(daily_streak: Optional[int], last_active: Optional[datetime], today: date) -> int:
+    """Streak to display: the stored one while it is still alive (active today or yesterday)."""
+    if last_active is None or (today - last_active.date()).days > 1:
+        return 0
+    return daily_streak or 0
+
+
+def streak_after_activity(daily_streak: Optional[int], last_active: Optional[datetime], today: date) -> int:
+    """Streak once today's activity is recorded (same rule as the UPDATE below)."""
+    if last_active is not None and last_active.date() == today:
+        return daily_streak or 0
+    if last_active is not None and (today - last_active.date()).days == 1:
+        return (daily_streak or 0) + 1
+    return 1
+
+
+class ActivityTracker:
+    def __init__(self, queue: WriteBehindQueue, user_model, maxsize: int = 10000):
+        self.queue = queue
+        self.users = user_model.__table__
+        self._recorded = LRUCache(maxsize=maxsize)   # user_id → last day recorded
+        self.events = 0
+        self.writes = 0
+
+    def record(self, user_id: int, now: Optional[datetime] = None) -> bool:
+        """Record that `user_id` was active; returns True when a write was queued."""
+        now = now or datetime.now()
+        today = now.date()
+        self.events += 1
+        if self._recorded.get(user_id) == today:
+            return False
+        self._recorded.put(user_id, today)
+
+        users = self.users
+        today_start = _day_start(today)
+        yesterday_start = today_start - timedelta(days=1)
+        stmt = (
+            users.update()
+            .where(users.c.id == user_id)
+            .where(or_(users.c.last_active_date.is_(None), users.c.last_active_date < today_start))
+            .values(
+                # SET expressions see the old row: yesterday → +1, older or never → 1
+                daily_streak=case(
+                    (users.c.last_active_date >= yesterday_start, func.coalesce(users.c.daily_streak, 0) + 1),
+                    else_=1,
+                ),
+                last_active_date=now,
+            )
+        )
+        self.queue.submit(lambda session: session.execute(stmt), on_failure=lambda e: self._forget(user_id, today))
+        self.writes += 1
+        return True
+
+    def _forget(self, user_id: int, day: date) -> None:
+        # The UPDATE was dropped: let the next event of the day queue it again
+        if self._recorded.get(user_id) == day:
+            self._recorded.pop(user_id)
+
+    def stats(self) -> dict:
+        return {"events": self.events, "writes": self.writes}
@@ -7,18 +7,104 @@ class Settings:
     SECRET_KEY: str = os.getenv("SECRET_KEY", "super_secret_key_for_local_app_only")
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 7  # 1 week
+    # Authenticated principal cache (token → user snapshot), see core/principal.py
+    AUTH_CACHE_TTL: float = float(os.getenv("AUTH_CACHE_TTL", "30"))
+    AUTH_CACHE_SIZE: int = int(os.getenv("AUTH_CACHE_SIZE", "4096"))
+    # Argon2 cost and the bounded executor running it (see core/passwords.py)
+    ARGON2_TIME_COST: int = int(os.getenv("ARGON2_TIME_COST", "3"))
+    ARGON2_MEMORY_COST_KB: int = int(os.getenv("ARGON2_MEMORY_COST_KB", "65536"))
+    ARGON2_PARALLELISM: int = int(os.getenv("ARGON2_PARALLELISM", "2"))
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+    PASSWORD_HASH_MAX_PENDING: int = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+    PASSWORD_HASH_EXECUTOR: str = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")  # "thread" or "process"
 
     # Database
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./quran_app.db")
+    # SQLite profile (applied on every connection) and write-behind queue for non-critical writes
+    SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    SQLITE_MMAP_SIZE: int = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+    SQLITE_CACHE_SIZE_KB: int = int(os.getenv("SQLITE_CACHE_SIZE_KB", "20000"))
+    WRITE_BEHIND_BATCH_SIZE: int = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "50"))
+    WRITE_BEHIND_FLUSH_INTERVAL: float = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "0.5"))
+    # Connection pool (Postgres and SQLite files): pool + overflow cover the sync-route
+    # threadpool plus the write-behind worker; with 2 engines (sync + async) the
+    # defaults stay under Postgres' max_connections=100
+    THREADPOOL_SIZE: int = int(os.getenv("THREADPOOL_SIZE", "40"))
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", str(max(0, THREADPOOL_SIZE + 1 - DB_POOL_SIZE))))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_STATEMENT_TIMEOUT_MS: int = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+    DB_SLOW_QUERY_MS: float = float(os.getenv("DB_SLOW_QUERY_MS", "250"))
 
     # AI Config
     OLLAMA_URL: str = os.getenv("OLLAMA_URL", "http://localhost:11434/api/generate")
     OLLAMA_MODEL: str = os.getenv("OLLAMA_MODEL", "llama3.1:8b")
+    OLLAMA_TIMEOUT: float = float(os.getenv("OLLAMA_TIMEOUT", "45"))
+    OLLAMA_MAX_CONCURRENCY: int = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "1"))
+    OLLAMA_QUEUE_TIMEOUT: float = float(os.getenv("OLLAMA_QUEUE_TIMEOUT", "5"))
+    OLLAMA_KEEP_ALIVE: str = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+    OLLAMA_BREAKER_THRESHOLD: int = int(os.getenv("OLLAMA_BREAKER_THRESHOLD", "3"))
+    OLLAMA_BREAKER_RESET: float = float(os.getenv("OLLAMA_BREAKER_RESET", "60"))
+    # Adaptive tiering under load: primary model → light model → template-only feedback.
+    # The light model is opt-in (e.g. "llama3.2:1b", ~1.3 GB pulled at startup); empty: primary → templates
+    OLLAMA_LIGHT_MODEL: str = os.getenv("OLLAMA_LIGHT_MODEL", "")
+    LLM_TIER_TARGET_LATENCY: float = float(os.getenv("LLM_TIER_TARGET_LATENCY", "20"))
+    LLM_TIER_MAX_QUEUE: int = int(os.getenv("LLM_TIER_MAX_QUEUE", "3"))
+    LLM_TIER_RECOVER_RATIO: float = float(os.getenv("LLM_TIER_RECOVER_RATIO", "0.5"))
+    LLM_TIER_MIN_DWELL: float = float(os.getenv("LLM_TIER_MIN_DWELL", "60"))
     RUNNING_IN_DOCKER: bool = os.getenv("RUNNING_IN_DOCKER", "false").lower() == "true"
 
+    # Keyset pagination (see core/pagination.py)
+    HISTORY_PAGE_SIZE: int = int(os.getenv("HISTORY_PAGE_SIZE", "10"))
+    HISTORY_MAX_PAGE_SIZE: int = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "50"))
+    USERS_PAGE_SIZE: int = int(os.getenv("USERS_PAGE_SIZE", "50"))
+    USERS_MAX_PAGE_SIZE: int = int(os.getenv("USERS_MAX_PAGE_SIZE", "200"))
+
+    # Per-user rule / page stats (see core/rule_stats.py)
+    RULE_STATS_ALPHA: float = float(os.getenv("RULE_STATS_ALPHA", "0.2"))  # weight of the newest recitation
+    STATS_WEAK_PAGES: int = int(os.getenv("STATS_WEAK_PAGES", "10"))
+
+    # Recording compaction / retention (see core/maintenance.py); 0 disables a tier
+    RECORDINGS_MAINTENANCE: bool = os.getenv("RECORDINGS_MAINTENANCE", "true").lower() == "true"
+    MAINTENANCE_INTERVAL: float = float(os.getenv("MAINTENANCE_INTERVAL", "1800"))
+    MAINTENANCE_BATCH: int = int(os.getenv("MAINTENANCE_BATCH", "50"))
+    MAINTENANCE_PAUSE: float = float(os.getenv("MAINTENANCE_PAUSE", "0.5"))
+    MAINTENANCE_FFMPEG: str = os.getenv("MAINTENANCE_FFMPEG", "ffmpeg")
+    RECORDINGS_OPUS_AFTER_DAYS: int = int(os.getenv("RECORDINGS_OPUS_AFTER_DAYS", "7"))
+    RECORDINGS_OPUS_BITRATE: str = os.getenv("RECORDINGS_OPUS_BITRATE", "16k")
+    # Destructive tiers, opt-in: they delete users' audio (e.g. 365 days, 200 MB)
+    RECORDINGS_RETENTION_DAYS: int = int(os.getenv("RECORDINGS_RETENTION_DAYS", "0"))
+    RECORDINGS_USER_QUOTA_MB: int = int(os.getenv("RECORDINGS_USER_QUOTA_MB", "0"))
+
+    # File serving (see core/file_responses.py). Behind nginx: "x-accel-redirect" with an
+    # `internal` location at FILE_OFFLOAD_PREFIX aliased to the data dir; Apache: "x-sendfile"
+    FILE_OFFLOAD: str = os.getenv("FILE_OFFLOAD", "").lower()
+    FILE_OFFLOAD_PREFIX: str = os.getenv("FILE_OFFLOAD_PREFIX", "/internal")
+
+    # Page image derivatives (see services/page_images.py): formats in order of preference
+    PAGE_IMAGE_CACHE_DIR: str = os.getenv("PAGE_IMAGE_CACHE_DIR", os.path.join(os.getcwd(), "quran_pages_cache"))
+    PAGE_IMAGE_WIDTHS: tuple = tuple(int(w) for w in os.getenv("PAGE_IMAGE_WIDTHS", "320,480,768,1080").split(",") if w.strip())
+    PAGE_IMAGE_FORMATS: tuple = tuple(f.strip().lower() for f in os.getenv("PAGE_IMAGE_FORMATS", "avif,webp").split(",") if f.strip())
+
+    # Word-matching caches (shared across requests)
+    HEARD_WORDS_CACHE_SIZE: int = int(os.getenv("HEARD_WORDS_CACHE_SIZE", "20000"))
+    SIMILARITY_CACHE_SIZE: int = int(os.getenv("SIMILARITY_CACHE_SIZE", "200000"))
+
     # Paths
     BASE_DIR: str = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     RECORDINGS_DIR: str = os.path.join(os.getcwd(), "recordings")
+    # Local copy of the Mushaf text (built once from the AlQuran API) for passage detection
+    QURAN_TEXT_PATH: str = os.getenv("QURAN_TEXT_PATH", os.path.join(os.getcwd(), "quran_text.json"))
+    PASSAGE_MIN_SCORE: float = float(os.getenv("PASSAGE_MIN_SCORE", "0.30"))
+    # Matched n-grams required as well: a 3-word transcript matching one n-gram scores 1.0
+    PASSAGE_MIN_MATCHES: int = int(os.getenv("PASSAGE_MIN_MATCHES", "4"))
+    # Persistent AI feedback cache (page, level, similarity bucket, missing words)
+    FEEDBACK_CACHE_PATH: str = os.getenv("FEEDBACK_CACHE_PATH", os.path.join(os.getcwd(), "feedback_cache.db"))
+    FEEDBACK_CACHE_MAX_ENTRIES: int = int(os.getenv("FEEDBACK_CACHE_MAX_ENTRIES", "5000"))
+    FEEDBACK_CACHE_TTL: float = float(os.getenv("FEEDBACK_CACHE_TTL", str(30 * 24 * 3600)))
+    # Compact diff-based coaching prompt (estimated tokens, header included)
+    LLM_PROMPT_TOKEN_BUDGET: int = int(os.getenv("LLM_PROMPT_TOKEN_BUDGET", "350"))
     
     # Handle PyInstaller paths
     if getattr(sys, 'frozen', False):
@@ -1,22 +1,49 @@
-from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 from .config import settings
+from .engine_profile import build_async_engine, build_engine
+from .write_behind import WriteBehindQueue
 
 # Database URL
 SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 
-# Create Engine
-is_sqlite = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, 
-    connect_args={"check_same_thread": False} if is_sqlite else {}
-)
+# Create Engine (SQLite pragmas or Postgres pool profile, see engine_profile.py)
+engine = build_engine(SQLALCHEMY_DATABASE_URL)
 
 # SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Non-critical writes (recording inserts, streak updates), committed in batches
+write_behind = WriteBehindQueue(
+    SessionLocal,
+    batch_size=settings.WRITE_BEHIND_BATCH_SIZE,
+    flush_interval=settings.WRITE_BEHIND_FLUSH_INTERVAL,
+)
+
+# Async engine for `async def` routes and the auth dependencies: same database,
+# through aiosqlite / asyncpg, so DB calls there no longer block the event loop.
+# Sync routes keep SessionLocal and run in the threadpool.
+_ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
+
+
+def async_database_url(url: str) -> str:
+    scheme, sep, rest = url.partition("://")
+    return _ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+
+async_engine = build_async_engine(async_database_url(SQLALCHEMY_DATABASE_URL))
+
+# expire_on_commit=False: the current user stays readable after a commit
+# without a lazy (implicit, sync) refresh.
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 # Base class for models
 Base = declarative_base()
 
@@ -27,3 +54,7 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,260 @@
+"""
+Engine profiles: connection settings, pool sizing and DB metrics.
+
+SQLite (desktop build and legacy server) runs with the default rollback
+journal: every commit fsyncs and a writer blocks all readers. The profile
+switches each connection to:
+
+  - journal_mode=WAL       readers no longer block the writer (and vice versa);
+  - synchronous=NORMAL     fsync at checkpoints only; safe with WAL (a crash
+                           can lose the last commits, never corrupt the file);
+  - busy_timeout           wait for the write lock instead of failing with
+                           "database is locked";
+  - mmap_size, cache_size  fewer read syscalls on the progress/history queries;
+  - temp_store=MEMORY      sorts and temp indexes stay off disk.
+
+PostgreSQL (docker-compose) gets a sized pool instead of the defaults:
+
+  - pool_size + max_overflow cover the threadpool running the sync routes
+    (THREADPOOL_SIZE) plus the write-behind worker, so a thread holding a
+    request never queues for a connection; past that, checkout waits at most
+    DB_POOL_TIMEOUT seconds and fails (back-pressure instead of piling up);
+  - pool_pre_ping          a connection killed by a Postgres restart or an idle
+                           timeout is replaced at checkout, not seen by a request;
+  - pool_recycle           connections older than DB_POOL_RECYCLE are reopened;
+  - statement_timeout      set server-side on every session, so a runaway query
+                           is cancelled by Postgres instead of holding a worker.
+
+Every engine built here records pool checkout waits, checkout timeouts, slow
+statements (over DB_SLOW_QUERY_MS) and statement timeouts; `db_metrics()`
+returns them for /api/v1/system/db.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from typing import Dict
+
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+        cursor.execute(f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KB)}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+
+def configure_sqlite(engine: Engine) -> Engine:
+    """Attach the SQLite connection profile to `engine` (no-op for other backends)."""
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", _sqlite_pragmas)
+    return engine
+
+
+def sqlite_connect_args() -> dict:
+    # sqlite3's own lock wait (seconds), aligned with busy_timeout.
+    return {"check_same_thread": False, "timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000}
+
+
+class EngineMetrics:
+    """Pool checkout waits and slow statements of one engine."""
+
+    def __init__(self, name: str, slow_query_ms: float, keep: int = 1000):
+        self.name = name
+        self.slow_query_ms = slow_query_ms
+        self.engine = None
+        self._lock = threading.Lock()
+        self._keep = keep
+        self.reset()
+
+    def reset(self) -> None:
+        self._waits: deque = deque(maxlen=self._keep)
+        self.recent_slow: deque = deque(maxlen=20)
+        self.counters = {"checkouts": 0, "checkout_timeouts": 0, "peak_checked_out": 0, "queries": 0, "slow_queries": 0, "statement_timeouts": 0}
+
+    def checkout(self, wait: float, checked_out: int) -> None:
+        with self._lock:
+            self.counters["checkouts"] += 1
+            self.counters["peak_checked_out"] = max(self.counters["peak_checked_out"], checked_out)
+            self._waits.append(wait)
+
+    def checkout_timeout(self, timeout: float) -> None:
+        with self._lock:
+            self.counters["checkout_timeouts"] += 1
+        logger.warning(f"DB pool '{self.name}' exhausted: checkout timed out after {timeout}s")
+
+    def query(self, elapsed: float, statement: str) -> None:
+        ms = elapsed * 1000
+        with self._lock:
+            self.counters["queries"] += 1
+            if ms < self.slow_query_ms:
+                return
+            self.counters["slow_queries"] += 1
+            self.recent_slow.append({"ms": round(ms, 1), "sql": " ".join(statement.split())[:200]})
+        logger.warning(f"Slow query on '{self.name}' ({ms:.0f} ms): {statement[:200]}")
+
+    def statement_timeout(self) -> None:
+        with self._lock:
+            self.counters["statement_timeouts"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            counters = dict(self.counters)
+            recent = list(self.recent_slow)
+
+        def pct(q):
+            return round(waits[min(len(waits) - 1, int(len(waits) * q))] * 1000, 2) if waits else None
+
+        pool = self.engine.pool if self.engine is not None else None
+        return {
+            **counters,
+            "pool": {
+                "class": type(pool).__name__,
+                "size": pool.size() if hasattr(pool, "size") else None,
+                "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+                "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+            },
+            "checkout_wait_ms": {"p50": pct(0.5), "p95": pct(0.95), "p99": pct(0.99), "max": round(waits[-1] * 1000, 2) if waits else None},
+            "slow_query_ms": self.slow_query_ms,
+            "recent_slow": recent,
+        }
+
+
+_metrics: Dict[str, EngineMetrics] = {}
+
+
+class _TimedPool:
+    # Mixed into the queue pools: time the wait for a free connection (the
+    # queue wait, plus opening a new one when the pool is still growing).
+    metrics: EngineMetrics
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.checkout_timeout(self.timeout())
+            raise
+        self.metrics.checkout(time.perf_counter() - start, self.checkedout())
+        return connection
+
+
+def _timed_pool(base, metrics: EngineMetrics):
+    # One subclass per engine: pool.recreate() (dispose) reuses the class, so
+    # the metrics survive it.
+    return type(f"Timed{base.__name__}", (_TimedPool, base), {"metrics": metrics})
+
+
+def _instrument(engine: Engine, metrics: EngineMetrics) -> None:
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _end(conn, cursor, statement, parameters, context, executemany):
+        metrics.query(time.perf_counter() - conn.info["query_start"].pop(), statement)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+        if "statement timeout" in str(context.original_exception):
+            metrics.statement_timeout()
+
+
+def _backend(url: str):
+    scheme = url.partition("://")[0]
+    backend, _, driver = scheme.partition("+")
+    return backend, driver
+
+
+def engine_options(url: str) -> dict:
+    """create_engine() keyword arguments of the profile for `url` (pool class excluded)."""
+    backend, driver = _backend(url)
+    if backend == "sqlite":
+        options = {"connect_args": sqlite_connect_args()}
+        if ":memory:" not in url and url.rstrip("/") not in ("sqlite:", "sqlite+aiosqlite:"):
+            # File databases: a queue pool, sized like the Postgres one (WAL readers run in parallel).
+            options.update(pool_size=settings.DB_POOL_SIZE, max_overflow=settings.DB_MAX_OVERFLOW, pool_timeout=settings.DB_POOL_TIMEOUT)
+        return options
+
+    options = {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_pre_ping": True,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+    }
+    if backend == "postgresql" and settings.DB_STATEMENT_TIMEOUT_MS:
+        timeout = str(int(settings.DB_STATEMENT_TIMEOUT_MS))
+        if driver == "asyncpg":
+            options["connect_args"] = {"server_settings": {"statement_timeout": timeout}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={timeout}"}
+    return options
+
+
+def _register(name: str) -> EngineMetrics:
+    metrics = EngineMetrics(name, slow_query_ms=settings.DB_SLOW_QUERY_MS)
+    _metrics[name] = metrics
+    return metrics
+
+
+def build_engine(url: str, name: str = "db", **overrides) -> Engine:
+    """Sync engine with the profile of its backend, instrumented as `name`."""
+    options = {**engine_options(url), **overrides}
+    metrics = _register(name)
+    if "pool_size" in options:
+        options.setdefault("poolclass", _timed_pool(QueuePool, metrics))
+    engine = configure_sqlite(create_engine(url, **options))
+    _instrument(engine, metrics)
+    metrics.engine = engine
+    return engine
+
+
+def build_async_engine(url: str, name: str = "async", **overrides) -> AsyncEngine:
+    """Async counterpart of build_engine (aiosqlite / asyncpg URLs)."""
+    options = {**engine_options(url), **overrides}
+    metrics = _register(name)
+    if "pool_size" in options:
+        options.setdefault("poolclass", _timed_pool(AsyncAdaptedQueuePool, metrics))
+    engine = create_async_engine(url, **options)
+    configure_sqlite(engine.sync_engine)
+    _instrument(engine.sync_engine, metrics)
+    metrics.engine = engine.sync_engine
+    return engine
+
+
+def apply_threadpool_budget() -> None:
+    """Cap the threadpool running sync routes at THREADPOOL_SIZE, the budget the pool is sized for.
+
+    Must be called from the event loop (startup event).
+    """
+    import anyio.to_thread
+
+    anyio.to_thread.current_default_thread_limiter().total_tokens = settings.THREADPOOL_SIZE
+
+
+def engine_metrics(name: str) -> EngineMetrics:
+    return _metrics[name]
+
+
+def db_metrics() -> dict:
+    """Pool and query metrics of every engine built by this module."""
+    return {name: metrics.stats() for name, metrics in _metrics.items()}
@@ -0,0 +1,170 @@
+"""
+Cache-friendly, range-capable responses for files served from disk:
+recordings and Mushaf page images.
+
+FileResponse alone sends no validator the server checks, so every view of
+a page re-downloaded the whole JPEG, and recordings were sent with
+`Cache-Control: no-cache`. `serve_file` adds:
+
+  - a strong ETag (content hash): the recording key already is one, other
+    files are hashed once and cached by (path, size, mtime);
+  - If-None-Match → 304 without touching the file;
+  - Range: one `bytes=` range → 206 (If-Range honoured), unsatisfiable →
+    416; multi-range requests get the whole file;
+  - Cache-Control chosen by the caller: page images and content-addressed
+    recordings never change under their URL (`immutable`), so a repeat
+    view costs nothing, or a 304 once the max-age is over.
+
+Server mode behind nginx / Apache: with FILE_OFFLOAD set, the body is not
+sent by Python. The response carries `X-Accel-Redirect: <prefix>/<path>`
+(nginx, `internal` location aliased to the data dir) or
+`X-Sendfile: <absolute path>` (Apache mod_xsendfile, lighttpd), and the
+proxy streams the file and serves the ranges itself. 304s are still
+answered here.
+"""
+import hashlib
+import os
+from dataclasses import dataclass
+from typing import Iterator, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+
+from .cache import LRUCache
+from .config import settings
+from .progress_snapshot import etag_matches
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+PRIVATE_IMMUTABLE = "private, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+CHUNK_SIZE = 64 * 1024
+
+
+@dataclass(frozen=True)
+class FileInfo:
+    path: str
+    size: int
+    mtime_ns: int
+    etag: str
+
+
+def _content_etag(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+class FileIndex:
+    """Size, mtime and ETag of served files, cached by path."""
+
+    def __init__(self, maxsize: int = 4096):
+        self._cache = LRUCache(maxsize)
+
+    def info(self, path: str, etag: Optional[str] = None, revalidate: bool = True) -> Optional[FileInfo]:
+        """
+        FileInfo of `path`, or None if it does not exist. `etag`: known
+        content hash (recording key), otherwise the file is hashed once.
+        `revalidate=False` trusts the cached entry without a stat
+        (immutable files such as page images).
+        """
+        cached = self._cache.get(path)
+        if cached is not None and not revalidate:
+            return cached
+        try:
+            st = os.stat(path)
+        except OSError:
+            self._cache.pop(path)
+            return None
+        if cached is not None and (cached.size, cached.mtime_ns) == (st.st_size, st.st_mtime_ns):
+            return cached
+        info = FileInfo(path, st.st_size, st.st_mtime_ns, etag or _content_etag(path))
+        self._cache.put(path, info)
+        return info
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+file_index = FileIndex()
+
+
+def _byte_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    (start, end inclusive) of a single `bytes=` range; None to send the
+    whole file (absent, malformed or multi-range). Raises ValueError when
+    the range cannot be satisfied.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = (part.strip() for part in spec.partition("-"))
+    if not sep or not (first or last) or (first and not first.isdigit()) or (last and not last.isdigit()):
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        if int(last) == 0 or size == 0:
+            raise ValueError("empty suffix range")
+        return max(0, size - int(last)), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start > end:
+        return None
+    if start >= size:
+        raise ValueError("range starts past the end")
+    return start, min(end, size - 1)
+
+
+def _read_range(path: str, start: int, end: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def serve_file(
+    request: Request,
+    info: FileInfo,
+    media_type: str,
+    cache_control: str,
+    offload_path: Optional[str] = None,
+    extra_headers: Optional[dict] = None,
+) -> Response:
+    """
+    Conditional / partial response for `info`. `offload_path`: path of the
+    file under the proxy's internal location (relative, forward slashes),
+    used when FILE_OFFLOAD is "x-accel-redirect". `extra_headers` (e.g.
+    Vary) are sent on every status, 304 included.
+    """
+    headers = {"ETag": info.etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes", **(extra_headers or {})}
+    if etag_matches(request.headers.get("if-none-match"), info.etag):
+        return Response(status_code=304, headers=headers)
+
+    offload = settings.FILE_OFFLOAD
+    if offload == "x-accel-redirect" and offload_path:
+        headers["X-Accel-Redirect"] = f"{settings.FILE_OFFLOAD_PREFIX.rstrip('/')}/{offload_path.lstrip('/')}"
+        return Response(media_type=media_type, headers=headers)
+    if offload == "x-sendfile":
+        headers["X-Sendfile"] = os.path.abspath(info.path)
+        return Response(media_type=media_type, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() == info.etag):
+        try:
+            byte_range = _byte_range(range_header, info.size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{info.size}"})
+        if byte_range is not None:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{info.size}"
+            headers["Content-Length"] = str(end - start + 1)
+            return StreamingResponse(_read_range(info.path, start, end), status_code=206, media_type=media_type, headers=headers)
+    return FileResponse(info.path, media_type=media_type, headers=headers)
@@ -0,0 +1,412 @@
+"""
+Background maintenance of stored recordings: compaction, retention, quotas
+and garbage collection.
+
+Recordings were kept forever as the browser's original WebM (Opus at
+~64-128 kbit/s, often stereo), and a failed delete could leave a file
+without a row or a row without its file. A low-priority worker thread now
+runs a pass every MAINTENANCE_INTERVAL seconds, in this order:
+
+  1. rows: recordings of deleted users are removed, rows whose file is
+     gone lose their file_path, analyses without a recording are dropped;
+  2. retention (opt-in): audio older than RECORDINGS_RETENTION_DAYS is
+     dropped (file_path = NULL); score, feedback, encoded analysis and
+     stats stay;
+  3. compaction: WebM older than RECORDINGS_OPUS_AFTER_DAYS is transcoded
+     to mono Opus at RECORDINGS_OPUS_BITRATE (voice, ~8x smaller) and
+     stored under its new content key; kept only if smaller;
+  4. quota (opt-in): past RECORDINGS_USER_QUOTA_MB per user (measured after
+     compaction), the audio of the user's oldest recordings is dropped
+     the same way;
+  5. files: shard files no row references, older than ORPHAN_GRACE (an
+     upload whose row is still in the write-behind queue is not an
+     orphan), are deleted.
+
+Combined with content deduplication, recent audio is kept as uploaded and
+older audio shrinks, so disk use grows much more slowly than the number of
+recordings. Retention and quota delete users' audio, so both are off (0)
+unless the operator sets them.
+
+Low priority: the thread lowers its own scheduling priority where the OS
+allows it, ffmpeg runs at idle priority, each pass handles at most
+MAINTENANCE_BATCH items per phase (the quota phase also measures at most
+MAINTENANCE_BATCH users per pass) and sleeps MAINTENANCE_PAUSE between
+transcodes. Resumable: every step is idempotent and driven by the DB and
+the files themselves. The file scan checkpoints the last shard it finished,
+the quota scan the last user it measured, and transcodes that failed are
+remembered so they are not retried on every pass. All three live in
+RECORDINGS_DIR/.maintenance.json.
+
+The model classes are passed in because the FastAPI app and the legacy
+server declare their own (see core/upsert.py).
+"""
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .recording_store import RecordingStore, db_path, is_key, key_of
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = ".maintenance.json"
+ORPHAN_GRACE = 3600
+SHARD_PREFIXES = [f"{i:02x}" for i in range(256)]
+MAX_FAILED = 1000
+
+
+def _lower_thread_priority() -> None:
+    # Linux schedules threads individually: this only affects the worker thread.
+    if sys.platform.startswith("linux") and hasattr(os, "setpriority"):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except OSError:
+            pass
+
+
+def _idle_command(argv: list) -> Tuple[list, dict]:
+    """(argv, Popen kwargs) running `argv` at idle priority."""
+    if os.name == "nt":
+        return argv, {"creationflags": subprocess.IDLE_PRIORITY_CLASS | subprocess.CREATE_NO_WINDOW}
+    # Not preexec_fn: it is unsafe in a multithreaded process (the child can deadlock)
+    nice = shutil.which("nice")
+    return ([nice, "-n", "19", *argv] if nice else argv), {}
+
+
+class RecordingMaintenance:
+    def __init__(
+        self,
+        store: RecordingStore,
+        session_factory: Callable[[], Session],
+        recording_model,
+        user_model,
+        analysis_model=None,
+    ):
+        self.store = store
+        self.session_factory = session_factory
+        self.Recording = recording_model
+        self.User = user_model
+        self.Analysis = analysis_model
+        self.state_path = os.path.join(store.root, STATE_FILE)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.counters = defaultdict(int)
+        self.last_pass: Optional[str] = None
+        self.last_error: Optional[str] = None
+
+    # ── Lifecycle ─────────────────────────────────────────────────────────────
+
+    def start(self) -> None:
+        if self._thread is not None or not settings.RECORDINGS_MAINTENANCE:
+            return
+        self._thread = threading.Thread(target=self._run, name="recording-maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        _lower_thread_priority()
+        # Let startup (Whisper, Ollama, index) settle first
+        if self._stop.wait(min(60.0, settings.MAINTENANCE_INTERVAL)):
+            return
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                self.last_error = repr(e)
+                logger.exception("Recording maintenance pass failed")
+            self._stop.wait(settings.MAINTENANCE_INTERVAL)
+
+    def run_once(self) -> dict:
+        """One bounded pass over every phase; safe to interrupt and call again."""
+        with self._lock:
+            state = self._load_state()
+            done = {}
+            for name, phase in (
+                ("rows", self._collect_rows),
+                ("retention", self._apply_retention),
+                ("compaction", self._compact),
+                ("quota", self._apply_quotas),
+                ("files", self._collect_files),
+            ):
+                if self._stop.is_set():
+                    break
+                done[name] = phase(state)
+                self._save_state(state)
+            self.last_pass = datetime.utcnow().isoformat()
+            for name, count in done.items():
+                self.counters[name] += count
+            return done
+
+    # ── State ─────────────────────────────────────────────────────────────────
+
+    def _load_state(self) -> dict:
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        state.setdefault("shard", 0)
+        state.setdefault("failed", [])
+        return state
+
+    def _save_state(self, state: dict) -> None:
+        os.makedirs(self.store.root, exist_ok=True)
+        temp = self.state_path + ".tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(temp, self.state_path)
+
+    # ── Helpers ───────────────────────────────────────────────────────────────
+
+    def _release(self, db: Session, keys) -> int:
+        """
+        Delete the files of `keys` that no row references any more (after commit).
+        A file touched within ORPHAN_GRACE is kept: a deduplicated upload may
+        point to it from a row still in the write-behind queue. If it really
+        is unreferenced, the files phase collects it once the grace is over.
+        """
+        removed = 0
+        cutoff = time.time() - ORPHAN_GRACE
+        for key in set(keys):
+            if not key:
+                continue
+            still_used = db.query(self.Recording.id).filter(self.Recording.file_path.in_([db_path(key), f"recordings/{key}"])).first()
+            if still_used:
+                continue
+            path = self.store.path(key)
+            try:
+                if path is None or os.path.getmtime(path) > cutoff:
+                    continue
+            except OSError:
+                continue
+            if self.store.delete(key):
+                removed += 1
+        return removed
+
+    def _drop_audio(self, db: Session, rows) -> int:
+        keys = [key_of(r.file_path) for r in rows]
+        ids = [r.id for r in rows]
+        if not ids:
+            return 0
+        db.query(self.Recording).filter(self.Recording.id.in_(ids)).update({"file_path": None}, synchronize_session=False)
+        db.commit()
+        self.counters["files_deleted"] += self._release(db, keys)
+        return len(ids)
+
+    # ── Phases ────────────────────────────────────────────────────────────────
+
+    def _collect_rows(self, state: dict) -> int:
+        R = self.Recording
+        batch = settings.MAINTENANCE_BATCH
+        db = self.session_factory()
+        try:
+            fixed = 0
+            # Recordings of users that no longer exist
+            orphans = db.query(R.id, R.file_path).outerjoin(self.User, self.User.id == R.user_id).filter(
+                self.User.id.is_(None)
+            ).limit(batch).all()
+            if orphans:
+                ids = [r.id for r in orphans]
+                if self.Analysis is not None:
+                    db.query(self.Analysis).filter(self.Analysis.recording_id.in_(ids)).delete(synchronize_session=False)
+                db.query(R).filter(R.id.in_(ids)).delete(synchronize_session=False)
+                db.commit()
+                self.counters["files_deleted"] += self._release(db, [key_of(r.file_path) for r in orphans])
+                fixed += len(ids)
+
+            # Rows pointing at a file that is gone
+            missing = []
+            last_id = state.get("rows_cursor", 0)
+            rows = db.query(R.id, R.file_path).filter(R.file_path.isnot(None), R.id > last_id).order_by(R.id).limit(batch * 10).all()
+            for r in rows:
+                key = key_of(r.file_path)
+                if not key or self.store.path(key) is None:
+                    missing.append(r.id)
+            if missing:
+                db.query(R).filter(R.id.in_(missing)).update({"file_path": None}, synchronize_session=False)
+                db.commit()
+                fixed += len(missing)
+            state["rows_cursor"] = rows[-1].id if len(rows) == batch * 10 else 0
+
+            # Analyses left behind by bulk deletes
+            if self.Analysis is not None:
+                dangling = db.query(self.Analysis.recording_id).outerjoin(R, R.id == self.Analysis.recording_id).filter(
+                    R.id.is_(None)
+                ).limit(batch).all()
+                if dangling:
+                    db.query(self.Analysis).filter(
+                        self.Analysis.recording_id.in_([d.recording_id for d in dangling])
+                    ).delete(synchronize_session=False)
+                    db.commit()
+                    fixed += len(dangling)
+            return fixed
+        finally:
+            db.close()
+
+    def _apply_retention(self, state: dict) -> int:
+        days = settings.RECORDINGS_RETENTION_DAYS
+        if days <= 0:
+            return 0
+        R = self.Recording
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        db = self.session_factory()
+        try:
+            rows = db.query(R.id, R.file_path).filter(
+                R.file_path.isnot(None), R.timestamp < cutoff
+            ).order_by(R.timestamp).limit(settings.MAINTENANCE_BATCH).all()
+            return self._drop_audio(db, rows)
+        finally:
+            db.close()
+
+    def _apply_quotas(self, state: dict) -> int:
+        """Drop audio past the quota, for at most MAINTENANCE_BATCH users per pass (keyset cursor)."""
+        quota = settings.RECORDINGS_USER_QUOTA_MB * 1024 * 1024
+        if quota <= 0:
+            return 0
+        R = self.Recording
+        batch = settings.MAINTENANCE_BATCH
+        db = self.session_factory()
+        try:
+            users = [u for (u,) in db.query(R.user_id).filter(
+                R.file_path.isnot(None), R.user_id > state.get("quota_user", 0)
+            ).distinct().order_by(R.user_id).limit(batch).all()]
+            over = []
+            for user_id in users:
+                room = batch - len(over)
+                rows = self._over_quota(db, user_id, quota, room)
+                over += rows
+                if len(rows) >= room or self._stop.is_set():
+                    break   # this user may have more: start from it next pass
+                state["quota_user"] = user_id
+            else:
+                if len(users) < batch:
+                    state["quota_user"] = 0   # every user seen: start over next pass
+            return self._drop_audio(db, over)
+        finally:
+            db.close()
+
+    def _over_quota(self, db: Session, user_id: int, quota: int, limit: int) -> list:
+        """Rows of `user_id` past `quota` bytes, oldest audio first to go (at most `limit`)."""
+        R = self.Recording
+        over, used, seen = [], 0, set()
+        # Newest first: what is past the quota is the oldest audio of the user
+        rows = db.query(R.id, R.file_path).filter(R.user_id == user_id, R.file_path.isnot(None)).order_by(
+            R.timestamp.desc(), R.id.desc()
+        ).all()
+        for r in rows:
+            key = key_of(r.file_path)
+            if key not in seen:
+                seen.add(key)
+                path = self.store.path(key)
+                used += os.path.getsize(path) if path else 0
+            if used > quota:
+                over.append(r)
+                if len(over) >= limit:
+                    break
+        return over
+
+    def _compact(self, state: dict) -> int:
+        days = settings.RECORDINGS_OPUS_AFTER_DAYS
+        ffmpeg = shutil.which(settings.MAINTENANCE_FFMPEG)
+        if days <= 0 or not ffmpeg:
+            return 0
+        R = self.Recording
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        failed = set(state["failed"])
+        db = self.session_factory()
+        try:
+            paths = [
+                p for (p,) in db.query(R.file_path).filter(
+                    R.file_path.like("%.webm"), R.timestamp < cutoff
+                ).distinct().limit(settings.MAINTENANCE_BATCH + len(failed)).all()
+                if key_of(p) not in failed
+            ][:settings.MAINTENANCE_BATCH]
+            compacted = 0
+            for file_path in paths:
+                if self._stop.is_set():
+                    break
+                key = key_of(file_path)
+                if self._transcode(db, ffmpeg, key, file_path):
+                    compacted += 1
+                else:
+                    state["failed"] = (state["failed"] + [key])[-MAX_FAILED:]
+                time.sleep(settings.MAINTENANCE_PAUSE)
+            return compacted
+        finally:
+            db.close()
+
+    def _transcode(self, db: Session, ffmpeg: str, key: str, file_path: str) -> bool:
+        source = self.store.path(key)
+        if source is None:
+            return False
+        target = self.store.temp_path(".ogg")
+        argv, kwargs = _idle_command(
+            [ffmpeg, "-nostdin", "-y", "-loglevel", "error", "-i", source, "-vn", "-ac", "1",
+             "-c:a", "libopus", "-b:a", settings.RECORDINGS_OPUS_BITRATE, "-application", "voip", target]
+        )
+        try:
+            subprocess.run(argv, check=True, timeout=300, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, **kwargs)
+            before, after = os.path.getsize(source), os.path.getsize(target)
+            if after == 0 or after >= before:
+                os.remove(target)
+                return False
+            stored = self.store.adopt(target, ".ogg")
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.warning(f"Transcode failed for {key}: {e}")
+            if os.path.exists(target):
+                os.remove(target)
+            return False
+        db.query(self.Recording).filter(self.Recording.file_path == file_path).update(
+            {"file_path": stored.db_path}, synchronize_session=False
+        )
+        db.commit()
+        self._release(db, [key])
+        self.counters["bytes_saved"] += before - after
+        return True
+
+    def _collect_files(self, state: dict) -> int:
+        """Delete unreferenced shard files, a slice of shards per pass (checkpointed)."""
+        R = self.Recording
+        db = self.session_factory()
+        try:
+            referenced = {key_of(p) for (p,) in db.query(R.file_path).filter(R.file_path.isnot(None)).yield_per(2000)}
+        finally:
+            db.close()
+        cutoff = time.time() - ORPHAN_GRACE
+        removed = 0
+        per_pass = max(1, len(SHARD_PREFIXES) // 16)
+        index = state["shard"]
+        for prefix in SHARD_PREFIXES[index:index + per_pass]:
+            for key, mtime in list(self.store.keys(prefix)):
+                if key not in referenced and mtime < cutoff and is_key(key):
+                    if self.store.delete(key):
+                        removed += 1
+            index += 1
+            state["shard"] = index % len(SHARD_PREFIXES)
+            if self._stop.is_set():
+                break
+        self.store.purge_temp()
+        self.counters["files_deleted"] += removed
+        return removed
+
+    def stats(self) -> dict:
+        return {
+            "enabled": settings.RECORDINGS_MAINTENANCE,
+            "running": self._thread is not None and self._thread.is_alive(),
+            "last_pass": self.last_pass,
+            "last_error": self.last_error,
+            **self.counters,
+        }
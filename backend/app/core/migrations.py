@@ -0,0 +1,67 @@
+"""
+Schema migrations for existing databases.
+
+`create_all` only creates missing tables. Databases created before a
+column or index was declared on the models never get it. `ensure_schema`
+is idempotent and runs at startup, after `create_all`:
+
+  1. adds the columns used by delta sync (users.progress_version,
+     progress.version) when they are missing;
+  2. removes duplicate progress rows, keeping the most recent one per
+     (user_id, page_number), because the old SELECT-then-INSERT could race;
+  3. creates the unique index that the ON CONFLICT upserts rely on, the
+     (user_id, version) index for delta sync, and the index that serves the
+     keyset-paginated recording history (user_id = ? AND page_number = ?
+     ORDER BY timestamp DESC, id DESC), replacing the older index without id.
+
+The SQL is accepted as-is by both SQLite and PostgreSQL.
+"""
+import logging
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_UNIQUE_INDEX = "uq_progress_user_page"
+PROGRESS_VERSION_INDEX = "ix_progress_user_version"
+RECORDING_HISTORY_INDEX = "ix_recordings_user_page_ts_id"
+_REPLACED_INDEXES = ["ix_recordings_user_page_ts"]
+
+_COLUMNS = [
+    ("users", "progress_version", "INTEGER DEFAULT 0"),
+    ("progress", "version", "INTEGER DEFAULT 0"),
+]
+
+_DEDUPE_PROGRESS = """
+DELETE FROM progress WHERE id NOT IN (
+    SELECT keep_id FROM (
+        SELECT MAX(id) AS keep_id FROM progress GROUP BY user_id, page_number
+    ) AS latest
+)
+"""
+
+
+def ensure_schema(engine: Engine) -> None:
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table, column, ddl in _COLUMNS:
+            existing = {c["name"] for c in inspector.get_columns(table)}
+            if column not in existing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+                logger.info(f"Migration: added {table}.{column}.")
+
+        removed = conn.execute(text(_DEDUPE_PROGRESS)).rowcount
+        if removed and removed > 0:
+            logger.info(f"Migration: removed {removed} duplicate progress row(s).")
+        conn.execute(text(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {PROGRESS_UNIQUE_INDEX} ON progress (user_id, page_number)"
+        ))
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS {PROGRESS_VERSION_INDEX} ON progress (user_id, version)"
+        ))
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS {RECORDING_HISTORY_INDEX} ON recordings (user_id, page_number, timestamp, id)"
+        ))
+        for index in _REPLACED_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {index}"))
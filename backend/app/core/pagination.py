@@ -0,0 +1,83 @@
+"""
+Keyset (cursor) pagination for list endpoints.
+
+OFFSET pagination rescans every skipped row. A keyset page instead starts
+right after the last row the client saw, through an index on the sort key:
+
+  - recording history: ORDER BY timestamp DESC, id DESC, index
+    (user_id, page_number, timestamp, id); the id breaks timestamp ties;
+  - user listing: ORDER BY id, primary key.
+
+Each page fetches `size + 1` rows. The extra row only tells whether a next
+page exists. The next cursor is an opaque URL-safe token built from the
+sort key of the last row returned, and it travels back in the
+X-Next-Cursor response header. The body stays a plain JSON list, so
+existing clients keep working and only see the first page.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def page_size(requested: Optional[int], default: int, maximum: int) -> int:
+    if requested is None:
+        return default
+    return max(1, min(int(requested), maximum))
+
+
+def encode_cursor(*key: Any) -> str:
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in key]
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], arity: int) -> Optional[list]:
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != arity:
+            raise ValueError(cursor)
+        return values
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def history_after(model, cursor: Optional[str]):
+    """WHERE clause for the page after `cursor` in (timestamp DESC, id DESC) order, or None."""
+    key = decode_cursor(cursor, 2)
+    if key is None:
+        return None
+    try:
+        timestamp, last_id = datetime.fromisoformat(key[0]), int(key[1])
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return or_(model.timestamp < timestamp, and_(model.timestamp == timestamp, model.id < last_id))
+
+
+def history_order(model) -> tuple:
+    return (model.timestamp.desc(), model.id.desc())
+
+
+def users_after(model, cursor: Optional[str]):
+    key = decode_cursor(cursor, 1)
+    if key is None:
+        return None
+    try:
+        return model.id > int(key[0])
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def split_page(rows: Sequence, size: int, key) -> Tuple[List, Optional[str]]:
+    """(page rows, next cursor or None) from `size + 1` fetched rows; `key(row)` → sort key tuple."""
+    rows = list(rows)
+    if len(rows) <= size:
+        return rows, None
+    page = rows[:size]
+    return page, encode_cursor(*key(page[-1]))
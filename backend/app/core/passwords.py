@@ -0,0 +1,164 @@
+"""
+Argon2 password hashing on a dedicated, bounded executor.
+
+Argon2 is deliberately expensive: every hash or verify costs
+ARGON2_TIME_COST passes over ARGON2_MEMORY_COST_KB of memory on
+ARGON2_PARALLELISM lanes. Run inline in request handlers, a burst of logins
+took as many threadpool threads and cores as there were requests, and the
+analyses (Whisper, alignment) starved.
+
+All hashing now goes through one executor of PASSWORD_HASH_WORKERS workers,
+so at most workers × parallelism cores are hashing at any time. The default
+"thread" executor is enough because argon2-cffi releases the GIL while it
+hashes; "process" is available with PASSWORD_HASH_EXECUTOR. Callers beyond
+PASSWORD_HASH_MAX_PENDING (running + queued) are refused at once with
+PasswordHasherBusy (HTTP 503 + Retry-After) instead of queueing without bound.
+
+Hashes carry their own parameters, so changing the costs never breaks
+existing accounts. `verify_and_update` returns a new hash when a stored one
+was made with other parameters, and the login route saves it.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from .config import settings
+
+
+def _context(time_cost: int, memory_cost: int, parallelism: int) -> CryptContext:
+    return CryptContext(
+        schemes=["argon2"],
+        deprecated="auto",
+        argon2__rounds=time_cost,
+        argon2__memory_cost=memory_cost,
+        argon2__parallelism=parallelism,
+    )
+
+
+_contexts = {}
+
+
+def _ctx(params: Tuple[int, int, int]) -> CryptContext:
+    # Module-level and keyed by the (picklable) parameters: also works in worker processes.
+    if params not in _contexts:
+        _contexts[params] = _context(*params)
+    return _contexts[params]
+
+
+def _hash(params, password: str) -> str:
+    return _ctx(params).hash(password)
+
+
+def _verify_and_update(params, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    return _ctx(params).verify_and_update(password, hashed)
+
+
+class PasswordHasherBusy(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many concurrent logins, retry shortly",
+            headers={"Retry-After": "1"},
+        )
+
+
+class PasswordHasher:
+    def __init__(self, time_cost: int, memory_cost: int, parallelism: int, workers: int, max_pending: int, kind: str = "thread"):
+        self.params = (time_cost, memory_cost, parallelism)
+        self.workers = workers
+        self.max_pending = max_pending
+        self.kind = kind
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._durations: deque = deque(maxlen=200)
+        self.counters = {"hashed": 0, "verified": 0, "rejected_busy": 0, "rehashed": 0}
+
+    def _pool(self) -> Executor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.kind == "process":
+                        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                    else:
+                        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="argon2")
+        return self._executor
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.counters["rejected_busy"] += 1
+                raise PasswordHasherBusy()
+            self._pending += 1
+        start = time.perf_counter()
+        future = self._pool().submit(fn, self.params, *args)
+
+        def _done(_):
+            with self._lock:
+                self._pending -= 1
+                self._durations.append(time.perf_counter() - start)
+
+        future.add_done_callback(_done)
+        return future
+
+    # Blocking API, for sync routes and helpers already running in the threadpool.
+    def hash(self, password: str) -> str:
+        self.counters["hashed"] += 1
+        return self._submit(_hash, password).result()
+
+    def verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """(valid, new_hash or None): new_hash when `hashed` used other cost parameters."""
+        self.counters["verified"] += 1
+        valid, new_hash = self._submit(_verify_and_update, password, hashed).result()
+        if new_hash:
+            self.counters["rehashed"] += 1
+        return valid, new_hash
+
+    # Async API, for async routes: the event loop never blocks on Argon2.
+    async def hash_async(self, password: str) -> str:
+        self.counters["hashed"] += 1
+        return await asyncio.wrap_future(self._submit(_hash, password))
+
+    async def verify_and_update_async(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        self.counters["verified"] += 1
+        valid, new_hash = await asyncio.wrap_future(self._submit(_verify_and_update, password, hashed))
+        if new_hash:
+            self.counters["rehashed"] += 1
+        return valid, new_hash
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        durations = sorted(self._durations)
+        time_cost, memory_cost, parallelism = self.params
+        return {
+            **self.counters,
+            "executor": self.kind,
+            "workers": self.workers,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "time_cost": time_cost,
+            "memory_cost_kb": memory_cost,
+            "parallelism": parallelism,
+            "p50_ms": round(durations[len(durations) // 2] * 1000, 1) if durations else None,
+            "p99_ms": round(durations[min(len(durations) - 1, int(len(durations) * 0.99))] * 1000, 1) if durations else None,
+        }
+
+
+password_hasher = PasswordHasher(
+    time_cost=settings.ARGON2_TIME_COST,
+    memory_cost=settings.ARGON2_MEMORY_COST_KB,
+    parallelism=settings.ARGON2_PARALLELISM,
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+    kind=settings.PASSWORD_HASH_EXECUTOR,
+)
@@ -0,0 +1,90 @@
+"""
+Short-TTL cache of authenticated principals for the JWT dependencies.
+
+Every authenticated request used to decode its JWT and then look the user up
+by username, so one DB query per request, heartbeats and dashboard calls
+included. The cache maps the raw token to a frozen `Principal` (the user
+columns routes read) for AUTH_CACHE_TTL seconds. A hit skips both
+jwt.decode and the query; the token's own `exp` is still enforced.
+
+Writes that change what a principal carries call `invalidate(user_id)`:
+settings updates, user deletion, admin deletion. Invalidation bumps a
+per-user generation, so entries cached under any token of that user are
+dropped at their next lookup. A global epoch guards the miss path: a
+principal loaded while an invalidation happened is not cached.
+
+Fields written elsewhere in the background (streak, progress version) may be
+up to one TTL stale. Routes that need them exact (the progress snapshot
+ETag) read them from the database.
+"""
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional
+
+from .cache import LRUCache
+from .config import settings
+
+
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    username: str
+    mushaf_type: Optional[str]
+    difficulty_level: Optional[int]
+    daily_streak: Optional[int]
+    last_active_date: Optional[datetime]
+    progress_version: Optional[int]
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(
+            id=user.id,
+            username=user.username,
+            mushaf_type=user.mushaf_type,
+            difficulty_level=user.difficulty_level,
+            daily_streak=user.daily_streak,
+            last_active_date=user.last_active_date,
+            progress_version=user.progress_version,
+        )
+
+
+class PrincipalCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self._entries = LRUCache(maxsize=maxsize, ttl=ttl)   # token → (principal, exp, generation)
+        self._generations: Dict[int, int] = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    @property
+    def epoch(self) -> int:
+        """Read before loading a user from the DB; pass it back to put()."""
+        return self._epoch
+
+    def get(self, token: str) -> Optional[Principal]:
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        principal, exp, generation = entry
+        if (exp is not None and exp <= time.time()) or generation != self._generations.get(principal.id, 0):
+            self._entries.pop(token)
+            return None
+        return principal
+
+    def put(self, token: str, principal: Principal, exp: Optional[float], epoch: int) -> None:
+        with self._lock:
+            if epoch != self._epoch:
+                return   # invalidated while it was being loaded
+            self._entries.put(token, (principal, exp, self._generations.get(principal.id, 0)))
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            self._epoch += 1
+
+    def stats(self) -> dict:
+        return {**self._entries.stats(), "ttl_s": self._entries.ttl}
+
+
+principal_cache = PrincipalCache(maxsize=settings.AUTH_CACHE_SIZE, ttl=settings.AUTH_CACHE_TTL)
@@ -0,0 +1,110 @@
+"""
+Compact progress snapshot for the building view, with a version ETag.
+
+GET /users/me/progress returns a dict of up to 604 "page": "status" strings
+built from full ORM rows, and the dashboard recounts it on every load. The
+snapshot is one small document instead:
+
+    {
+      "version": 42,                      # users.progress_version (sync cursor)
+      "slots": "0013...",                 # 604 chars, slot i = page i+1, STATUS_CODES
+      "totals": {"mastered": 12, ...},
+      "fields": ["mastered", "revise", "started"],
+      "juz": [[m, r, s], ...],            # 31 floors of the building (see JUZ_RANGES)
+      "surah": [[m, r, s], ...],          # 114 surahs (see SURAH_RANGES)
+    }
+
+With `packed`, "slots" is replaced by "packed": the same codes at 2 bits
+per page (4 pages per byte, page 1 in the low bits), base64: 204 chars.
+
+The ETag is derived from the user id and progress version only. Every
+progress write goes through upsert_progress(), which bumps the version, and
+the version is already on the authenticated user row. An unchanged snapshot
+therefore answers 304 without reading a single progress row.
+"""
+import base64
+from typing import Iterable, List, Optional, Tuple
+
+TOTAL_PAGES = 604
+STATUSES = ("locked", "started", "revise", "mastered")
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+AGGREGATE_FIELDS = ("mastered", "revise", "started")
+
+# Floors of the building (BuildingView.tsx): 20 pages each, the roof holds 601-604.
+JUZ_PAGES = 20
+JUZ_RANGES: List[Tuple[int, int]] = [(juz * JUZ_PAGES - JUZ_PAGES + 1, juz * JUZ_PAGES) for juz in range(1, 31)] + [(601, 604)]
+
+# First page of each surah in the Madani mushaf (same table as utils/quranMapping.ts).
+SURAH_START_PAGES = (
+    1, 2, 50, 77, 106, 128, 151, 177, 187, 208, 221, 235, 249, 255, 262, 267, 282, 293, 305, 312,
+    322, 332, 341, 350, 359, 367, 377, 385, 396, 404, 411, 415, 418, 428, 434, 440, 446, 453, 458, 467,
+    477, 483, 489, 496, 499, 502, 507, 511, 515, 518, 520, 523, 526, 528, 531, 534, 537, 542, 545, 549,
+    551, 553, 554, 556, 558, 560, 562, 564, 566, 568, 570, 572, 573, 575, 577, 578, 580, 582, 583, 585,
+    586, 587, 587, 589, 590, 591, 591, 592, 593, 594, 595, 595, 596, 596, 597, 597, 598, 598, 599, 599,
+    600, 600, 601, 601, 601, 602, 602, 602, 603, 603, 603, 604, 604, 604,
+)
+# A surah ends on the page before the next one starts (or on its own start page
+# when several surahs share it).
+SURAH_RANGES: List[Tuple[int, int]] = [
+    (start, max(start, (SURAH_START_PAGES[i + 1] - 1) if i + 1 < len(SURAH_START_PAGES) else TOTAL_PAGES))
+    for i, start in enumerate(SURAH_START_PAGES)
+]
+
+
+def page_slots(rows: Iterable[Tuple[int, str]]) -> bytearray:
+    """(page, status) rows → 604 status codes (unknown statuses count as locked)."""
+    slots = bytearray(TOTAL_PAGES)
+    for page, status in rows:
+        if 1 <= page <= TOTAL_PAGES:
+            slots[page - 1] = STATUS_CODES.get(status, 0)
+    return slots
+
+
+def pack_slots(slots: bytearray) -> str:
+    packed = bytearray((len(slots) + 3) // 4)
+    for i, code in enumerate(slots):
+        packed[i >> 2] |= code << ((i & 3) * 2)
+    return base64.b64encode(bytes(packed)).decode("ascii")
+
+
+def unpack_slots(data: str) -> bytearray:
+    packed = base64.b64decode(data)
+    return bytearray((packed[i >> 2] >> ((i & 3) * 2)) & 3 for i in range(TOTAL_PAGES))
+
+
+def _aggregate(slots: bytearray, ranges: List[Tuple[int, int]]) -> List[List[int]]:
+    codes = [STATUS_CODES[field] for field in AGGREGATE_FIELDS]
+    result = []
+    for start, end in ranges:
+        span = slots[start - 1:end]
+        result.append([span.count(code) for code in codes])
+    return result
+
+
+def build_snapshot(rows: Iterable[Tuple[int, str]], version: Optional[int], packed: bool = False) -> dict:
+    slots = page_slots(rows)
+    snapshot = {"version": version or 0}
+    if packed:
+        snapshot["packed"] = pack_slots(slots)
+    else:
+        snapshot["slots"] = "".join(map(str, slots))
+    snapshot.update(
+        totals={status: slots.count(code) for status, code in STATUS_CODES.items() if code},
+        fields=list(AGGREGATE_FIELDS),
+        juz=_aggregate(slots, JUZ_RANGES),
+        surah=_aggregate(slots, SURAH_RANGES),
+    )
+    return snapshot
+
+
+def snapshot_etag(user_id: int, version: Optional[int], packed: bool = False) -> str:
+    return f'"p{user_id}.{version or 0}{".b" if packed else ""}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check (weak comparison, '*' and lists accepted)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
@@ -0,0 +1,254 @@
+"""
+Content-addressed, sharded storage for uploaded recordings.
+
+Uploads used to land in one flat RECORDINGS_DIR as
+`analysis_p{page}_{YYYYmmdd_HHMMSS}.webm`: lookups slowed down as the
+directory grew, two uploads of the same page in the same second overwrote
+each other, and a crash mid-write left a truncated file under the final
+name.
+
+Each upload is now streamed into RECORDINGS_DIR/.tmp while it is hashed
+(SHA-256), fsynced, then renamed into place with os.replace, which is
+atomic on the same filesystem:
+
+    RECORDINGS_DIR/ab/cd/abcd…<64 hex>.webm
+
+The key (`abcd….webm`, the file name) identifies the content. Two uploads
+with the same bytes get the same key and the second one is discarded
+(deduplication). Several recordings can then share a file, so callers
+delete a file only when no row references it any more.
+
+  - Recording.file_path stores `db_path(key)` = "recordings/ab/cd/<key>";
+    its basename is the key, like the old flat names.
+  - /recordings/<key> resolves through `path(key)`.
+  - Flat names from before (`page_3_20240101_120000.webm`) still resolve
+    from the top level until `migrate_flat()` (or migrate_recordings.py)
+    moves them into shards and rewrites the rows.
+"""
+import hashlib
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import BinaryIO, Callable, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+DB_PREFIX = "recordings"
+TEMP_DIR = ".tmp"
+CHUNK_SIZE = 1024 * 1024
+TEMP_MAX_AGE = 3600   # leftovers of interrupted uploads
+
+MEDIA_TYPES = {".webm": "audio/webm", ".ogg": "audio/ogg", ".opus": "audio/ogg", ".wav": "audio/wav", ".mp3": "audio/mpeg"}
+
+_KEY_RE = re.compile(r"^[0-9a-f]{64}\.[a-z0-9]{1,5}$")
+_FLAT_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+
+
+@dataclass(frozen=True)
+class StoredRecording:
+    key: str
+    path: str
+    size: int
+    deduplicated: bool
+
+    @property
+    def db_path(self) -> str:
+        return db_path(self.key)
+
+    @property
+    def url(self) -> str:
+        return f"/recordings/{self.key}"
+
+
+def is_key(name: str) -> bool:
+    return bool(_KEY_RE.match(name))
+
+
+def shard(key: str) -> str:
+    return os.path.join(key[:2], key[2:4], key)
+
+
+def db_path(key: str) -> str:
+    # Always forward slashes: the value is also used to build URLs
+    return "/".join((DB_PREFIX, key[:2], key[2:4], key)) if is_key(key) else f"{DB_PREFIX}/{key}"
+
+
+def media_type(key: str) -> str:
+    return MEDIA_TYPES.get(os.path.splitext(key)[1].lower(), "application/octet-stream")
+
+
+def key_etag(key: str) -> Optional[str]:
+    """Strong ETag of a sharded key (its content hash); None for flat names."""
+    return f'"{key[:64]}"' if is_key(key) else None
+
+
+def key_of(file_path: Optional[str]) -> Optional[str]:
+    """Key (file name) of a Recording.file_path, sharded or flat."""
+    return os.path.basename(file_path.replace("\\", "/")) if file_path else None
+
+
+class RecordingStore:
+    def __init__(self, root: str):
+        self.root = root
+        self.temp_dir = os.path.join(root, TEMP_DIR)
+
+    def path(self, key: str) -> Optional[str]:
+        """Absolute path of an existing recording, or None. Rejects anything that is not a plain key/name."""
+        if is_key(key):
+            path = os.path.join(self.root, shard(key))
+        elif _FLAT_RE.match(key):
+            path = os.path.join(self.root, key)   # not migrated yet
+        else:
+            return None
+        return path if os.path.isfile(path) else None
+
+    def save(self, fileobj: BinaryIO, suffix: str = ".webm") -> StoredRecording:
+        """Stream `fileobj` to a temp file while hashing it, then rename it to its content key."""
+        digest = hashlib.sha256()
+        size = 0
+        os.makedirs(self.temp_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.temp_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    chunk = fileobj.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+                out.flush()
+                os.fsync(out.fileno())
+            return self._commit(temp_path, digest.hexdigest() + suffix.lower(), size)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def adopt(self, temp_path: str, suffix: str) -> StoredRecording:
+        """Hash a finished file from `temp_dir` (e.g. a transcode) and rename it to its key."""
+        digest = hashlib.sha256()
+        with open(temp_path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return self._commit(temp_path, digest.hexdigest() + suffix.lower(), os.path.getsize(temp_path))
+
+    def temp_path(self, suffix: str = ".part") -> str:
+        os.makedirs(self.temp_dir, exist_ok=True)
+        fd, path = tempfile.mkstemp(dir=self.temp_dir, suffix=suffix)
+        os.close(fd)
+        return path
+
+    def keys(self, prefix: str):
+        """Keys stored under the top-level shard `prefix` (two hex digits), with their mtime."""
+        top = os.path.join(self.root, prefix)
+        if not os.path.isdir(top):
+            return
+        for sub in os.scandir(top):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.is_file() and is_key(entry.name):
+                    yield entry.name, entry.stat().st_mtime
+
+    def _commit(self, temp_path: str, key: str, size: int) -> StoredRecording:
+        final_path = os.path.join(self.root, shard(key))
+        if os.path.exists(final_path):
+            try:
+                # Fresh mtime: the row of this upload may still be in the write-behind
+                # queue, and the maintenance grace period is measured from the mtime
+                os.utime(final_path)
+                os.remove(temp_path)
+                return StoredRecording(key, final_path, size, deduplicated=True)
+            except FileNotFoundError:
+                pass   # collected in the meantime: store this copy instead
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(temp_path, final_path)
+        return StoredRecording(key, final_path, size, deduplicated=False)
+
+    def delete(self, key: str) -> bool:
+        path = self.path(key)
+        if path is None:
+            return False
+        os.remove(path)
+        return True
+
+    def purge_temp(self, max_age: float = TEMP_MAX_AGE) -> int:
+        """Remove temp files left by interrupted uploads."""
+        removed = 0
+        if not os.path.isdir(self.temp_dir):
+            return removed
+        cutoff = time.time() - max_age
+        for entry in os.scandir(self.temp_dir):
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        return removed
+
+    def migrate_flat(self, session_factory: Callable[[], Session], model) -> dict:
+        """
+        Move top-level (pre-sharding) files into shards and point their rows
+        at the new path. Resumable: each file is hard-linked into its shard,
+        its rows (matched by file name, whatever directory prefix they
+        store) are committed, and only then is the flat name removed, if no
+        row references it any more. An interruption at any step leaves every
+        row resolvable.
+        """
+        counts = {"moved": 0, "deduplicated": 0, "rows": 0, "kept": 0}
+        names = [e.name for e in os.scandir(self.root) if e.is_file() and _FLAT_RE.match(e.name) and not is_key(e.name)]
+        db = session_factory()
+        try:
+            for name in names:
+                source = os.path.join(self.root, name)
+                digest = hashlib.sha256()
+                with open(source, "rb") as f:
+                    for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                        digest.update(chunk)
+                key = digest.hexdigest() + os.path.splitext(name)[1].lower()
+                if not is_key(key):
+                    continue   # no usable extension: left where it is, still served flat
+                final_path = os.path.join(self.root, shard(key))
+                if os.path.exists(final_path):
+                    counts["deduplicated"] += 1
+                else:
+                    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                    try:
+                        os.link(source, final_path)
+                    except OSError:
+                        # No hard links (FAT, some network shares): copy, then rename atomically
+                        temp_path = self.temp_path()
+                        shutil.copy2(source, temp_path)
+                        os.replace(temp_path, final_path)
+                    counts["moved"] += 1
+                # Rows may hold "recordings/<name>", a backslash variant, the bare
+                # name or an absolute path: match on the file name
+                refers = or_(
+                    model.file_path == name,
+                    model.file_path.endswith(f"/{name}", autoescape=True),
+                    model.file_path.endswith(f"\\{name}", autoescape=True),
+                )
+                counts["rows"] += db.query(model).filter(refers).update(
+                    {"file_path": db_path(key)}, synchronize_session=False
+                )
+                db.commit()
+                if db.query(model.id).filter(refers).first() is None:
+                    os.remove(source)
+                else:
+                    counts["kept"] += 1   # still referenced (written meanwhile): next run
+        finally:
+            db.close()
+        if names:
+            logger.info(f"Recordings migrated to shards: {counts}")
+        return counts
+
+
+recording_store = RecordingStore(settings.RECORDINGS_DIR)
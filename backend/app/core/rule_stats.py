@@ -0,0 +1,165 @@
+"""
+Incrementally maintained per-user Tajweed statistics.
+
+"Which rules and pages do I fail most?" used to mean scanning every
+recording of a user. Two small aggregate tables are updated instead, in
+the same write-behind job that inserts the recording:
+
+  - rule_stats, one row per (user_id, rule, subtype): rules checked,
+    rules applied correctly, and a rolling confidence (/analyze only);
+  - page_stats, one row per (user_id, page_number): recitations, words
+    checked and words valid (/analyze only), a rolling score and the best
+    score.
+
+Each update is one INSERT ... ON CONFLICT DO UPDATE per table, as in
+core/upsert.py. Counters are added; rolling values are exponential moving
+averages over recitations, where the newest sample weighs RULE_STATS_ALPHA.
+An analysis that checks a rule several times counts as one sample: its
+mean confidence.
+
+The stats endpoint reads at most one row per rule and one row per visited
+page of a user, however many recordings exist. Deleting a recording does
+not rewind the averages. `backfill_stats.py` rebuilds both tables from the
+recordings and their encoded analyses.
+
+Model classes are passed in, like in core/upsert.py.
+"""
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import case
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from .config import settings
+
+_DIALECT_INSERT = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+RULE_KEYS = ("user_id", "rule", "subtype")
+PAGE_KEYS = ("user_id", "page_number")
+
+
+def rule_samples(analysis_words: Iterable[dict]) -> Dict[Tuple[str, str], Tuple[int, int, float]]:
+    """(rule, subtype) → (checks, correct, mean confidence) for one analysis."""
+    confidences: Dict[Tuple[str, str], List[float]] = defaultdict(list)
+    correct: Dict[Tuple[str, str], int] = defaultdict(int)
+    for word in analysis_words:
+        for rule in word.get("tajweed_rules") or []:
+            key = (rule.get("rule", ""), rule.get("subtype", ""))
+            confidences[key].append(float(rule.get("confidence") or 0.0))
+            if rule.get("status") == "correct":
+                correct[key] += 1
+    return {key: (len(c), correct[key], sum(c) / len(c)) for key, c in confidences.items()}
+
+
+def _accumulate(
+    db: Session,
+    model,
+    keys: Sequence[str],
+    rows: List[dict],
+    sums: Sequence[str] = (),
+    rolling: Sequence[str] = (),
+    maxima: Sequence[str] = (),
+) -> None:
+    """Insert `rows`, or fold them into the existing ones: add `sums`, average `rolling`, keep the max of `maxima`."""
+    if not rows:
+        return
+    alpha = settings.RULE_STATS_ALPHA
+    insert = _DIALECT_INSERT.get(db.get_bind().dialect.name)
+    if insert is None:
+        # Other backends: portable read-then-write fallback.
+        for row in rows:
+            record = db.query(model).filter_by(**{k: row[k] for k in keys}).first()
+            if record is None:
+                db.add(model(**row))
+                continue
+            for column in sums:
+                setattr(record, column, (getattr(record, column) or 0) + row[column])
+            for column in rolling:
+                current = getattr(record, column) or 0.0
+                setattr(record, column, current + alpha * (row[column] - current))
+            for column in maxima:
+                setattr(record, column, max(getattr(record, column) or 0, row[column]))
+            record.last_updated = row["last_updated"]
+        return
+
+    table = model.__table__
+    stmt = insert(table).values(rows)
+    excluded = stmt.excluded
+    set_ = {"last_updated": excluded.last_updated}
+    for column in sums:
+        set_[column] = table.c[column] + excluded[column]
+    for column in rolling:
+        set_[column] = table.c[column] + alpha * (excluded[column] - table.c[column])
+    for column in maxima:
+        # CASE rather than GREATEST / MAX(a, b): same SQL on SQLite and PostgreSQL
+        set_[column] = case((excluded[column] > table.c[column], excluded[column]), else_=table.c[column])
+    db.execute(stmt.on_conflict_do_update(index_elements=list(keys), set_=set_))
+
+
+def record_recitation(
+    db: Session,
+    rule_model,
+    page_model,
+    user_id: int,
+    page: int,
+    score: int,
+    analysis_words: Optional[List[dict]] = None,
+    when: Optional[datetime] = None,
+) -> None:
+    """
+    Fold one recitation into the user's stats. Does not commit.
+
+    `analysis_words` (from /analyze) feeds the rule stats and the word
+    counts; without it (/validate) only the page score is counted.
+    """
+    when = when or datetime.utcnow()
+    words = analysis_words or []
+    score = int(score or 0)
+    _accumulate(
+        db, page_model, PAGE_KEYS,
+        [{
+            "user_id": user_id, "page_number": page, "attempts": 1,
+            "word_attempts": len(words), "word_successes": sum(1 for w in words if w.get("valid")),
+            "score": float(score), "best_score": score, "last_updated": when,
+        }],
+        sums=("attempts", "word_attempts", "word_successes"), rolling=("score",), maxima=("best_score",),
+    )
+    _accumulate(
+        db, rule_model, RULE_KEYS,
+        [
+            {"user_id": user_id, "rule": rule, "subtype": subtype, "attempts": checks,
+             "successes": correct, "confidence": confidence, "last_updated": when}
+            for (rule, subtype), (checks, correct, confidence) in rule_samples(words).items()
+        ],
+        sums=("attempts", "successes"), rolling=("confidence",),
+    )
+
+
+def _rate(successes: int, attempts: int) -> Optional[float]:
+    return round(successes / attempts, 3) if attempts else None
+
+
+def rule_entry(row) -> dict:
+    return {
+        "rule": row.rule,
+        "subtype": row.subtype,
+        "attempts": row.attempts,
+        "successes": row.successes,
+        "success_rate": _rate(row.successes, row.attempts),
+        "confidence": round(row.confidence or 0.0, 3),
+    }
+
+
+def page_entry(row) -> dict:
+    return {
+        "page": row.page_number,
+        "attempts": row.attempts,
+        "word_attempts": row.word_attempts,
+        "word_successes": row.word_successes,
+        "word_success_rate": _rate(row.word_successes, row.word_attempts),
+        "score": round(row.score or 0.0, 1),
+        "best_score": row.best_score,
+        "last_attempt": row.last_updated.isoformat() if row.last_updated else None,
+    }
@@ -0,0 +1,237 @@
+"""
+In-memory manifest of the frontend's static export, with precompressed
+variants.
+
+`serve_spa` used to re-resolve the static directory and probe the
+filesystem (exists, isfile) on every request, then send each file
+uncompressed with no validator the server checked. The export is small
+(~2 MB, a few dozen files) and only changes when the updater installs a
+new frontend, so it is now read once into a `StaticManifest`:
+
+  - every file's bytes, a gzip variant and, if the `brotli` package is
+    installed, a brotli variant (text types only, and only when smaller);
+  - a content-hash ETag per representation; If-None-Match → 304;
+  - `_next/static/` assets carry a build hash in their name and never
+    change under their URL: `immutable`. Everything else (index.html,
+    RSC payloads) is `no-cache`, so it is revalidated with the ETag and a
+    new frontend shows up on the next load;
+  - files over MAX_IN_MEMORY stay on disk and are served by FileResponse.
+
+`static_site.reload()` builds a complete new manifest, then replaces the
+reference in one assignment: a request sees either the old frontend or
+the new one, never a half-extracted directory. The updater calls it after
+installing a frontend. If no frontend was found, the directory is looked
+up again at most every RETRY_MISSING seconds.
+"""
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+
+from .config import settings
+from .progress_snapshot import etag_matches
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+IMMUTABLE_PREFIX = "_next/static/"
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+MAX_IN_MEMORY = 2 * 1024 * 1024
+MIN_COMPRESS = 512
+RETRY_MISSING = 5.0
+
+# Explicit types: on Windows, mimetypes reads the registry, which often maps .js to text/plain
+_MEDIA_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".js": "application/javascript",
+    ".mjs": "application/javascript",
+    ".css": "text/css",
+    ".json": "application/json",
+    ".txt": "text/plain; charset=utf-8",
+    ".svg": "image/svg+xml",
+    ".ico": "image/x-icon",
+    ".woff": "font/woff",
+    ".woff2": "font/woff2",
+    ".webmanifest": "application/manifest+json",
+    ".map": "application/json",
+}
+_COMPRESSIBLE = {".html", ".js", ".mjs", ".css", ".json", ".txt", ".svg", ".ico", ".webmanifest", ".map", ".xml"}
+
+# ---------------------------------------------------------------------------
+# Static directory resolution — prefer EXE_DIR/static/ (updated by updater)
+# over the bundled _MEIPASS/static/ (original build).
+# ---------------------------------------------------------------------------
+_FROZEN = getattr(sys, 'frozen', False)
+_EXE_DIR = os.path.dirname(sys.executable) if _FROZEN else os.getcwd()
+EXT_STATIC = os.path.join(_EXE_DIR, 'static')
+_MEIPASS_STATIC = os.path.join(getattr(sys, '_MEIPASS', ''), 'static')
+
+
+def resolve_static_dir() -> str:
+    """Return the active static directory."""
+    if os.path.exists(EXT_STATIC):
+        return EXT_STATIC
+    return _MEIPASS_STATIC if _FROZEN else settings.STATIC_DIR
+
+
+@dataclass(frozen=True)
+class StaticAsset:
+    path: str
+    media_type: str
+    etag: str
+    cache_control: str
+    body: Optional[bytes]            # None: larger than MAX_IN_MEMORY, served from disk
+    gzip: Optional[bytes] = None
+    br: Optional[bytes] = None
+
+
+def _media_type(name: str) -> str:
+    ext = os.path.splitext(name)[1].lower()
+    return _MEDIA_TYPES.get(ext) or mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+
+def _load_asset(path: str, rel: str) -> StaticAsset:
+    cache_control = IMMUTABLE if rel.startswith(IMMUTABLE_PREFIX) else REVALIDATE
+    digest = hashlib.sha256()
+    if os.path.getsize(path) > MAX_IN_MEMORY:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return StaticAsset(path, _media_type(rel), f'"{digest.hexdigest()[:32]}"', cache_control, None)
+    with open(path, "rb") as f:
+        body = f.read()
+    digest.update(body)
+    gz = br = None
+    if os.path.splitext(rel)[1].lower() in _COMPRESSIBLE and len(body) >= MIN_COMPRESS:
+        gz = gzip.compress(body, compresslevel=9, mtime=0)
+        gz = gz if len(gz) < len(body) else None
+        if BROTLI_AVAILABLE:
+            br = brotli.compress(body, quality=11)
+            br = br if len(br) < len(body) else None
+    return StaticAsset(path, _media_type(rel), f'"{digest.hexdigest()[:32]}"', cache_control, body, gz, br)
+
+
+class StaticManifest:
+    def __init__(self, root: str, assets: Dict[str, StaticAsset]):
+        self.root = root
+        self.assets = assets
+        self.index = assets.get("index.html")
+        self.built_at = time.time()
+
+    @classmethod
+    def build(cls, root: str) -> "StaticManifest":
+        assets: Dict[str, StaticAsset] = {}
+        if os.path.isdir(root):
+            for dirpath, _, filenames in os.walk(root):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    rel = os.path.relpath(path, root).replace(os.sep, "/")
+                    try:
+                        assets[rel] = _load_asset(path, rel)
+                    except OSError as e:
+                        logger.warning(f"Static asset skipped: {rel} ({e})")
+        return cls(root, assets)
+
+    def stats(self) -> dict:
+        in_memory = [a for a in self.assets.values() if a.body is not None]
+        return {
+            "root": self.root,
+            "files": len(self.assets),
+            "bytes": sum(len(a.body) for a in in_memory),
+            "gzip_bytes": sum(len(a.gzip or a.body) for a in in_memory),
+            "br_bytes": sum(len(a.br or a.gzip or a.body) for a in in_memory) if BROTLI_AVAILABLE else None,
+            "built_at": self.built_at,
+        }
+
+
+def _accepts(accept_encoding: str, coding: str) -> bool:
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip() == coding:
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+class StaticSite:
+    """The active manifest, rebuilt in the background and swapped in one assignment."""
+
+    def __init__(self):
+        self._manifest: Optional[StaticManifest] = None
+        self._lock = threading.Lock()
+        self._last_attempt = 0.0
+
+    def _build(self) -> StaticManifest:
+        root = resolve_static_dir()
+        start = time.perf_counter()
+        manifest = StaticManifest.build(root)
+        self._manifest = manifest
+        self._last_attempt = time.monotonic()
+        if manifest.index is None:
+            logger.warning(f"Static files directory '{root}' not found or empty. Frontend will not be served.")
+        else:
+            logger.info(f"Serving frontend from: {root} ({len(manifest.assets)} files, {time.perf_counter() - start:.2f}s)")
+        return manifest
+
+    def reload(self) -> StaticManifest:
+        """Re-read the active static directory and swap the manifest (after a frontend update)."""
+        with self._lock:
+            return self._build()
+
+    def needs_reload(self) -> bool:
+        manifest = self._manifest
+        return manifest is None or (manifest.index is None and time.monotonic() - self._last_attempt > RETRY_MISSING)
+
+    def current(self) -> StaticManifest:
+        if self.needs_reload():
+            with self._lock:
+                # Another request may have loaded it while this one waited
+                if self.needs_reload():
+                    return self._build()
+        return self._manifest
+
+    def response(self, request: Request, full_path: str) -> Optional[Response]:
+        """Response for `full_path` (index.html for unknown routes), or None without a frontend."""
+        manifest = self.current()
+        asset = manifest.assets.get(full_path.strip("/")) or manifest.index
+        if asset is None:
+            return None
+        headers = {"Cache-Control": asset.cache_control}
+        if asset.body is None:
+            if etag_matches(request.headers.get("if-none-match"), asset.etag):
+                return Response(status_code=304, headers={**headers, "ETag": asset.etag})
+            return FileResponse(asset.path, media_type=asset.media_type, headers={**headers, "ETag": asset.etag})
+
+        body, etag = asset.body, asset.etag
+        if asset.gzip is not None:
+            headers["Vary"] = "Accept-Encoding"
+            accept_encoding = request.headers.get("accept-encoding", "")
+            if asset.br is not None and _accepts(accept_encoding, "br"):
+                body, etag, headers["Content-Encoding"] = asset.br, asset.etag[:-1] + '-br"', "br"
+            elif _accepts(accept_encoding, "gzip"):
+                body, etag, headers["Content-Encoding"] = asset.gzip, asset.etag[:-1] + '-gz"', "gzip"
+        headers["ETag"] = etag
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            headers.pop("Content-Encoding", None)
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type=asset.media_type, headers=headers)
+
+    def stats(self) -> dict:
+        return self._manifest.stats() if self._manifest else {"files": 0}
+
+
+static_site = StaticSite()
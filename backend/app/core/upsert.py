@@ -0,0 +1,122 @@
+"""
+Single-statement progress upserts (INSERT ... ON CONFLICT DO UPDATE) and
+versioned delta reads for progress sync.
+
+Progress rows are unique on (user_id, page_number) (see migrations.py).
+Each write used to SELECT the row and then INSERT or UPDATE it, which took
+two round trips and raced with concurrent writers. Both SQLite (3.24+) and
+PostgreSQL accept the same ON CONFLICT clause, built here through the
+dialect's own `insert()`.
+
+Every write bumps a per-user monotonic counter (users.progress_version) and
+stamps the rows it touches with it. A client that remembers the last
+version it saw (its cursor) can then fetch only the rows changed since,
+through the (user_id, version) index, whatever the size of its progress.
+
+The model class is passed in because the FastAPI app and the legacy server
+declare their own `Progress` on separate metadata.
+"""
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+_DIALECT_INSERT = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+CHUNK_ROWS = 150   # 5 bound parameters per row, under SQLite's default 999-variable limit on old builds
+
+
+def _users_table(model):
+    # The users table declared next to this Progress model (same metadata).
+    return model.metadata.tables["users"]
+
+
+def progress_version(db: Session, model, user_id: int) -> int:
+    """Current progress version (sync cursor) of a user."""
+    users = _users_table(model)
+    return db.execute(select(users.c.progress_version).where(users.c.id == user_id)).scalar() or 0
+
+
+def _next_version(db: Session, model, user_id: int) -> int:
+    # The UPDATE takes the write lock on the user row until commit, so two
+    # concurrent writers of the same user get distinct, increasing versions.
+    users = _users_table(model)
+    db.execute(
+        users.update()
+        .where(users.c.id == user_id)
+        .values(progress_version=func.coalesce(users.c.progress_version, 0) + 1)
+    )
+    return progress_version(db, model, user_id)
+
+
+def upsert_progress(
+    db: Session,
+    model,
+    user_id: int,
+    items: Iterable[Tuple[int, str]],
+    when: Optional[datetime] = None,
+) -> Optional[int]:
+    """
+    Insert or update the (page, status) pairs of one user in one statement
+    (one per CHUNK_ROWS rows). Does not commit.
+
+    Returns:
+        the new progress version stamped on the rows, or None if `items` is empty.
+    """
+    when = when or datetime.utcnow()
+    # Last write wins inside one batch too (ON CONFLICT can't hit the same row twice).
+    rows = {int(page): str(status) for page, status in items}
+    if not rows:
+        return None
+    version = _next_version(db, model, user_id)
+    values = [
+        {"user_id": user_id, "page_number": page, "status": status, "last_updated": when, "version": version}
+        for page, status in rows.items()
+    ]
+
+    insert = _DIALECT_INSERT.get(db.get_bind().dialect.name)
+    if insert is None:
+        # Other backends: portable read-then-write fallback.
+        existing = {
+            p.page_number: p
+            for p in db.query(model).filter(model.user_id == user_id, model.page_number.in_(list(rows)))
+        }
+        for row in values:
+            record = existing.get(row["page_number"])
+            if record:
+                record.status = row["status"]
+                record.last_updated = when
+                record.version = version
+            else:
+                db.add(model(**row))
+        return version
+
+    for start in range(0, len(values), CHUNK_ROWS):
+        stmt = insert(model.__table__).values(values[start:start + CHUNK_ROWS])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "page_number"],
+            set_={
+                "status": stmt.excluded.status,
+                "last_updated": stmt.excluded.last_updated,
+                "version": stmt.excluded.version,
+            },
+        )
+        db.execute(stmt)
+    return version
+
+
+def progress_changes(
+    db: Session,
+    model,
+    user_id: int,
+    since: int,
+    exclude_version: Optional[int] = None,
+) -> List[Tuple[int, str, int]]:
+    """(page, status, version) rows of a user changed after version `since`."""
+    query = select(model.page_number, model.status, model.version).where(
+        model.user_id == user_id, model.version > since
+    )
+    if exclude_version is not None:
+        query = query.where(model.version != exclude_version)
+    return [tuple(row) for row in db.execute(query.order_by(model.version))]
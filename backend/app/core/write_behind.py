@@ -0,0 +1,146 @@
+"""
+Batched write-behind queue for non-critical database writes.
+
+Recording inserts and streak updates do not need to be durable before the
+response is sent. Committing each of them on the request path costs one
+fsync and one round of lock contention per request on SQLite. Instead, the
+request enqueues a small job `fn(session)`. A background thread drains the
+queue and applies up to WRITE_BEHIND_BATCH_SIZE jobs in one transaction,
+waiting at most WRITE_BEHIND_FLUSH_INTERVAL seconds to fill a batch.
+
+Jobs run in FIFO order on a single thread, so a later job can rely on the
+rows written by an earlier one (e.g. update a recording inserted just
+before). If a batch fails, its jobs are replayed one by one so a single bad
+job does not drop the others; a job that still fails is dropped and its
+`on_failure` callback, if any, is called with the exception. `close()`
+drains everything; call it on shutdown.
+"""
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[Session], None]
+FailureCallback = Callable[[Exception], None]
+_STOP = object()
+
+
+class WriteBehindQueue:
+    def __init__(self, session_factory: Callable[[], Session], batch_size: int = 50, flush_interval: float = 0.5, name: str = "db"):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.name = name
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+
+        self.counters = {"submitted": 0, "written": 0, "failed": 0, "batches": 0}
+        self._commit_times: deque = deque(maxlen=200)
+
+    def _ensure_worker(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"write-behind-{self.name}", daemon=True)
+                self._thread.start()
+
+    def submit(self, job: Job, on_failure: Optional[FailureCallback] = None) -> None:
+        """
+        Queue `job(session)`; it is committed with the next batch.
+        `on_failure(exc)` is called (on the worker thread) if the job is dropped.
+        """
+        if self._closed:
+            # Late write after shutdown started: apply it inline rather than lose it.
+            self._apply([(job, on_failure)])
+            return
+        self._ensure_worker()
+        self.counters["submitted"] += 1
+        self._queue.put((job, on_failure))
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is _STOP:
+                return
+            batch = [job]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    job = self._queue.get(timeout=max(0.0, remaining)) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is _STOP:
+                    stop = True
+                    break
+                batch.append(job)
+            self._apply(batch)
+            if stop:
+                return
+
+    def _apply(self, batch: list) -> None:
+        start = time.perf_counter()
+        db = self.session_factory()
+        try:
+            for job, _ in batch:
+                job(db)
+            db.commit()
+            self.counters["written"] += len(batch)
+            self.counters["batches"] += 1
+            self._commit_times.append(time.perf_counter() - start)
+            return
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Write-behind batch of {len(batch)} failed ({e}), retrying one by one")
+        finally:
+            db.close()
+
+        for job, on_failure in batch:
+            db = self.session_factory()
+            try:
+                job(db)
+                db.commit()
+                self.counters["written"] += 1
+            except Exception as e:
+                db.rollback()
+                self.counters["failed"] += 1
+                logger.error(f"Write-behind job dropped: {e}")
+                if on_failure is not None:
+                    try:
+                        on_failure(e)
+                    except Exception:
+                        logger.exception("Write-behind failure callback raised")
+            finally:
+                db.close()
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Flush pending jobs and stop the worker (idempotent)."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logger.error(f"Write-behind '{self.name}' did not drain within {timeout}s")
+        logger.info(f"Write-behind '{self.name}' flushed: {self.stats()}")
+
+    def stats(self) -> dict:
+        commits = sorted(self._commit_times)
+        return {
+            **self.counters,
+            "pending": self._queue.qsize(),
+            "avg_batch": round(self.counters["written"] / self.counters["batches"], 1) if self.counters["batches"] else None,
+            "commit_ms_p50": round(commits[len(commits) // 2] * 1000, 2) if commits else None,
+        }
@@ -1,38 +1,20 @@
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from backend.app.api.api import api_router
 from backend.app.core.config import settings
-from backend.app.core.database import Base, engine
+from backend.app.core.database import Base, SessionLocal, engine
+from backend.app.core.file_responses import PRIVATE_IMMUTABLE, REVALIDATE, file_index, serve_file
+from backend.app.core.maintenance import RecordingMaintenance
+from backend.app.core.migrations import ensure_schema
+from backend.app.core.recording_store import db_path, is_key, key_etag, media_type, recording_store
+from backend.app.core.static_manifest import static_site
+from backend.app.models.models import Recording, RecordingAnalysis, User
 from backend.app.services.feedback import ensure_ollama_ready
 import threading
 import os
-import sys
 import logging
-from fastapi.responses import FileResponse, JSONResponse
-
-# ---------------------------------------------------------------------------
-# Static directory resolution — prefer EXE_DIR/static/ (updated by updater)
-# over the bundled _MEIPASS/static/ (original build).
-#
-# _resolve_static() is called on every request so frontend hot-swap works
-# without restarting the backend process.
-# ---------------------------------------------------------------------------
-_FROZEN = getattr(sys, 'frozen', False)
-_EXE_DIR = os.path.dirname(sys.executable) if _FROZEN else os.getcwd()
-_EXT_STATIC = os.path.join(_EXE_DIR, 'static')
-_MEIPASS_STATIC = os.path.join(getattr(sys, '_MEIPASS', ''), 'static')
-
-
-def _resolve_static() -> str:
-    """Return the active static directory (re-evaluated on each call)."""
-    if os.path.exists(_EXT_STATIC):
-        return _EXT_STATIC
-    return _MEIPASS_STATIC if _FROZEN else settings.STATIC_DIR
-
-
-# Evaluate once at startup for mount and logging (remount not needed — see serve_spa)
-RESOLVED_STATIC = _resolve_static()
+from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
 
 # Configure Logging
 logging.basicConfig(
@@ -44,6 +26,8 @@ logger = logging.getLogger(__name__)
 
 # Create Tables
 Base.metadata.create_all(bind=engine)
+# Columns and indexes added after the first release (delta sync, upserts, history)
+ensure_schema(engine)
 
 app = FastAPI(title=settings.PROJECT_NAME)
 
@@ -53,6 +37,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Middleware: Update Heartbeat on every request
@@ -65,8 +50,16 @@ async def update_heartbeat_middleware(request: Request, call_next):
     response = await call_next(request)
     return response
 
-os.makedirs(settings.RECORDINGS_DIR, exist_ok=True)
-app.mount("/recordings", StaticFiles(directory=settings.RECORDINGS_DIR), name="recordings")
+# Recordings live in content-addressed shards (core/recording_store.py); the URL only carries the key,
+# so a sharded recording never changes under its URL
+@app.get("/recordings/{key}")
+def serve_recording(key: str, request: Request):
+    path = recording_store.path(key)
+    info = file_index.info(path, etag=key_etag(key)) if path else None
+    if info is None:
+        raise HTTPException(status_code=404, detail="Recording not found")
+    cache_control = PRIVATE_IMMUTABLE if is_key(key) else REVALIDATE
+    return serve_file(request, info, media_type(key), cache_control, offload_path=db_path(key))
 
 app.include_router(api_router, prefix="/api/v1")
 
@@ -85,9 +78,23 @@ import webbrowser
 @app.on_event("startup")
 async def startup_event():
     logger.info("Starting Backend...")
+    # Sync routes run in this threadpool; the DB pool is sized for it
+    from backend.app.core.engine_profile import apply_threadpool_budget
+    apply_threadpool_budget()
+    # Read the frontend export into memory (precompressed) without delaying startup
+    threading.Thread(target=static_site.reload, daemon=True).start()
+    # Temp files left by uploads interrupted before their atomic rename
+    recording_store.purge_temp()
+    # Low-priority compaction / retention of stored recordings
+    app.state.recording_maintenance = RecordingMaintenance(recording_store, SessionLocal, Recording, User, RecordingAnalysis)
+    app.state.recording_maintenance.start()
     # Start Ollama check in background
     threading.Thread(target=ensure_ollama_ready, daemon=True).start()
 
+    # Build the Mushaf n-gram index for passage auto-detection
+    from backend.app.services.passage_index import ensure_index
+    threading.Thread(target=ensure_index, daemon=True).start()
+
     # Start Shutdown Monitor
     start_shutdown_monitor()
 
@@ -109,32 +116,33 @@ async def startup_event():
 
     threading.Thread(target=_delayed_update_check, daemon=True).start()
 
-# --- Verify Static Files ---
+@app.on_event("shutdown")
+async def shutdown_event():
+    from backend.app.services.ollama_client import ollama
+    await ollama.aclose()
+    # Flush batched recording inserts / streak updates before exiting
+    from backend.app.core.database import write_behind
+    write_behind.close()
+    app.state.recording_maintenance.stop()
+    from backend.app.core.passwords import password_hasher
+    password_hasher.shutdown()
+
+# --- Static Files ---
 # Note: we intentionally do NOT mount /_next as a StaticFiles route here.
-# All static asset requests are handled by serve_spa() which calls _resolve_static()
-# on every request, enabling seamless frontend hot-swap without process restart.
-if not os.path.exists(RESOLVED_STATIC):
-    logger.warning(f"Static files directory '{RESOLVED_STATIC}' not found. Frontend will not be served.")
-else:
-    logger.info(f"Serving frontend from: {RESOLVED_STATIC}")
-
+# serve_spa() answers from an in-memory manifest (core/static_manifest.py) that the
+# updater swaps after installing a new frontend: hot-swap without process restart.
 @app.get("/{full_path:path}")
-async def serve_spa(full_path: str):
+async def serve_spa(full_path: str, request: Request):
     # API requests are handled by api_router
     if full_path.startswith("api"):
         raise HTTPException(status_code=404, detail="API route not found")
 
-    # Re-evaluate active static dir on every request (enables frontend hot-swap)
-    static_dir = _resolve_static()
-
-    # Serve specific static files if they exist
-    potential_path = os.path.join(static_dir, full_path)
-    if os.path.exists(potential_path) and os.path.isfile(potential_path):
-        return FileResponse(potential_path)
-
-    # Serve index.html for SPA routing
-    index_path = os.path.join(static_dir, "index.html")
-    if os.path.exists(index_path):
-        return FileResponse(index_path)
+    # Not loaded yet (request before the startup load finished): build off the event loop
+    if static_site.needs_reload():
+        await run_in_threadpool(static_site.current)
+    # Exact file, else index.html for SPA routing
+    response = static_site.response(request, full_path)
+    if response is not None:
+        return response
 
     return JSONResponse({"status": "error", "message": "Frontend not found"}, status_code=404)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Index, LargeBinary, Float
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from backend.app.core.database import Base
@@ -13,6 +13,7 @@ class User(Base):
     difficulty_level = Column(Integer, default=1) # 1: Beginner, 2: Intermediate, 3: Expert
     daily_streak = Column(Integer, default=0)
     last_active_date = Column(DateTime, nullable=True)
+    progress_version = Column(Integer, default=0)  # bumped on every progress write (sync cursor)
     
     progress = relationship("Progress", back_populates="user")
     recordings = relationship("Recording", back_populates="user")
@@ -25,9 +26,17 @@ class Progress(Base):
     page_number = Column(Integer, index=True)
     status = Column(String)  # "mastered", "revise", "locked", "started"
     last_updated = Column(DateTime, default=datetime.utcnow)
+    version = Column(Integer, default=0)  # user's progress_version when last written
 
     user = relationship("User", back_populates="progress")
 
+    __table_args__ = (
+        # One row per (user, page): target of the ON CONFLICT upserts
+        Index("uq_progress_user_page", "user_id", "page_number", unique=True),
+        # Delta sync: rows of a user changed since a version
+        Index("ix_progress_user_version", "user_id", "version"),
+    )
+
 class Recording(Base):
     __tablename__ = "recordings"
 
@@ -40,3 +49,47 @@ class Recording(Base):
     feedback = Column(String, nullable=True)   # New field
 
     user = relationship("User", back_populates="recordings")
+    analysis = relationship("RecordingAnalysis", uselist=False, cascade="all, delete-orphan", back_populates="recording")
+
+    # History query: user_id = ? AND page_number = ? ORDER BY timestamp DESC
+    __table_args__ = (Index("ix_recordings_user_page_ts_id", "user_id", "page_number", "timestamp", "id"),)
+
+class RecordingAnalysis(Base):
+    """Word-by-word analysis of a recording, encoded by services/analysis_codec.py."""
+    __tablename__ = "recording_analyses"
+
+    recording_id = Column(Integer, ForeignKey("recordings.id"), primary_key=True)
+    data = Column(LargeBinary)
+
+    recording = relationship("Recording", back_populates="analysis")
+
+class RuleStat(Base):
+    """Per-user aggregate of one Tajweed rule, maintained by core/rule_stats.py."""
+    __tablename__ = "rule_stats"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    rule = Column(String)
+    subtype = Column(String, default="")
+    attempts = Column(Integer, default=0)
+    successes = Column(Integer, default=0)
+    confidence = Column(Float, default=0.0)  # rolling average over recitations
+    last_updated = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (Index("uq_rule_stats_user_rule", "user_id", "rule", "subtype", unique=True),)
+
+class PageStat(Base):
+    """Per-user aggregate of one page, maintained by core/rule_stats.py."""
+    __tablename__ = "page_stats"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    page_number = Column(Integer)
+    attempts = Column(Integer, default=0)
+    word_attempts = Column(Integer, default=0)
+    word_successes = Column(Integer, default=0)
+    score = Column(Float, default=0.0)  # rolling average over recitations
+    best_score = Column(Integer, default=0)
+    last_updated = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (Index("uq_page_stats_user_page", "user_id", "page_number", unique=True),)
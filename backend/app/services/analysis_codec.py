@@ -0,0 +1,243 @@
+"""
+Encodage compact de l'analyse mot-à-mot d'un enregistrement (historique).
+
+`/analyze` produit pour chaque mot attendu : validité, confiance, début/fin
+et les règles Tajwid vérifiées (règle, sous-type, lettre, statut, confiance,
+conseil). En JSON, une page complète pèse plusieurs dizaines de Ko, dont
+l'essentiel est répété (noms de règles, conseils, texte arabe). On ne stocke
+que ce qui ne peut pas être recalculé :
+
+  en-tête  : version, niveau, pages du passage, CRC32 du texte attendu,
+             nombre de mots (entiers en varint) ;
+  par mot  : 1 octet de drapeaux (valide, nombre de règles, début / fin
+             absents), 1 octet de confiance quantifiée (pas de 1/255),
+             début et durée en centièmes de seconde (varint zigzag, delta
+             depuis le mot précédent), omis quand ils valent None ;
+  par règle: 1 octet (règle sur 3 bits, statut sur 1 bit, sous-type sur
+             4 bits), 1 octet de lettre, 1 octet de confiance quantifiée.
+
+Le texte des mots vient du Mushaf (index local, `expected_text_for`) et les
+conseils de `rule_feedback` : rien à stocker. Si le texte ne correspond plus
+au CRC enregistré, les mots sont rendus sans texte plutôt que faux. Une
+règle absente des tables (nouveau détecteur) est stockée en JSON brut
+derrière un code d'échappement : le format reste sans perte.
+
+Une page de ~150 mots tient en 1 à 2 Ko, décodée en quelques millisecondes
+sans relancer Whisper ni l'analyse Tajwid.
+"""
+
+import json
+import zlib
+from typing import List, Optional
+
+from backend.app.services.tajweed_engine import rule_feedback
+
+FORMAT_VERSION = 2   # v1 : pas de drapeaux début / fin absents (None encodé 0.0)
+
+RULES = ("Qalqalah", "Noon Sakinah", "Tanween", "Meem Sakinah", "Ghunnah Mushaddada", "Madd")
+RAW_RULE = 7   # code d'échappement : règle inconnue, JSON brut
+
+SUBTYPES = (
+    "", "Sughra", "Kubra",
+    "Izhar", "Iqlab", "Idgham avec Ghunnah", "Idgham sans Ghunnah", "Ikhfa",
+    "Izhar Shafawi", "Idgham Shafawi", "Ikhfa Shafawi",
+    "Noon", "Meem",
+    "Madd Tabii (2 temps)", "Madd Wajib Muttasil (4-5 temps)", "Madd Jaiz Munfasil (2-4 temps)",
+)
+
+LETTERS = ("", "ق", "ط", "ب", "ج", "د", "ن", "م", "ا", "و", "ي")
+
+WORD_FEEDBACK_INVALID = "Améliorez la précision pour ce niveau."
+
+_RULE_IDS = {name: i for i, name in enumerate(RULES)}
+_SUBTYPE_IDS = {name: i for i, name in enumerate(SUBTYPES)}
+_LETTER_IDS = {name: i for i, name in enumerate(LETTERS)}
+
+_VALID = 0x01
+_RULES_SHIFT = 1
+_RULES_MASK = 0x1F      # 5 bits ; la valeur 31 annonce un varint (nombre de règles >= 31)
+_NO_START = 0x40
+_NO_END = 0x80
+
+
+# ── Primitives ────────────────────────────────────────────────────────────────
+
+def _put_varint(out: bytearray, value: int) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _put_signed(out: bytearray, value: int) -> None:
+    _put_varint(out, (value << 1) ^ (value >> 63))   # zigzag
+
+
+def _quantize(confidence) -> int:
+    return max(0, min(255, round(float(confidence or 0.0) * 255)))
+
+
+def _dequantize(q: int) -> float:
+    return round(q / 255, 3)
+
+
+class _Reader:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def byte(self) -> int:
+        value = self.data[self.pos]
+        self.pos += 1
+        return value
+
+    def varint(self) -> int:
+        value, shift = 0, 0
+        while True:
+            b = self.byte()
+            value |= (b & 0x7F) << shift
+            if b < 0x80:
+                return value
+            shift += 7
+
+    def signed(self) -> int:
+        value = self.varint()
+        return (value >> 1) ^ -(value & 1)
+
+    def raw(self, n: int) -> bytes:
+        chunk = self.data[self.pos:self.pos + n]
+        self.pos += n
+        return chunk
+
+
+def text_checksum(expected_text: str) -> int:
+    return zlib.crc32(expected_text.encode("utf-8"))
+
+
+# ── Encodage ──────────────────────────────────────────────────────────────────
+
+def _encode_rule(out: bytearray, rule: dict) -> None:
+    rule_id = _RULE_IDS.get(rule.get("rule"))
+    subtype_id = _SUBTYPE_IDS.get(rule.get("subtype", ""))
+    letter_id = _LETTER_IDS.get(rule.get("letter", ""))
+    correct = rule.get("status") == "correct"
+    if rule_id is None or subtype_id is None or letter_id is None:
+        payload = json.dumps(rule, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        out.append(RAW_RULE << 5)
+        _put_varint(out, len(payload))
+        out += payload
+        return
+    out.append((rule_id << 5) | (int(correct) << 4) | subtype_id)
+    out.append(letter_id)
+    out.append(_quantize(rule.get("confidence")))
+
+
+def encode_analysis(analysis_words: List[dict], pages: List[int], expected_text: str, level: int) -> bytes:
+    """Sérialise `analysis_words` (sortie de `_run_detailed_analysis`) en binaire compact."""
+    out = bytearray([FORMAT_VERSION, level & 0xFF])
+    _put_varint(out, len(pages))
+    for page in pages:
+        _put_varint(out, page)
+    out += text_checksum(expected_text).to_bytes(4, "little")
+    _put_varint(out, len(analysis_words))
+
+    previous = 0
+    for word in analysis_words:
+        rules = word.get("tajweed_rules") or []
+        start, end = word.get("start"), word.get("end")
+        flags = (min(len(rules), _RULES_MASK) << _RULES_SHIFT) | (_VALID if word.get("valid") else 0)
+        flags |= (_NO_START if start is None else 0) | (_NO_END if end is None else 0)
+        out.append(flags)
+        if len(rules) >= _RULES_MASK:
+            _put_varint(out, len(rules))
+        out.append(_quantize(word.get("confidence")))
+        if start is not None:
+            start = round(start * 100)
+            _put_signed(out, start - previous)
+            previous = start
+        if end is not None:
+            _put_signed(out, round(end * 100) - previous)
+        for rule in rules:
+            _encode_rule(out, rule)
+    return bytes(out)
+
+
+# ── Décodage ──────────────────────────────────────────────────────────────────
+
+def _decode_rule(reader: _Reader) -> dict:
+    head = reader.byte()
+    rule_id = head >> 5
+    if rule_id == RAW_RULE:
+        return json.loads(reader.raw(reader.varint()).decode("utf-8"))
+    correct = bool(head & 0x10)
+    rule, subtype = RULES[rule_id], SUBTYPES[head & 0x0F]
+    letter = LETTERS[reader.byte()]
+    return {
+        "rule": rule,
+        "subtype": subtype,
+        "letter": letter,
+        "status": "correct" if correct else "absent",
+        "confidence": _dequantize(reader.byte()),
+        "feedback": rule_feedback(rule, subtype, letter, correct),
+    }
+
+
+def _read_header(reader: _Reader) -> dict:
+    version = reader.byte()
+    if version not in (1, FORMAT_VERSION):
+        raise ValueError(f"Format d'analyse inconnu : {version}")
+    level = reader.byte()
+    pages = [reader.varint() for _ in range(reader.varint())]
+    checksum = int.from_bytes(reader.raw(4), "little")
+    return {"version": version, "level": level, "pages": pages, "checksum": checksum, "words": reader.varint()}
+
+
+def decode_header(data: bytes) -> dict:
+    """{"version", "level", "pages", "checksum", "words"} sans décoder les mots."""
+    return _read_header(_Reader(data))
+
+
+def decode_analysis(data: bytes, expected_text: Optional[str] = None) -> dict:
+    """
+    Reconstruit {"level", "pages", "words": [...]} au format de `/analyze`.
+
+    `expected_text` : texte des pages du passage (`expected_text_for`). Sans
+    lui, ou s'il ne correspond plus au CRC, les mots n'ont pas de texte.
+    """
+    reader = _Reader(data)
+    header = _read_header(reader)
+
+    texts = None
+    if expected_text is not None and text_checksum(expected_text) == header["checksum"]:
+        texts = expected_text.split()
+        if len(texts) != header["words"]:
+            texts = None
+
+    words = []
+    previous = 0
+    for i in range(header["words"]):
+        flags = reader.byte()
+        if header["version"] == 1:
+            n_rules = flags >> 1
+            flags &= _VALID
+        else:
+            n_rules = (flags >> _RULES_SHIFT) & _RULES_MASK
+            if n_rules == _RULES_MASK:
+                n_rules = reader.varint()
+        confidence = _dequantize(reader.byte())
+        start = end = None
+        if not flags & _NO_START:
+            start = previous = previous + reader.signed()
+        if not flags & _NO_END:
+            end = (previous + reader.signed()) / 100
+        valid = bool(flags & _VALID)
+        words.append({
+            "text": texts[i] if texts else None,
+            "start": start / 100 if start is not None else None,
+            "end": end,
+            "valid": valid,
+            "confidence": confidence,
+            "tajweed_rules": [_decode_rule(reader) for _ in range(n_rules)],
+            "feedback": "" if valid else WORD_FEEDBACK_INVALID,
+        })
+    return {"level": header["level"], "pages": header["pages"], "words": words}
@@ -1,4 +1,5 @@
 
+import asyncio
 import logging
 import requests
 import subprocess
@@ -7,11 +8,17 @@ import time
 import os
 import tempfile
 import json
+import re
 from backend.app.core.config import settings
+from backend.app.services.ollama_client import ollama, OllamaUnavailable
+from backend.app.services.feedback_cache import feedback_cache, feedback_signature
+from backend.app.services.prompt_builder import build_feedback_prompt, build_diff
+from backend.app.services.llm_tiering import governor, PRIMARY, TEMPLATE
+from typing import AsyncIterator, Iterable, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
-def ensure_model_pulled(model_name):
+def ensure_model_pulled(model_name, preload=True):
     logger.info(f"Check for model {model_name}...")
     try:
         # Check if Ollama is running first
@@ -31,9 +38,28 @@ def ensure_model_pulled(model_name):
             logger.info(f"Model {model_name} ready.")
         else:
             logger.info(f"Model {model_name} already available.")
+        if preload:
+            preload_model(model_name)
     except Exception as e:
         logger.error(f"Error checking/pulling model: {e}")
 
+def preload_model(model_name):
+    """Load the model into memory now and keep it resident (Ollama keep_alive)."""
+    try:
+        requests.post(
+            settings.OLLAMA_URL,
+            json={"model": model_name, "keep_alive": settings.OLLAMA_KEEP_ALIVE},
+            timeout=120,
+        )
+        logger.info(f"Model {model_name} loaded (keep_alive={settings.OLLAMA_KEEP_ALIVE}).")
+    except Exception as e:
+        logger.warning(f"Could not preload model {model_name}: {e}")
+
+def _ensure_light_model():
+    # Modèle de repli sous charge (llm_tiering) : téléchargé mais chargé à la demande.
+    if settings.OLLAMA_LIGHT_MODEL:
+        ensure_model_pulled(settings.OLLAMA_LIGHT_MODEL, preload=False)
+
 def ensure_ollama_ready():
     if settings.RUNNING_IN_DOCKER:
         logger.info("Running in Docker: Auto-install of Ollama disabled.")
@@ -44,6 +70,7 @@ def ensure_ollama_ready():
         requests.get("http://localhost:11434", timeout=2)
         logger.info("Ollama server detected.")
         ensure_model_pulled(settings.OLLAMA_MODEL)
+        _ensure_light_model()
         return
     except:
         pass
@@ -86,6 +113,7 @@ def ensure_ollama_ready():
             requests.get("http://localhost:11434", timeout=2)
             logger.info("Ollama server started successfully.")
             ensure_model_pulled(settings.OLLAMA_MODEL)
+            _ensure_light_model()
             return
         except:
             if i % 5 == 0:
@@ -93,37 +121,214 @@ def ensure_ollama_ready():
             time.sleep(2)
     logger.error("Error: Ollama server did not respond after 60 seconds.")
 
-def get_ai_feedback(expected_text: str, student_text: str, similarity_ratio: float):
-    prompt = f"""
-    Tu es un expert Tajwid. Analyse ces deux textes normalisés (sans voyelles).
-    
-    Attendu : {expected_text}
-    Entendu : {student_text}
-    
-    Les textes se ressemblent à {int(similarity_ratio*100)}%.
-    Explique brièvement les différences majeures (Mots oubliés ? Mots ajoutés ?).
-    Ne sois PAS scolaire. Donne un conseil concis en français.
-    
-    Réponse (JSON) :
-    {{ "feedback": "Ton conseil ici..." }}
+def _fallback_message(reason: str) -> str:
+    """Message de repli quand le LLM n'a pas pu répondre."""
+    if reason == "timeout":
+        return "L'analyse IA a pris trop de temps. La récitation est validée techniquement, mais je n'ai pas pu générer de conseils détaillés."
+    if reason.startswith("http_"):
+        return "L'IA n'a pas pu analyser en détail (Erreur serveur), mais la récitation semble correcte sur la forme."
+    if reason in ("circuit_open", "saturated"):
+        return "L'IA est momentanément indisponible. La récitation est enregistrée ; réessayez plus tard pour des conseils détaillés."
+    return "Erreur technique lors de l'analyse, mais la récitation est enregistrée."
+
+def template_feedback(expected_text: str, student_text: str, similarity_ratio: float, analysis_words: Optional[list] = None) -> str:
+    """Conseil sans LLM, construit à partir du diff (palier « template » en cas de surcharge)."""
+    diff = build_diff(expected_text, student_text, analysis_words)
+    parts = [f"{diff['matched']} mots reconnus sur {diff['total']} ({int(similarity_ratio * 100)}%)."]
+    if diff["missing"]:
+        longest = max(diff["missing"], key=len)
+        parts.append(f"Revoyez le passage « {longest} »" + (f" et {len(diff['missing']) - 1} autre(s) oubli(s)." if len(diff["missing"]) > 1 else "."))
+    if diff["substituted"]:
+        expected, heard = diff["substituted"][0]
+        parts.append(f"Attention à la prononciation de « {expected} » (entendu « {heard} »).")
+    if diff["rules"]:
+        word, rule = diff["rules"][0]
+        parts.append(f"Règle à travailler : {rule} sur « {word} ».")
+    if len(parts) == 1:
+        parts.append("Très bonne fidélité au texte, continuez ainsi !")
+    return " ".join(parts)
+
+async def _cached_feedback(page, level, similarity_ratio, missing_indices, variant):
+    """(clé de cache, conseil en cache ou None) ; pas de cache sans numéro de page."""
+    if page is None:
+        return None, None
+    cache_key = feedback_signature(page, level, similarity_ratio, missing_indices, variant)
+    cached = await asyncio.to_thread(feedback_cache.get, cache_key)
+    if cached:
+        logger.info(f"Feedback cache hit (page {page}, level {level})")
+        return cache_key, cached["feedback"]
+    return cache_key, None
+
+async def get_ai_feedback(
+    expected_text: str,
+    student_text: str,
+    similarity_ratio: float,
+    page: Optional[int] = None,
+    level: int = 1,
+    missing_indices: Iterable[int] = (),
+    variant: str = "",
+    analysis_words: Optional[list] = None,
+) -> Tuple[str, str]:
     """
+    Conseil IA pour une récitation. Quand `page` est fourni, le conseil est
+    mis en cache sous la signature (page, niveau, tranche de similarité,
+    mots manquants) : une nouvelle tentative identique ne rappelle pas le LLM.
+
+    Le prompt ne contient que le diff attendu / entendu (services/prompt_builder.py),
+    enrichi des règles Tajwid échouées quand `analysis_words` est fourni.
+
+    Returns:
+        (conseil, palier) — palier parmi "cache", "primary", "light",
+        "template" (surcharge) ou "fallback" (échec de l'appel LLM).
+    """
+    cache_key, cached = await _cached_feedback(page, level, similarity_ratio, missing_indices, variant)
+    if cached:
+        return cached, "cache"
+
+    tier = governor.select()
+    if tier == TEMPLATE:
+        return template_feedback(expected_text, student_text, similarity_ratio, analysis_words), tier
+
+    prompt, _ = build_feedback_prompt(expected_text, student_text, similarity_ratio, analysis_words)
     
-    ollama_payload = { "model": settings.OLLAMA_MODEL, "prompt": prompt, "stream": False, "format": "json" }
-    
+    start = time.monotonic()
+    try:
+        response_text = await ollama.generate(prompt, model=governor.model_for(tier))
+    except OllamaUnavailable as e:
+        logger.error(f"IA unavailable: {e.reason}")
+        if e.reason == "timeout":
+            governor.observe(tier, time.monotonic() - start)
+        return _fallback_message(e.reason), "fallback"
+    governor.observe(tier, time.monotonic() - start)
+
     try:
-        ai_resp = requests.post(settings.OLLAMA_URL, json=ollama_payload, timeout=45)
-        if ai_resp.status_code == 200:
-            try:
-                ai_json = json.loads(ai_resp.json().get("response", "{}"))
-                return ai_json.get("feedback", "Attention à la précision de certains mots.")
-            except:
-                return "Quelques erreurs de prononciation détectées, soyez plus précis."
+        ai_json = json.loads(response_text or "{}")
+    except:
+        return "Quelques erreurs de prononciation détectées, soyez plus précis.", tier
+    # Seul le modèle principal alimente le cache : un conseil dégradé n'est pas rejoué.
+    if cache_key and tier == PRIMARY and ai_json.get("feedback"):
+        await asyncio.to_thread(feedback_cache.put, cache_key, {"feedback": ai_json["feedback"]})
+    return ai_json.get("feedback", "Attention à la précision de certains mots."), tier
+
+class FeedbackFieldExtractor:
+    """
+    Extrait au fil de l'eau la valeur de la clé "feedback" d'un JSON en cours
+    de génération : `feed(fragment)` renvoie les caractères décodés
+    nouvellement disponibles (échappements JSON compris, y compris \\uXXXX).
+    Un échappement coupé entre deux fragments est gardé pour le suivant.
+    """
+
+    _ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+    def __init__(self, key: str = "feedback"):
+        self._pattern = re.compile(r'"%s"\s*:\s*"' % re.escape(key))
+        self._buffer = ""
+        self._pos: Optional[int] = None   # début de la valeur dans _buffer
+        self.done = False
+
+    def feed(self, fragment: str) -> str:
+        if self.done:
+            return ""
+        self._buffer += fragment
+        if self._pos is None:
+            match = self._pattern.search(self._buffer)
+            if not match:
+                return ""
+            self._pos = match.end()
+
+        out = []
+        buf, i = self._buffer, self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if ch == '"':
+                self.done = True
+                i += 1
+                break
+            if ch != "\\":
+                out.append(ch)
+                i += 1
+                continue
+            if i + 1 >= len(buf):
+                break                      # échappement incomplet
+            code = buf[i + 1]
+            if code == "u":
+                if i + 6 > len(buf):
+                    break
+                try:
+                    out.append(chr(int(buf[i + 2:i + 6], 16)))
+                except ValueError:
+                    pass
+                i += 6
+            else:
+                out.append(self._ESCAPES.get(code, code))
+                i += 2
+        self._pos = i
+        return "".join(out)
+
+async def stream_ai_feedback(
+    expected_text: str,
+    student_text: str,
+    similarity_ratio: float,
+    page: Optional[int] = None,
+    level: int = 1,
+    missing_indices: Iterable[int] = (),
+    variant: str = "",
+    analysis_words: Optional[list] = None,
+) -> AsyncIterator[dict]:
+    """
+    Version streamée de `get_ai_feedback` pour le SSE.
+
+    Produit des évènements {"event": "token", "data": texte} au fur et à mesure
+    de la génération, puis un unique {"event": "done", "data": {"feedback",
+    "cached", "tier", "error"?}}. Un conseil en cache ou issu du palier
+    « template » est envoyé d'un bloc.
+    """
+    cache_key, cached = await _cached_feedback(page, level, similarity_ratio, missing_indices, variant)
+    if cached:
+        yield {"event": "token", "data": cached}
+        yield {"event": "done", "data": {"feedback": cached, "cached": True, "tier": "cache"}}
+        return
+
+    tier = governor.select()
+    if tier == TEMPLATE:
+        message = template_feedback(expected_text, student_text, similarity_ratio, analysis_words)
+        yield {"event": "token", "data": message}
+        yield {"event": "done", "data": {"feedback": message, "cached": False, "tier": tier}}
+        return
+
+    prompt, _ = build_feedback_prompt(expected_text, student_text, similarity_ratio, analysis_words)
+    extractor = FeedbackFieldExtractor()
+    raw, streamed = [], []
+    start = time.monotonic()
+    try:
+        async for fragment in ollama.stream(prompt, model=governor.model_for(tier)):
+            raw.append(fragment)
+            text = extractor.feed(fragment)
+            if text:
+                streamed.append(text)
+                yield {"event": "token", "data": text}
+    except OllamaUnavailable as e:
+        logger.error(f"IA unavailable (stream): {e.reason}")
+        if e.reason == "timeout":
+            governor.observe(tier, time.monotonic() - start)
+        if streamed:
+            # Le début du conseil est déjà affiché : on s'arrête là.
+            yield {"event": "done", "data": {"feedback": "".join(streamed), "cached": False, "tier": tier, "error": e.reason}}
         else:
-            logger.error(f"Ollama error {ai_resp.status_code}")
-            return "L'IA n'a pas pu analyser en détail (Erreur serveur), mais la récitation semble correcte sur la forme."
-    except requests.exceptions.Timeout:
-        logger.error("IA Timeout")
-        return "L'analyse IA a pris trop de temps. La récitation est validée techniquement, mais je n'ai pas pu générer de conseils détaillés."
-    except Exception as e:
-        logger.error(f"IA Error: {e}")
-        return "Erreur technique lors de l'analyse, mais la récitation est enregistrée."
+            message = _fallback_message(e.reason)
+            yield {"event": "token", "data": message}
+            yield {"event": "done", "data": {"feedback": message, "cached": False, "tier": "fallback", "error": e.reason}}
+        return
+    governor.observe(tier, time.monotonic() - start)
+
+    try:
+        feedback = json.loads("".join(raw) or "{}").get("feedback")
+    except Exception:
+        feedback = "".join(streamed) or None
+    if not feedback:
+        feedback = "Attention à la précision de certains mots."
+        if not streamed:
+            yield {"event": "token", "data": feedback}
+    elif cache_key and tier == PRIMARY:
+        await asyncio.to_thread(feedback_cache.put, cache_key, {"feedback": feedback})
+    yield {"event": "done", "data": {"feedback": feedback, "cached": False, "tier": tier}}
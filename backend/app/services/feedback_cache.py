@@ -0,0 +1,126 @@
+"""
+Persistent cache of AI coaching feedback, keyed by a canonical error signature.
+
+In hifz practice a student recites the same page again and again, usually
+with the same gaps. The LLM would produce near-identical advice each time,
+so the advice is cached under:
+
+    (page, difficulty level, similarity bucket, sorted missing/invalid word indices)
+
+Entries live in a small SQLite file (FEEDBACK_CACHE_PATH) so they survive
+restarts and work the same for the Postgres deployment and the legacy
+server, with an in-memory LRU in front. Entries expire after
+FEEDBACK_CACHE_TTL seconds and the least recently used rows are evicted
+beyond FEEDBACK_CACHE_MAX_ENTRIES.
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Iterable, Optional
+
+from backend.app.core.cache import LRUCache
+from backend.app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+SIMILARITY_BUCKETS = 20  # 5 % wide buckets
+
+
+def feedback_signature(
+    page: int,
+    level: int,
+    similarity_ratio: float,
+    missing_indices: Iterable[int],
+    variant: str = "",
+) -> str:
+    """Canonical, order-independent cache key for one recitation outcome."""
+    bucket = min(SIMILARITY_BUCKETS, max(0, int(similarity_ratio * SIMILARITY_BUCKETS)))
+    canonical = json.dumps(
+        [variant, int(page), int(level), bucket, sorted(set(int(i) for i in missing_indices))],
+        separators=(",", ":"),
+    )
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+class FeedbackCache:
+    def __init__(self, path: str, max_entries: int, ttl: float, memory_size: int = 512):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._memory = LRUCache(maxsize=memory_size, ttl=ttl)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS feedback_cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " created_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_feedback_cache_last_used ON feedback_cache (last_used)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key: str) -> Optional[dict]:
+        value = self._memory.get(key)
+        if value is not None:
+            return value
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                row = conn.execute(
+                    "SELECT value, created_at FROM feedback_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                if now - row[1] > self.ttl:
+                    conn.execute("DELETE FROM feedback_cache WHERE key = ?", (key,))
+                    conn.commit()
+                    return None
+                conn.execute("UPDATE feedback_cache SET last_used = ? WHERE key = ?", (now, key))
+                conn.commit()
+            value = json.loads(row[0])
+        except Exception as e:
+            logger.error(f"Feedback cache read error: {e}")
+            return None
+        self._memory.put(key, value)
+        return value
+
+    def put(self, key: str, value: dict) -> None:
+        self._memory.put(key, value)
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO feedback_cache (key, value, created_at, last_used) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), now, now),
+                )
+                count = conn.execute("SELECT COUNT(*) FROM feedback_cache").fetchone()[0]
+                if count > self.max_entries:
+                    conn.execute(
+                        "DELETE FROM feedback_cache WHERE key IN ("
+                        " SELECT key FROM feedback_cache ORDER BY last_used ASC LIMIT ?)",
+                        (count - self.max_entries,),
+                    )
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Feedback cache write error: {e}")
+
+    def stats(self) -> dict:
+        return {"memory": self._memory.stats(), "max_entries": self.max_entries, "ttl_s": self.ttl}
+
+
+feedback_cache = FeedbackCache(
+    path=settings.FEEDBACK_CACHE_PATH,
+    max_entries=settings.FEEDBACK_CACHE_MAX_ENTRIES,
+    ttl=settings.FEEDBACK_CACHE_TTL,
+)
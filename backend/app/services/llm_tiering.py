@@ -0,0 +1,129 @@
+"""
+Adaptive LLM tiering: degrade feedback quality before latency explodes.
+
+A single 8B model serves every recitation. Under a classroom burst the
+queue in front of Ollama grows and every student waits. The governor looks
+at the queue depth of the shared `OllamaClient` and at a moving average of
+recent generation latency, and picks one of three tiers:
+
+    primary  → OLLAMA_MODEL
+    light    → OLLAMA_LIGHT_MODEL (opt-in; skipped when unset, the default)
+    template → no LLM at all, feedback built from the diff
+
+It escalates one step when the queue reaches LLM_TIER_MAX_QUEUE or the
+current tier's latency exceeds LLM_TIER_TARGET_LATENCY. It steps back once
+the queue is empty and latency is below LLM_TIER_RECOVER_RATIO × target for
+LLM_TIER_MIN_DWELL seconds (hysteresis, so it does not flap).
+"""
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from backend.app.core.config import settings
+from backend.app.services.ollama_client import OllamaClient, ollama
+
+logger = logging.getLogger(__name__)
+
+PRIMARY, LIGHT, TEMPLATE = "primary", "light", "template"
+
+
+class TierGovernor:
+    def __init__(
+        self,
+        client: OllamaClient,
+        primary_model: str,
+        light_model: Optional[str],
+        target_latency: float,
+        max_queue: int,
+        recover_ratio: float,
+        min_dwell: float,
+        alpha: float = 0.3,
+    ):
+        self.client = client
+        self.models: Dict[str, Optional[str]] = {PRIMARY: primary_model, LIGHT: light_model or None, TEMPLATE: None}
+        self.tiers = [PRIMARY] + ([LIGHT] if light_model else []) + [TEMPLATE]
+        self.target_latency = target_latency
+        self.max_queue = max_queue
+        self.recover_ratio = recover_ratio
+        self.min_dwell = min_dwell
+        self.alpha = alpha
+
+        self._lock = threading.Lock()
+        self._index = 0
+        self._changed_at = time.monotonic()
+        self._samples_since_change = 0
+        self._ewma: Dict[str, Optional[float]] = {t: None for t in self.tiers}
+        self.served = {t: 0 for t in self.tiers}
+        self.transitions = 0
+
+    @property
+    def tier(self) -> str:
+        return self.tiers[self._index]
+
+    def model_for(self, tier: str) -> Optional[str]:
+        return self.models.get(tier)
+
+    def _switch(self, index: int, why: str) -> None:
+        old = self.tier
+        self._index = index
+        self._changed_at = time.monotonic()
+        self._samples_since_change = 0
+        self._ewma[self.tier] = None   # stale figures from the last visit don't count
+        self.transitions += 1
+        logger.warning(f"LLM tier {old} → {self.tier} ({why})")
+
+    def select(self) -> str:
+        """Re-evaluate load and return the tier to use for this request."""
+        with self._lock:
+            depth = self.client.waiting
+            latency = self._ewma[self.tier]
+            dwell = time.monotonic() - self._changed_at
+            last = len(self.tiers) - 1
+
+            overloaded = depth >= self.max_queue or (latency is not None and latency > self.target_latency)
+            # Escalate at once on evidence from this tier; otherwise give it one dwell period.
+            if overloaded and self._index < last and (self._samples_since_change or dwell >= self.min_dwell):
+                self._switch(self._index + 1, f"queue={depth}, latency={latency}")
+            elif (
+                self._index > 0
+                and depth == 0
+                and dwell >= self.min_dwell
+                and (latency is None or latency <= self.target_latency * self.recover_ratio)
+            ):
+                self._switch(self._index - 1, f"load dropped, latency={latency}")
+
+            tier = self.tier
+            self.served[tier] += 1
+            return tier
+
+    def observe(self, tier: str, latency: float) -> None:
+        """Feed back the latency of a finished generation on `tier`."""
+        with self._lock:
+            previous = self._ewma.get(tier)
+            self._ewma[tier] = latency if previous is None else self.alpha * latency + (1 - self.alpha) * previous
+            if tier == self.tier:
+                self._samples_since_change += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "tier": self.tier,
+                "models": {t: self.models[t] for t in self.tiers},
+                "queue_depth": self.client.waiting,
+                "latency_ewma_s": {t: round(v, 2) if v is not None else None for t, v in self._ewma.items()},
+                "target_latency_s": self.target_latency,
+                "served": dict(self.served),
+                "transitions": self.transitions,
+            }
+
+
+governor = TierGovernor(
+    client=ollama,
+    primary_model=settings.OLLAMA_MODEL,
+    light_model=settings.OLLAMA_LIGHT_MODEL,
+    target_latency=settings.LLM_TIER_TARGET_LATENCY,
+    max_queue=settings.LLM_TIER_MAX_QUEUE,
+    recover_ratio=settings.LLM_TIER_RECOVER_RATIO,
+    min_dwell=settings.LLM_TIER_MIN_DWELL,
+)
@@ -0,0 +1,323 @@
+"""
+Async, connection-pooled Ollama client with a concurrency limit and a circuit breaker.
+
+Every LLM call used to be a bare `requests.post` that opened a new connection
+and pinned a worker thread for the whole generation (45–120 s on CPU). This
+client is awaited from the event loop instead:
+
+  - one shared `httpx.AsyncClient` keeps connections to Ollama alive;
+  - a semaphore caps concurrent generations; a caller that cannot get a slot
+    within OLLAMA_QUEUE_TIMEOUT is told the LLM is saturated and falls back
+    to template feedback instead of queueing behind a burst;
+  - a circuit breaker opens after OLLAMA_BREAKER_THRESHOLD consecutive
+    failures and skips the LLM for OLLAMA_BREAKER_RESET seconds, then lets a
+    single probe through (half-open);
+  - every request carries `keep_alive` so the model stays resident between
+    calls (`feedback.preload_model` loads it at startup).
+
+`stream()` yields tokens from Ollama's NDJSON streaming API for SSE endpoints.
+`stats()` exposes breaker state, in-flight count and latency percentiles.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import AsyncIterator, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from backend.app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class OllamaUnavailable(Exception):
+    """Raised when the LLM is skipped (breaker open, saturated) or the call fails."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class CircuitBreaker:
+    """Classic closed → open → half-open breaker, driven by consecutive failures."""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self._state = self.CLOSED
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+        return self._state
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def release_probe(self) -> None:
+        self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._probe_in_flight = False
+        self._state = self.CLOSED
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probe_in_flight = False
+        if self._state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self._state != self.OPEN:
+                logger.warning(f"Ollama circuit breaker OPEN after {self.failures} failure(s)")
+            self._state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class OllamaClient:
+    def __init__(
+        self,
+        generate_url: str,
+        max_concurrency: int,
+        queue_timeout: float,
+        timeout: float,
+        keep_alive: str,
+        breaker: CircuitBreaker,
+    ):
+        self.generate_url = generate_url
+        parts = urlsplit(generate_url)
+        self.base_url = f"{parts.scheme}://{parts.netloc}"
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self.breaker = breaker
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        self.in_flight = 0
+        self.waiting = 0    # callers queued for a generation slot
+        self.counters = {"requests": 0, "success": 0, "failures": 0, "skipped_open": 0, "skipped_saturated": 0}
+        self._latencies: deque = deque(maxlen=200)
+        self._ttft: deque = deque(maxlen=200)   # time to first streamed token
+        self._prompt_tokens: deque = deque(maxlen=200)   # Ollama's prompt_eval_count
+        self._prompt_eval: deque = deque(maxlen=200)     # prompt evaluation time (s)
+
+    def _ensure_client(self) -> httpx.AsyncClient:
+        # The pooled client and semaphore belong to the running event loop.
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=5.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency + 2,
+                    max_keepalive_connections=self.max_concurrency + 2,
+                ),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._client
+
+    async def _admit(self) -> None:
+        """Take a generation slot, or raise OllamaUnavailable (breaker open / saturated)."""
+        self._ensure_client()
+        self.counters["requests"] += 1
+
+        if not self.breaker.allow():
+            self.counters["skipped_open"] += 1
+            raise OllamaUnavailable("circuit_open")
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.counters["skipped_saturated"] += 1
+            # Not the model's fault — give back a half-open probe without counting a failure.
+            self.breaker.release_probe()
+            raise OllamaUnavailable("saturated")
+        except asyncio.CancelledError:
+            # Caller went away while queued: a held probe would block the breaker in half-open.
+            self.breaker.release_probe()
+            raise
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def _failure(self, exc: Exception) -> OllamaUnavailable:
+        self.counters["failures"] += 1
+        self.breaker.record_failure()
+        if isinstance(exc, OllamaUnavailable):
+            return exc
+        if isinstance(exc, httpx.TimeoutException):
+            return OllamaUnavailable("timeout")
+        return OllamaUnavailable(f"error: {exc}")
+
+    def _success(self, elapsed: float) -> None:
+        self._latencies.append(elapsed)
+        self.counters["success"] += 1
+        self.breaker.record_success()
+
+    def _record_prompt_eval(self, body: dict) -> None:
+        # Final Ollama message: how many prompt tokens were evaluated, and how long it took.
+        if body.get("prompt_eval_count"):
+            self._prompt_tokens.append(body["prompt_eval_count"])
+        if body.get("prompt_eval_duration"):
+            self._prompt_eval.append(body["prompt_eval_duration"] / 1e9)
+
+    def _payload(self, prompt: str, model: Optional[str], format: Optional[str], options: Optional[dict], stream: bool) -> dict:
+        payload = {
+            "model": model or settings.OLLAMA_MODEL,
+            "prompt": prompt,
+            "stream": stream,
+            "keep_alive": self.keep_alive,
+        }
+        if format:
+            payload["format"] = format
+        if options:
+            payload["options"] = options
+        return payload
+
+    async def generate(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        format: Optional[str] = "json",
+        options: Optional[dict] = None,
+    ) -> str:
+        """
+        Run a non-streamed generation and return Ollama's `response` text.
+
+        Raises:
+            OllamaUnavailable: breaker open, no free slot in time, or call failed.
+        """
+        await self._admit()
+        start = time.monotonic()
+        try:
+            resp = await self._client.post(self.generate_url, json=self._payload(prompt, model, format, options, False))
+            if resp.status_code != 200:
+                raise OllamaUnavailable(f"http_{resp.status_code}")
+            body = resp.json()
+            text = body.get("response", "")
+            self._record_prompt_eval(body)
+        except asyncio.CancelledError:
+            # Caller went away (client disconnect, timeout wrapper): not an Ollama failure.
+            self.breaker.release_probe()
+            raise
+        except Exception as e:
+            raise self._failure(e)
+        finally:
+            self._release()
+
+        self._success(time.monotonic() - start)
+        return text
+
+    async def stream(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        format: Optional[str] = "json",
+        options: Optional[dict] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Streamed generation: yield Ollama's `response` fragments as they arrive.
+
+        Same admission rules as `generate`; the slot is held until the stream
+        ends or the consumer stops iterating (client disconnect).
+        """
+        await self._admit()
+        start = time.monotonic()
+        first_token = True
+        try:
+            async with self._client.stream(
+                "POST", self.generate_url, json=self._payload(prompt, model, format, options, True)
+            ) as resp:
+                if resp.status_code != 200:
+                    raise OllamaUnavailable(f"http_{resp.status_code}")
+                async for line in resp.aiter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    fragment = chunk.get("response", "")
+                    if fragment:
+                        if first_token:
+                            self._ttft.append(time.monotonic() - start)
+                            first_token = False
+                        yield fragment
+                    if chunk.get("done"):
+                        self._record_prompt_eval(chunk)
+                        break
+        except (GeneratorExit, asyncio.CancelledError):
+            # Consumer went away: not an Ollama failure.
+            self.breaker.release_probe()
+            raise
+        except Exception as e:
+            raise self._failure(e)
+        else:
+            self._success(time.monotonic() - start)
+        finally:
+            self._release()
+
+    async def health(self) -> dict:
+        """Ping Ollama and list the models currently loaded in memory."""
+        client = self._ensure_client()
+        try:
+            resp = await client.get(f"{self.base_url}/api/ps", timeout=2.0)
+            loaded = [m.get("name") for m in resp.json().get("models", [])] if resp.status_code == 200 else []
+            return {"reachable": resp.status_code == 200, "loaded_models": loaded}
+        except Exception as e:
+            return {"reachable": False, "error": str(e)}
+
+    def stats(self) -> dict:
+        def pct(samples, p: float) -> Optional[float]:
+            if not samples:
+                return None
+            ordered = sorted(samples)
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 3)
+
+        return {
+            "breaker": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "keep_alive": self.keep_alive,
+            **self.counters,
+            "latency_s": {"p50": pct(self._latencies, 0.50), "p95": pct(self._latencies, 0.95), "samples": len(self._latencies)},
+            "first_token_s": {"p50": pct(self._ttft, 0.50), "p95": pct(self._ttft, 0.95), "samples": len(self._ttft)},
+            "prompt_tokens": {"p50": pct(self._prompt_tokens, 0.50), "p95": pct(self._prompt_tokens, 0.95)},
+            "prompt_eval_s": {"p50": pct(self._prompt_eval, 0.50), "p95": pct(self._prompt_eval, 0.95)},
+        }
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+ollama = OllamaClient(
+    generate_url=settings.OLLAMA_URL,
+    max_concurrency=settings.OLLAMA_MAX_CONCURRENCY,
+    queue_timeout=settings.OLLAMA_QUEUE_TIMEOUT,
+    timeout=settings.OLLAMA_TIMEOUT,
+    keep_alive=settings.OLLAMA_KEEP_ALIVE,
+    breaker=CircuitBreaker(settings.OLLAMA_BREAKER_THRESHOLD, settings.OLLAMA_BREAKER_RESET),
+)
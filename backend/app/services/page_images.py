@@ -0,0 +1,220 @@
+"""
+Resized WebP / AVIF derivatives of the Mushaf page images.
+
+`quran_pages/` holds 604 JPEGs (~52 MB, ~86 KB a page) saved at a very high
+quality, and every client fetched them as is, a phone included. Derivatives
+are produced with Pillow into PAGE_IMAGE_CACHE_DIR:
+
+    Quran_Page_003.w480.webp    width-limited (PAGE_IMAGE_WIDTHS)
+    Quran_Page_003.full.avif    same size as the original, re-encoded
+
+`/api/v1/quran_pages/{page}` picks the variant with `negotiate()`:
+
+  - format: `?format=avif|webp|jpeg`, otherwise the first of
+    PAGE_IMAGE_FORMATS the Accept header allows (the response then
+    varies on Accept), otherwise the original JPEG;
+  - width: `?w=` snaps up to the next configured width, so a client
+    cannot fill the cache with arbitrary sizes. Widths at or above the
+    original's are served at full resolution (no upscaling).
+
+A missing derivative is rendered on first request (one thread per file,
+atomic rename), then served like any other immutable file. It can also be
+built ahead of time with `build_page_images.py` (the PWA, served by GitHub
+Pages, only gets pre-built files).
+
+Without Pillow (or without AVIF support in it) the corresponding variants
+are simply not offered and the original JPEG is served.
+"""
+import logging
+import os
+import tempfile
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from backend.app.core.config import settings
+from backend.app.core.file_responses import FileInfo, file_index
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+if PIL_AVAILABLE:
+    try:
+        import pillow_avif  # noqa: F401  (AVIF plugin for Pillow < 11.2)
+    except ImportError:
+        pass
+
+logger = logging.getLogger(__name__)
+
+MEDIA_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp", "avif": "image/avif"}
+EXTENSIONS = {"jpeg": "jpg", "webp": "webp", "avif": "avif"}
+_PIL_FORMATS = {"jpeg": "JPEG", "webp": "WEBP", "avif": "AVIF"}
+_SAVE_OPTIONS = {
+    "jpeg": {"quality": 80, "optimize": True, "progressive": True},
+    "webp": {"quality": 65, "method": 4},
+    "avif": {"quality": 45, "speed": 8},   # ~0.5 s a page: acceptable for a lazy first view
+}
+
+
+@dataclass(frozen=True)
+class Variant:
+    fmt: str                      # "jpeg", "webp" or "avif"
+    width: Optional[int] = None   # None: original size
+
+    @property
+    def original(self) -> bool:
+        return self.fmt == "jpeg" and self.width is None
+
+    @property
+    def media_type(self) -> str:
+        return MEDIA_TYPES[self.fmt]
+
+
+ORIGINAL = Variant("jpeg")
+
+
+def page_filename(page: int) -> str:
+    # Files on disk: Quran_Page_003.jpg = Page 1
+    return f"Quran_Page_{page + 2:03d}.jpg"
+
+
+def _can_save(fmt: str) -> bool:
+    if not PIL_AVAILABLE:
+        return False
+    Image.init()
+    return _PIL_FORMATS[fmt] in Image.SAVE
+
+
+def available_formats() -> Tuple[str, ...]:
+    """Derived formats this install can write, in order of preference."""
+    return tuple(fmt for fmt in settings.PAGE_IMAGE_FORMATS if fmt in _PIL_FORMATS and _can_save(fmt))
+
+
+def _snap_width(width: Optional[int]) -> Optional[int]:
+    if not width or width <= 0:
+        return None
+    for candidate in sorted(settings.PAGE_IMAGE_WIDTHS):
+        if candidate >= width:
+            return candidate
+    return None   # larger than every configured width: full resolution
+
+
+def negotiate(accept: str, fmt: Optional[str] = None, width: Optional[int] = None) -> Tuple[Variant, bool]:
+    """Variant to serve, and whether it was chosen from Accept (→ `Vary: Accept`)."""
+    if not PIL_AVAILABLE:
+        return ORIGINAL, False
+    formats = available_formats()
+    width = _snap_width(width)
+    if fmt and fmt != "auto":
+        fmt = fmt.lower().replace("jpg", "jpeg")
+        return Variant(fmt if fmt in formats or fmt == "jpeg" else "jpeg", width), False
+    accept = (accept or "").lower()
+    for candidate in formats:
+        if MEDIA_TYPES[candidate] in accept:
+            return Variant(candidate, width), True
+    return Variant("jpeg", width), True
+
+
+def variant_path(filename: str, variant: Variant, cache_dir: Optional[str] = None) -> str:
+    stem = os.path.splitext(filename)[0]
+    size = f"w{variant.width}" if variant.width else "full"
+    return os.path.join(cache_dir or settings.PAGE_IMAGE_CACHE_DIR, f"{stem}.{size}.{EXTENSIONS[variant.fmt]}")
+
+
+def offload_path(path: str, variant: Variant) -> str:
+    """Path under the proxy's internal location (see core/file_responses.py)."""
+    folder = "quran_pages" if variant.original else os.path.basename(settings.PAGE_IMAGE_CACHE_DIR)
+    return f"{folder}/{os.path.basename(path)}"
+
+
+_source_widths: Dict[str, int] = {}
+_render_locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+_render_locks_guard = threading.Lock()
+
+
+def _source_width(source: str) -> int:
+    width = _source_widths.get(source)
+    if width is None:
+        with Image.open(source) as img:   # reads the header only
+            width = _source_widths[source] = img.width
+    return width
+
+
+def render(source: str, target: str, variant: Variant) -> str:
+    """Write the `variant` of `source` to `target` (temp file + atomic rename)."""
+    with _render_locks_guard:
+        lock = _render_locks[target]
+    with lock:
+        if os.path.exists(target):
+            return target
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with Image.open(source) as img:
+            img = img.convert("RGB")
+        if variant.width and variant.width < img.width:
+            img.thumbnail((variant.width, img.height), Image.LANCZOS)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix=".part")
+        os.close(fd)
+        try:
+            img.save(temp_path, _PIL_FORMATS[variant.fmt], **_SAVE_OPTIONS[variant.fmt])
+            os.replace(temp_path, target)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+    return target
+
+
+def resolve(filename: str, variant: Variant, source_dir: Optional[str] = None) -> Optional[Tuple[FileInfo, Variant]]:
+    """
+    FileInfo of the page image `filename` in `variant` (rendered if needed),
+    or None if the page does not exist. `source_dir` defaults to
+    QURAN_PAGES_DIR (the legacy server passes its own).
+    """
+    source_dir = source_dir or settings.QURAN_PAGES_DIR
+    source = os.path.join(source_dir, filename)
+    if variant.original:
+        info = file_index.info(source, revalidate=False)
+        return (info, variant) if info else None
+    target = variant_path(filename, variant)
+    info = file_index.info(target, revalidate=False)
+    if info is not None:
+        return info, variant
+    if not os.path.isfile(source):
+        return None
+    try:
+        if variant.width and variant.width >= _source_width(source):
+            return resolve(filename, Variant(variant.fmt), source_dir)
+        render(source, target, variant)
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Page derivative {target} failed, serving the original: {e}")
+        return resolve(filename, ORIGINAL, source_dir)
+    info = file_index.info(target, revalidate=False)
+    return (info, variant) if info else None
+
+
+def build_all(source_dir: str, cache_dir: str, formats, widths, full: bool = True) -> Dict[str, int]:
+    """Render every derivative of every page of `source_dir` into `cache_dir` (build_page_images.py)."""
+    counts = {"pages": 0, "written": 0, "skipped": 0, "bytes_source": 0, "bytes_written": 0}
+    names = sorted(n for n in os.listdir(source_dir) if n.lower().endswith(".jpg"))
+    for name in names:
+        source = os.path.join(source_dir, name)
+        counts["pages"] += 1
+        counts["bytes_source"] += os.path.getsize(source)
+        source_width = _source_width(source)
+        sizes = [w for w in widths if w < source_width] + ([None] if full else [])
+        for fmt in formats:
+            for width in sizes:
+                variant = Variant(fmt, width)
+                target = variant_path(name, variant, cache_dir)
+                if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(source):
+                    counts["skipped"] += 1
+                    continue
+                if os.path.exists(target):
+                    os.remove(target)
+                render(source, target, variant)
+                counts["written"] += 1
+                counts["bytes_written"] += os.path.getsize(target)
+    return counts
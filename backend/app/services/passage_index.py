@@ -0,0 +1,290 @@
+"""
+Détection automatique du passage récité — index inversé de n-grammes sur le Mushaf.
+
+`/analyze` et `/validate` comparent la transcription à la page envoyée par
+le client. Si l'élève récite une autre page, ou déborde sur la suivante,
+tout le score s'effondre. Cet index permet de retrouver en quelques
+millisecondes la page / le verset le plus probable d'une transcription :
+
+  - le texte des 604 pages (avec numéros de sourate/verset) est récupéré
+    une fois depuis l'API AlQuran puis conservé dans `QURAN_TEXT_PATH`
+    (seulement une fois complet) ;
+  - chaque n-gramme de mots normalisés pointe vers ses positions globales
+    (mot n° k du Mushaf) ; les n-grammes trop fréquents sont ignorés ;
+  - une requête collecte les positions touchées et garde la fenêtre la plus
+    dense, de la longueur approximative de la transcription.
+
+L'index est construit dans un thread de fond au démarrage (`ensure_index`) ;
+tant qu'il n'est pas prêt, `detect_passage` renvoie None et l'analyse
+utilise simplement la page demandée.
+"""
+
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+from backend.app.core.config import settings
+from backend.app.services.quran import normalize_arabic
+
+logger = logging.getLogger(__name__)
+
+TOTAL_PAGES = 604
+NGRAM_SIZE = 3
+MAX_POSTINGS = 40          # n-gramme présent à plus de 40 endroits → trop ambigu
+MAX_DETECTED_PAGES = 3     # au-delà, on garde la page demandée
+NEIGHBOUR_MIN_COVERAGE = 0.5  # page voisine ajoutée seulement si la moitié au moins est récitée
+FETCH_WORKERS = 4          # téléchargements simultanés vers l'API AlQuran
+FETCH_ATTEMPTS = 4
+FETCH_BACKOFF = 1.0        # secondes, doublées à chaque nouvelle tentative
+
+# Replis supplémentaires Uthmani ↔ Whisper (en plus de normalize_arabic)
+_FOLD = str.maketrans({"ٱ": "ا", "ة": "ه", "ئ": "ي", "ء": None})
+
+
+def _index_form(text: str) -> List[str]:
+    return normalize_arabic(text).translate(_FOLD).split()
+
+
+class PassageIndex:
+    """Index inversé n-gramme → positions globales de mots dans le Mushaf."""
+
+    def __init__(self, corpus: Dict[int, List[dict]]):
+        self.page_ayahs = corpus
+        self.page_of: List[int] = []            # position globale → page
+        self.ayah_of: List[Tuple[int, int]] = []  # position globale → (sourate, verset)
+        self.page_start: Dict[int, int] = {}    # page → première position globale
+        self.page_len: Dict[int, int] = {}      # page → nombre de mots
+        words: List[str] = []
+
+        for page in sorted(corpus):
+            self.page_start[page] = len(words)
+            for ayah in corpus[page]:
+                for form in _index_form(ayah["text"]):
+                    words.append(form)
+                    self.page_of.append(page)
+                    self.ayah_of.append((ayah["surah"], ayah["ayah"]))
+            self.page_len[page] = len(words) - self.page_start[page]
+
+        self.postings: Dict[Tuple[str, ...], List[int]] = {}
+        for pos in range(len(words) - NGRAM_SIZE + 1):
+            self.postings.setdefault(tuple(words[pos:pos + NGRAM_SIZE]), []).append(pos)
+        self.postings = {k: v for k, v in self.postings.items() if len(v) <= MAX_POSTINGS}
+        logger.info(f"Passage index: {len(words)} mots, {len(self.postings)} n-grammes")
+
+    def page_text(self, page: int) -> Optional[str]:
+        ayahs = self.page_ayahs.get(page)
+        if not ayahs:
+            return None
+        return " ".join(a["text"] for a in ayahs)
+
+    def detect(self, transcript: str) -> Optional[dict]:
+        """
+        Retourne la plage page/verset la plus probable pour une transcription.
+
+        Returns:
+            {"page_start", "page_end", "start": [sourate, verset],
+             "end": [sourate, verset], "score", "matched", "coverage"} ou None.
+            `coverage` : part de chaque page couverte par le passage détecté.
+        """
+        words = _index_form(transcript)
+        n_grams = len(words) - NGRAM_SIZE + 1
+        if n_grams <= 0:
+            return None
+
+        hits = []
+        for j in range(n_grams):
+            positions = self.postings.get(tuple(words[j:j + NGRAM_SIZE]))
+            if positions:
+                hits.extend(positions)
+        if not hits:
+            return None
+        hits.sort()
+
+        # Fenêtre la plus dense d'une longueur ~ celle de la récitation
+        width = max(20, int(len(words) * 1.5))
+        best_count, best_lo, best_hi = 0, 0, 0
+        for lo in range(len(hits)):
+            hi = bisect.bisect_right(hits, hits[lo] + width, lo)
+            if hi - lo > best_count:
+                best_count, best_lo, best_hi = hi - lo, lo, hi
+
+        first = hits[best_lo]
+        last = min(hits[best_hi - 1] + NGRAM_SIZE - 1, len(self.page_of) - 1)
+        coverage = {}
+        for page in range(self.page_of[first], self.page_of[last] + 1):
+            if self.page_len.get(page):
+                start = self.page_start[page]
+                end = start + self.page_len[page] - 1
+                covered = min(last, end) - max(first, start) + 1
+                coverage[page] = round(max(0, covered) / self.page_len[page], 3)
+        return {
+            "page_start": self.page_of[first],
+            "page_end": self.page_of[last],
+            "start": list(self.ayah_of[first]),
+            "end": list(self.ayah_of[last]),
+            "score": round(min(1.0, best_count / n_grams), 3),
+            "matched": best_count,
+            "coverage": coverage,
+        }
+
+
+_index: Optional[PassageIndex] = None
+_build_lock = threading.Lock()
+
+
+# ── Construction ──────────────────────────────────────────────────────────────
+
+def _fetch_page_ayahs(page: int) -> Optional[List[dict]]:
+    """Texte d'une page, avec nouvelles tentatives espacées (erreur réseau, 429, 5xx)."""
+    url = f"http://api.alquran.cloud/v1/page/{page}/quran-uthmani"
+    for attempt in range(FETCH_ATTEMPTS):
+        try:
+            response = requests.get(url, timeout=10)
+            if response.status_code == 200:
+                return [
+                    {"surah": a["surah"]["number"], "ayah": a["numberInSurah"], "text": a["text"]}
+                    for a in response.json()["data"]["ayahs"]
+                ]
+            if response.status_code != 429 and response.status_code < 500:
+                return None
+            error = f"HTTP {response.status_code}"
+        except requests.RequestException as e:
+            error = str(e)
+        if attempt + 1 < FETCH_ATTEMPTS:
+            time.sleep(FETCH_BACKOFF * 2 ** attempt)
+    logger.error(f"Passage index: page {page} indisponible ({error})")
+    return None
+
+
+def _read_corpus(path: str) -> Dict[int, List[dict]]:
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            return {int(k): v for k, v in json.load(f).items()}
+    except Exception as e:
+        logger.warning(f"Passage index: corpus illisible {path} ({e}), ignoré.")
+        return {}
+
+
+def _write_corpus(path: str, corpus: Dict[int, List[dict]]):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(corpus, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _load_corpus() -> Dict[int, List[dict]]:
+    """
+    Charge le texte du Mushaf depuis le disque, complète les pages manquantes via l'API.
+
+    Les pages sont téléchargées par FETCH_WORKERS en parallèle. Un corpus
+    incomplet est conservé à part (`QURAN_TEXT_PATH.partial`) : le démarrage
+    suivant ne télécharge que ce qui manque, et QURAN_TEXT_PATH n'est écrit
+    qu'une fois les 604 pages présentes.
+    """
+    path = settings.QURAN_TEXT_PATH
+    partial_path = path + ".partial"
+    corpus = _read_corpus(path)
+    if len(corpus) < TOTAL_PAGES:
+        corpus = {**_read_corpus(partial_path), **corpus}
+
+    missing = [p for p in range(1, TOTAL_PAGES + 1) if p not in corpus]
+    if not missing:
+        return corpus
+    logger.info(f"Passage index: téléchargement de {len(missing)} pages...")
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="quran-text") as executor:
+        for page, ayahs in zip(missing, executor.map(_fetch_page_ayahs, missing)):
+            if ayahs:
+                corpus[page] = ayahs
+
+    if len(corpus) == TOTAL_PAGES:
+        _write_corpus(path, corpus)
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    else:
+        logger.warning(f"Passage index: {TOTAL_PAGES - len(corpus)} pages manquantes, corpus incomplet conservé à part.")
+        _write_corpus(partial_path, corpus)
+    return corpus
+
+
+def ensure_index() -> Optional[PassageIndex]:
+    """Construit l'index (une seule fois). Appelé dans un thread de fond au démarrage."""
+    global _index
+    if _index is not None:
+        return _index
+    with _build_lock:
+        if _index is None:
+            try:
+                start = time.perf_counter()
+                _index = PassageIndex(_load_corpus())
+                logger.info(f"Passage index prêt en {time.perf_counter() - start:.1f}s")
+            except Exception as e:
+                logger.error(f"Passage index: construction impossible ({e})")
+    return _index
+
+
+# ── API ───────────────────────────────────────────────────────────────────────
+
+def detect_passage(transcript: str) -> Optional[dict]:
+    """Détecte le passage récité ; None si l'index n'est pas (encore) disponible."""
+    if _index is None or not transcript:
+        return None
+    start = time.perf_counter()
+    detection = _index.detect(transcript)
+    logger.debug(f"Passage detection in {(time.perf_counter() - start) * 1000:.1f} ms: {detection}")
+    return detection
+
+
+def page_text(page: int) -> Optional[str]:
+    return _index.page_text(page) if _index is not None else None
+
+
+def resolve_expected_pages(page: int, transcript: str) -> Tuple[List[int], Optional[dict]]:
+    """
+    Pages à utiliser comme texte attendu pour cette récitation.
+
+    - Détection absente ou peu fiable (score sous PASSAGE_MIN_SCORE, ou
+      moins de PASSAGE_MIN_MATCHES n-grammes retrouvés) → [page]
+      (comportement historique).
+    - Passage détecté incluant `page` → la page + ses voisines récitées (extension).
+    - Passage détecté ailleurs → les pages détectées (auto-sélection).
+
+    Une page voisine n'est ajoutée que si le passage en couvre au moins
+    NEIGHBOUR_MIN_COVERAGE : un léger débordement sur la page suivante
+    ajouterait sinon toute cette page au texte attendu (ratio de /validate
+    effondré, page entière marquée manquante par /analyze).
+    """
+    detection = detect_passage(transcript)
+    if (
+        detection is None
+        or detection["score"] < settings.PASSAGE_MIN_SCORE
+        or detection["matched"] < settings.PASSAGE_MIN_MATCHES
+    ):
+        return [page], detection
+    coverage = detection["coverage"]
+    pages = [p for p in sorted(coverage) if p == page or coverage[p] >= NEIGHBOUR_MIN_COVERAGE]
+    if not pages and coverage:
+        pages = [max(coverage, key=coverage.get)]
+    if not pages or len(pages) > MAX_DETECTED_PAGES:
+        return [page], detection
+    if pages != [page]:
+        logger.info(f"Page {page} demandée, passage détecté sur {pages} ({detection['score']:.2f})")
+    return pages, detection
+
+
+def expected_text_for(pages: List[int], fetch_page_text) -> Optional[str]:
+    """Concatène le texte des pages (index local d'abord, sinon `fetch_page_text`)."""
+    texts = []
+    for p in pages:
+        text = page_text(p) or fetch_page_text(p)
+        if text:
+            texts.append(text)
+    return " ".join(texts) if texts else None
@@ -0,0 +1,185 @@
+"""
+Construction d'un prompt compact pour le coaching IA, à partir d'un diff structuré.
+
+L'ancien prompt contenait la page attendue ET la transcription complètes
+(souvent plus de 1 500 caractères arabes chacune). Sur CPU, l'évaluation du
+prompt domine la latence du LLM. On n'envoie plus que les écarts :
+
+  - passages attendus absents de la transcription ;
+  - paires de mots substitués (attendu → entendu) ;
+  - mots ajoutés par l'élève ;
+  - règles Tajwid échouées (si l'analyse détaillée est disponible).
+
+Le tout tient dans un budget de tokens (LLM_PROMPT_TOKEN_BUDGET). La troncature
+est déterministe : les sections sont remplies dans cet ordre de priorité, les
+éléments dans l'ordre du texte, et ce qui dépasse est résumé par un compteur.
+"""
+
+import difflib
+import logging
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from backend.app.core.config import settings
+from backend.app.services.vocabulary import encode_heard, normalize_heard, vocabulary
+
+logger = logging.getLogger(__name__)
+
+MAX_PASSAGE_WORDS = 8      # un passage manquant plus long est coupé au milieu
+MAX_ITEMS_PER_SECTION = 12
+
+_HEADER = """Tu es un expert Tajwid. Un élève a récité une page du Coran ; voici uniquement les écarts détectés entre le texte attendu et la transcription (textes normalisés, sans voyelles).
+
+Mots reconnus : {matched}/{total} ({percent}%).
+"""
+
+_FOOTER = """
+Explique brièvement les différences majeures. Ne sois PAS scolaire. Donne un conseil concis en français.
+
+Réponse (JSON) :
+{ "feedback": "Ton conseil ici..." }"""
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimation du nombre de tokens, sans tokenizer : ~2 caractères par token
+    pour l'arabe (mal couvert par les vocabulaires BPE), ~4 pour le reste.
+    """
+    arabic = sum(1 for c in text if "\u0600" <= c <= "\u06ff")
+    return math.ceil(arabic / 2 + (len(text) - arabic) / 4)
+
+
+def _shorten(words: Sequence[str]) -> str:
+    if len(words) <= MAX_PASSAGE_WORDS:
+        return " ".join(words)
+    head = MAX_PASSAGE_WORDS // 2
+    tail = MAX_PASSAGE_WORDS - head - 1
+    return f"{' '.join(words[:head])} … {' '.join(words[-tail:])}"
+
+
+def build_diff(
+    expected_text: str,
+    student_text: str,
+    analysis_words: Optional[List[dict]] = None,
+) -> Dict[str, list]:
+    """
+    Diff structuré attendu / entendu, alignement sur les identifiants du vocabulaire.
+
+    Returns:
+        {"missing": [str], "substituted": [(attendu, entendu)], "added": [str],
+         "rules": [(mot, "Règle (sous-type)")], "matched": int, "total": int}
+    """
+    expected = [normalize_heard(w) for w in expected_text.split()]
+    heard = [normalize_heard(w) for w in student_text.split()]
+    expected = [w for w in expected if w]
+    heard = [w for w in heard if w]
+
+    matcher = difflib.SequenceMatcher(
+        None, [vocabulary.intern(w) for w in expected], encode_heard(heard), autojunk=False
+    )
+    missing: List[str] = []
+    substituted: List[Tuple[str, str]] = []
+    added: List[str] = []
+    matched = 0
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            matched += i2 - i1
+        elif tag == "delete":
+            missing.append(_shorten(expected[i1:i2]))
+        elif tag == "insert":
+            added.append(_shorten(heard[j1:j2]))
+        else:
+            pairs = min(i2 - i1, j2 - j1)
+            substituted.extend(zip(expected[i1:i1 + pairs], heard[j1:j1 + pairs]))
+            if i2 - i1 > pairs:
+                missing.append(_shorten(expected[i1 + pairs:i2]))
+            elif j2 - j1 > pairs:
+                added.append(_shorten(heard[j1 + pairs:j2]))
+
+    rules: List[Tuple[str, str]] = []
+    for word in analysis_words or ():
+        for rule in word.get("tajweed_rules", ()):
+            if rule.get("status") != "correct":
+                label = f"{rule['rule']} ({rule['subtype']})" if rule.get("subtype") else rule["rule"]
+                rules.append((normalize_heard(word["text"]), label))
+
+    return {
+        "missing": missing,
+        "substituted": substituted,
+        "added": added,
+        "rules": rules,
+        "matched": matched,
+        "total": len(expected),
+    }
+
+
+def _section_lines(diff: Dict[str, list]) -> List[Tuple[str, List[str]]]:
+    return [
+        ("Passages oubliés :", [f"- « {p} »" for p in diff["missing"]]),
+        ("Mots remplacés (attendu → entendu) :", [f"- {e} → {h}" for e, h in diff["substituted"]]),
+        ("Règles Tajwid non appliquées :", [f"- {w} : {r}" for w, r in diff["rules"]]),
+        ("Mots ajoutés :", [f"- « {a} »" for a in diff["added"]]),
+    ]
+
+
+def build_feedback_prompt(
+    expected_text: str,
+    student_text: str,
+    similarity_ratio: float,
+    analysis_words: Optional[List[dict]] = None,
+    token_budget: Optional[int] = None,
+) -> Tuple[str, dict]:
+    """
+    Prompt de coaching compact + métadonnées de taille.
+
+    Returns:
+        (prompt, {"chars", "tokens", "items", "omitted", "budget"})
+    """
+    budget = token_budget or settings.LLM_PROMPT_TOKEN_BUDGET
+    diff = build_diff(expected_text, student_text, analysis_words)
+
+    header = _HEADER.format(
+        matched=diff["matched"], total=diff["total"], percent=int(similarity_ratio * 100)
+    )
+    used = estimate_tokens(header) + estimate_tokens(_FOOTER)
+    body: List[str] = []
+    items = omitted = 0
+
+    for title, lines in _section_lines(diff):
+        if not lines:
+            continue
+        title_cost = estimate_tokens(title) + 1
+        kept = []
+        for line in lines[:MAX_ITEMS_PER_SECTION]:
+            cost = estimate_tokens(line) + 1 + (0 if kept else title_cost)
+            if used + cost > budget:
+                break
+            kept.append(line)
+            used += cost
+        dropped = len(lines) - len(kept)
+        if kept:
+            body.append(title)
+            body.extend(kept)
+            if dropped:
+                marker = f"- … (+{dropped} autres)"
+                body.append(marker)
+                used += estimate_tokens(marker) + 1
+        items += len(kept)
+        omitted += dropped
+
+    if not body:
+        body.append("Aucun écart notable détecté.")
+
+    prompt = header + "\n" + "\n".join(body) + "\n" + _FOOTER
+    meta = {
+        "chars": len(prompt),
+        "tokens": estimate_tokens(prompt),
+        "items": items,
+        "omitted": omitted,
+        "budget": budget,
+    }
+    logger.info(
+        f"Prompt coaching : {meta['chars']} car. ≈{meta['tokens']} tokens "
+        f"({items} écarts, {omitted} omis, budget {budget})"
+    )
+    return prompt, meta
@@ -1,4 +1,3 @@
-import difflib
 import logging
 from typing import Dict, Any, List, Optional
 
@@ -52,6 +51,40 @@ def _first_letter(word: str) -> str:
     return ''
 
 
+# ── Conseils par règle ─────────────────────────────────────────────────────────
+# (réussie, absente) ; {subtype} et {letter} viennent du détecteur.
+# Partagés avec le codec d'historique, qui ne stocke que les codes des règles.
+RULE_FEEDBACK: Dict[str, tuple] = {
+    "Qalqalah": ("Qalqalah {subtype} bien appliquée sur '{letter}'.",
+                 "Appliquez le rebond (Qalqalah {subtype}) sur '{letter}'."),
+    "Noon Sakinah": ("Noon Sakinah ({subtype}) bien appliquée.",
+                     "Appliquez la règle {subtype} sur le Noon Sakinah."),
+    "Tanween": ("Tanween ({subtype}) bien appliqué.",
+                "Appliquez la règle {subtype} sur le Tanween."),
+    "Meem Sakinah": ("Meem Sakinah ({subtype}) bien appliquée.",
+                     "Appliquez la règle {subtype} sur le Meem Sakinah."),
+    "Ghunnah Mushaddada": ("Ghunnah bien nasalisée sur le {subtype} Mushaddad (2 temps).",
+                           "Nasalisez le {subtype} avec Shadda (Ghunnah 2 temps)."),
+    "Madd": ("{subtype} bien respecté.",
+             "Allongez correctement : {subtype}."),
+}
+
+
+def rule_feedback(rule: str, subtype: str, letter: str, success: bool) -> str:
+    correct, missing = RULE_FEEDBACK[rule]
+    return (correct if success else missing).format(subtype=subtype, letter=letter)
+
+
+def _rule(rule: str, subtype: str, letter: str) -> dict:
+    return {
+        "rule": rule,
+        "subtype": subtype,
+        "letter": letter,
+        "feedback_correct": rule_feedback(rule, subtype, letter, True),
+        "feedback_missing": rule_feedback(rule, subtype, letter, False),
+    }
+
+
 # ── Détecteurs de règles ───────────────────────────────────────────────────────
 
 def _detect_qalqalah(word: str) -> List[dict]:
@@ -82,13 +115,7 @@ def _detect_qalqalah(word: str) -> List[dict]:
             # Sukoon explicite → Sughra (lecture en wasl)
             # Dernière lettre sans sukoon → Kubra (sukoon implicite au waqf)
             subtype = "Sughra" if has_sukoon else "Kubra"
-            rules.append({
-                "rule": "Qalqalah",
-                "subtype": subtype,
-                "letter": char,
-                "feedback_correct": f"Qalqalah {subtype} bien appliquée sur '{char}'.",
-                "feedback_missing": f"Appliquez le rebond (Qalqalah {subtype}) sur '{char}'.",
-            })
+            rules.append(_rule("Qalqalah", subtype, char))
 
     return rules
 
@@ -123,24 +150,12 @@ def _detect_noon_sakinah(word: str, next_word: Optional[str] = None) -> List[dic
     for i, char in enumerate(chars):
         if char == NOON and i + 1 < len(chars) and chars[i + 1] == SUKOON:
             rule_type = _classify_noon_rule(next_word)
-            rules.append({
-                "rule": "Noon Sakinah",
-                "subtype": rule_type,
-                "letter": NOON,
-                "feedback_correct": f"Noon Sakinah ({rule_type}) bien appliquée.",
-                "feedback_missing": f"Appliquez la règle {rule_type} sur le Noon Sakinah.",
-            })
+            rules.append(_rule("Noon Sakinah", rule_type, NOON))
 
     # Tanween : présence d'un des marqueurs ً ٌ ٍ dans le mot
     if any(c in TANWEEN for c in chars):
         rule_type = _classify_noon_rule(next_word)
-        rules.append({
-            "rule": "Tanween",
-            "subtype": rule_type,
-            "letter": "",
-            "feedback_correct": f"Tanween ({rule_type}) bien appliqué.",
-            "feedback_missing": f"Appliquez la règle {rule_type} sur le Tanween.",
-        })
+        rules.append(_rule("Tanween", rule_type, ""))
 
     return rules
 
@@ -165,13 +180,7 @@ def _detect_meem_sakinah(word: str, next_word: Optional[str] = None) -> List[dic
     for i, char in enumerate(chars):
         if char == MEEM and i + 1 < len(chars) and chars[i + 1] == SUKOON:
             rule_type = _classify_meem_rule(next_word)
-            rules.append({
-                "rule": "Meem Sakinah",
-                "subtype": rule_type,
-                "letter": MEEM,
-                "feedback_correct": f"Meem Sakinah ({rule_type}) bien appliquée.",
-                "feedback_missing": f"Appliquez la règle {rule_type} sur le Meem Sakinah.",
-            })
+            rules.append(_rule("Meem Sakinah", rule_type, MEEM))
 
     return rules
 
@@ -197,13 +206,7 @@ def _detect_ghunnah_mushaddada(word: str) -> List[dict]:
             j += 1
         if has_shadda:
             letter_name = "Noon" if char == NOON else "Meem"
-            rules.append({
-                "rule": "Ghunnah Mushaddada",
-                "subtype": letter_name,
-                "letter": char,
-                "feedback_correct": f"Ghunnah bien nasalisée sur le {letter_name} Mushaddad (2 temps).",
-                "feedback_missing": f"Nasalisez le {letter_name} avec Shadda (Ghunnah 2 temps).",
-            })
+            rules.append(_rule("Ghunnah Mushaddada", letter_name, char))
 
     return rules
 
@@ -254,13 +257,7 @@ def _detect_madd(word: str, next_word: Optional[str] = None) -> List[dict]:
         else:
             madd_type = "Madd Tabii (2 temps)"
 
-        rules.append({
-            "rule": "Madd",
-            "subtype": madd_type,
-            "letter": char,
-            "feedback_correct": f"{madd_type} bien respecté.",
-            "feedback_missing": f"Allongez correctement : {madd_type}.",
-        })
+        rules.append(_rule("Madd", madd_type, char))
 
     return rules
 
@@ -313,18 +310,13 @@ class TajweedEngine:
         Returns:
             {"valid": bool, "confidence": float, "rules": [...]}
         """
-        from backend.app.services.quran import normalize_arabic
+        from backend.app.services.vocabulary import cached_ratio
 
         config = TajweedEngine.LEVEL_CONFIGS.get(level, TajweedEngine.LEVEL_CONFIGS[1])
 
         # ── 1. Correspondance textuelle ────────────────────────────────────────
-        norm_expected = normalize_arabic(word_expected)
-        norm_student  = normalize_arabic(word_student) if word_student else ""
-
-        text_similarity = (
-            difflib.SequenceMatcher(None, norm_expected, norm_student).ratio()
-            if norm_student else 0.0
-        )
+        # Normalisation et score mis en cache entre requêtes (vocabulaire interné)
+        text_similarity = cached_ratio(word_expected, word_student) if word_student else 0.0
         is_valid = text_similarity >= config["threshold_per_word"]
 
         # ── 2. Détection et vérification des règles Tajwid ────────────────────
@@ -345,6 +337,7 @@ class TajweedEngine:
                 rules_results.append({
                     "rule": rule_info["rule"],
                     "subtype": rule_info.get("subtype", ""),
+                    "letter": rule_info.get("letter", ""),
                     "status": "correct" if success else "absent",
                     "confidence": confidence,
                     "feedback": (
@@ -162,17 +162,29 @@ def download_frontend_update(url: str, new_version: str) -> None:
             with open(zip_path, "wb") as f:
                 f.write(resp.read())
 
-        # Replace static dir
-        if os.path.exists(static_path):
-            shutil.rmtree(static_path)
+        # Extract next to the live dir, then swap the two with renames
+        staging_path = static_path + ".new"
+        old_path = static_path + ".old"
+        for leftover in (staging_path, old_path):
+            if os.path.exists(leftover):
+                shutil.rmtree(leftover, ignore_errors=True)
 
         with zipfile.ZipFile(zip_path, "r") as zf:
-            zf.extractall(static_path)
+            zf.extractall(staging_path)
 
         # Record the installed frontend version
-        with open(os.path.join(static_path, "frontend_version.txt"), "w", encoding="utf-8") as f:
+        with open(os.path.join(staging_path, "frontend_version.txt"), "w", encoding="utf-8") as f:
             f.write(new_version)
 
+        if os.path.exists(static_path):
+            os.replace(static_path, old_path)
+        os.replace(staging_path, static_path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+        # Requests are served from the in-memory manifest: swap it for the new frontend
+        from backend.app.core.static_manifest import static_site
+        static_site.reload()
+
         os.remove(zip_path)
         _state["frontend_updated"] = True
         logger.info(f"Updater: frontend updated to {new_version}")
@@ -0,0 +1,142 @@
+"""
+Vocabulaire du Coran interné en identifiants entiers + caches inter-requêtes.
+
+Le vocabulaire coranique est petit et fixe : الله, الذين, من… reviennent sur
+presque chaque page. Plutôt que de re-normaliser et re-comparer les mêmes
+chaînes à chaque requête :
+
+  - chaque mot attendu (Uthmani) est normalisé une seule fois puis interné
+    en un entier stable pour toute la durée du processus ;
+  - les mots entendus (sortie Whisper, non bornée) passent par un cache LRU
+    borné mot brut → forme normalisée ;
+  - les scores (id attendu, forme entendue) → similarité sont partagés
+    entre toutes les requêtes via un second cache LRU borné ;
+  - l'alignement se fait sur des listes d'entiers (hash et égalité O(1)).
+
+`cache_stats()` expose les taux de succès ; `bench_vocabulary.py` rejoue un
+fichier de transcriptions pour mesurer les caches chauds.
+"""
+
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from backend.app.core.cache import LRUCache
+from backend.app.core.config import settings
+from backend.app.services.quran import normalize_arabic
+from backend.app.services.similarity import indel_ratio, word_similarity
+
+
+class Vocabulary:
+    """Table d'internement forme normalisée ↔ identifiant entier (croissante, jamais purgée)."""
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._forms: List[str] = []
+        self._raw: Dict[str, int] = {}   # mot Uthmani brut → id de sa forme normalisée
+        self._lock = threading.Lock()
+
+    def intern(self, form: str) -> int:
+        word_id = self._ids.get(form)
+        if word_id is not None:
+            return word_id
+        with self._lock:
+            word_id = self._ids.get(form)
+            if word_id is None:
+                word_id = len(self._forms)
+                self._forms.append(form)
+                self._ids[form] = word_id
+            return word_id
+
+    def intern_raw(self, word: str) -> int:
+        """Interne un mot attendu brut (avec diacritiques) ; normalisation faite une seule fois."""
+        word_id = self._raw.get(word)
+        if word_id is None:
+            word_id = self.intern(normalize_arabic(word))
+            self._raw[word] = word_id
+        return word_id
+
+    def get(self, form: str) -> Optional[int]:
+        return self._ids.get(form)
+
+    def form(self, word_id: int) -> str:
+        return self._forms[word_id]
+
+    def __len__(self) -> int:
+        return len(self._forms)
+
+
+vocabulary = Vocabulary()
+
+# Mot Whisper brut → forme normalisée (borné : la sortie Whisper n'est pas un vocabulaire fermé)
+_heard_forms = LRUCache(maxsize=settings.HEARD_WORDS_CACHE_SIZE)
+# (id attendu, forme entendue) → (indel_ratio, word_similarity)
+_scores = LRUCache(maxsize=settings.SIMILARITY_CACHE_SIZE)
+
+
+# ── Encodage ──────────────────────────────────────────────────────────────────
+
+def normalize_heard(word: str) -> str:
+    """Forme normalisée d'un mot entendu, via le cache LRU borné."""
+    return _heard_forms.get_or_compute(word, lambda: normalize_arabic(word))
+
+
+def encode_expected(words: Sequence[str]) -> List[int]:
+    """Mots attendus bruts → identifiants du vocabulaire."""
+    return [vocabulary.intern_raw(w) for w in words]
+
+
+def encode_heard(forms: Sequence[str]) -> List[int]:
+    """
+    Formes entendues normalisées → identifiants.
+
+    Une forme connue du vocabulaire reçoit son id ; une forme inconnue reçoit
+    un id négatif, stable au sein de l'appel, sans polluer le vocabulaire.
+    """
+    unknown: Dict[str, int] = {}
+    ids = []
+    for form in forms:
+        word_id = vocabulary.get(form)
+        if word_id is None:
+            word_id = unknown.setdefault(form, -1 - len(unknown))
+        ids.append(word_id)
+    return ids
+
+
+# ── Scores mis en cache ───────────────────────────────────────────────────────
+
+def word_scores(expected_id: int, heard_form: str) -> Tuple[float, float]:
+    """(indel_ratio, word_similarity) entre un mot du vocabulaire et une forme entendue."""
+    key = (expected_id, heard_form)
+    scores = _scores.get(key)
+    if scores is None:
+        expected_form = vocabulary.form(expected_id)
+        scores = (indel_ratio(expected_form, heard_form), word_similarity(expected_form, heard_form))
+        _scores.put(key, scores)
+    return scores
+
+
+def cached_word_similarity(expected_form: str, heard_form: str) -> float:
+    """`word_similarity` pour deux formes déjà normalisées, via le cache partagé."""
+    return word_scores(vocabulary.intern(expected_form), heard_form)[1]
+
+
+def cached_ratio(expected_word: str, heard_word: str) -> float:
+    """`indel_ratio` entre un mot attendu brut et un mot entendu brut, via les caches."""
+    heard_form = normalize_heard(heard_word)
+    if not heard_form:
+        return 0.0
+    return word_scores(vocabulary.intern_raw(expected_word), heard_form)[0]
+
+
+def cache_stats() -> dict:
+    return {
+        "vocabulary_size": len(vocabulary),
+        "heard_forms": _heard_forms.stats(),
+        "scores": _scores.stats(),
+    }
+
+
+def reset_caches() -> None:
+    """Vide les caches LRU (le vocabulaire interné est conservé)."""
+    _heard_forms.clear()
+    _scores.clear()
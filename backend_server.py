@@ -61,14 +61,14 @@ except ImportError:
     GDRIVE_AVAILABLE = False
     logger.warning("Google Drive libraries not found. Sync will be disabled. (Install google-auth-oauthlib and google-api-python-client)")
 
-from fastapi import FastAPI, UploadFile, File, Form, Depends, HTTPException, status
+from fastapi import FastAPI, UploadFile, File, Form, Depends, HTTPException, Header, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import JSONResponse, FileResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 
 from sqlalchemy.orm import Session
-from passlib.context import CryptContext
 from pydantic import BaseModel
 from jose import JWTError, jwt
 import passlib.handlers.argon2
@@ -76,13 +76,34 @@ import passlib.handlers.bcrypt
 
 # Import Database Models
 import database
-from database import User, Progress, Recording, SessionLocal, engine
+from database import User, Progress, Recording, RuleStat, PageStat, SessionLocal, engine, write_behind
 
 # Create Tables
 database.Base.metadata.create_all(bind=engine)
 
 # --- Migration ---
-from sqlalchemy import text
+from sqlalchemy import func, text
+from backend.app.core.migrations import ensure_schema
+from backend.app.core.engine_profile import apply_threadpool_budget, db_metrics
+from backend.app.core.upsert import upsert_progress, progress_changes, progress_version
+from backend.app.core.progress_snapshot import TOTAL_PAGES, build_snapshot, etag_matches, snapshot_etag
+from backend.app.core.rule_stats import page_entry, record_recitation, rule_entry
+from backend.app.core.activity import ActivityTracker, current_streak, streak_after_activity
+from backend.app.core.principal import Principal, principal_cache
+from backend.app.core.passwords import password_hasher
+from backend.app.core.pagination import NEXT_CURSOR_HEADER, history_after, history_order, page_size, split_page, users_after
+from backend.app.core.config import settings as app_settings
+from backend.app.core.recording_store import RecordingStore, db_path, is_key, key_etag, key_of, media_type
+from backend.app.core.file_responses import IMMUTABLE, PRIVATE_IMMUTABLE, REVALIDATE, file_index, serve_file
+from backend.app.services import page_images
+from backend.app.core.maintenance import RecordingMaintenance
+
+# Enregistrements : stockage adressé par contenu, en sous-dossiers (écriture atomique, déduplication)
+recording_store = RecordingStore(RECORDINGS_DIR)
+recording_maintenance = RecordingMaintenance(recording_store, SessionLocal, Recording, User)
+
+# Streak : un événement d'activité par utilisateur et par jour, écrit par le write-behind
+activity = ActivityTracker(write_behind, User)
 
 def run_migrations():
     with engine.begin() as conn:
@@ -107,6 +128,8 @@ def run_migrations():
             conn.execute(text("ALTER TABLE recordings ADD COLUMN details TEXT"))
             print("Migration: Added details column to recordings.")
         except Exception: pass
+    # Colonnes de sync delta + index unique (user_id, page_number) pour les upserts + index de l'historique
+    ensure_schema(engine)
 
 run_migrations()
 
@@ -117,7 +140,6 @@ SECRET_KEY = "super_secret_key_for_local_app_only" # In prod, use env var
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7 # 1 week expiration for convenience
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/token")
 
 # --- Dependency ---
@@ -128,26 +150,17 @@ def get_db():
     finally:
         db.close()
 
-# Endpoint dédié pour servir les enregistrements audio avec les bons headers
+# Endpoint dédié pour servir les enregistrements audio (ETag, Range, cache)
 @app.get("/recordings/{filename}")
-async def serve_recording(filename: str):
-    file_path = os.path.join(RECORDINGS_DIR, filename)
-    if not os.path.exists(file_path):
+def serve_recording(filename: str, request: Request):
+    # Clé de contenu (sous-dossiers) ou ancien nom à plat pas encore migré
+    file_path = recording_store.path(filename)
+    info = file_index.info(file_path, etag=key_etag(filename)) if file_path else None
+    if info is None:
         raise HTTPException(status_code=404, detail=f"Recording not found: {filename}")
-    # Déterminer le bon content type
-    if filename.endswith(".webm"):
-        media_type = "audio/webm"
-    elif filename.endswith(".wav"):
-        media_type = "audio/wav"
-    elif filename.endswith(".mp3"):
-        media_type = "audio/mpeg"
-    else:
-        media_type = "application/octet-stream"
-    response = FileResponse(file_path, media_type=media_type, filename=filename)
-    # Headers pour permettre le streaming audio (Accept-Ranges, pas de cache)
-    response.headers["Accept-Ranges"] = "bytes"
-    response.headers["Cache-Control"] = "no-cache"
-    return response
+    # Une clé de contenu ne change jamais sous son URL ; les anciens noms sont revalidés (ETag)
+    cache_control = PRIVATE_IMMUTABLE if is_key(filename) else REVALIDATE
+    return serve_file(request, info, media_type(filename), cache_control, offload_path=db_path(filename))
 
 logger.info(f"Serving recordings from: {RECORDINGS_DIR} via /recordings/ endpoint")
 logger.info(f"Quran pages dir: {QURAN_PAGES_DIR}")
@@ -169,6 +182,7 @@ class ProgressItem(BaseModel):
 
 class SyncRequest(BaseModel):
     progress: List[ProgressItem]
+    since: Optional[int] = None  # curseur du client (dernière version reçue) ; absent = sync complète
 
 class UserSettings(BaseModel):
     mushaf_type: Optional[str] = None
@@ -186,11 +200,10 @@ class GDriveSyncRequest(BaseModel):
     action: str # "upload" or "download"
 
 # --- Helper Functions (Moved up to avoid NameError) ---
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
+# Argon2 sur l'exécuteur borné partagé (backend/app/core/passwords.py) :
+# une rafale de connexions ne prend pas tous les cœurs aux analyses
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return password_hasher.hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -202,7 +215,12 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Principal:
+    # Principal en cache (TTL court, invalidé sur changement de réglages / suppression) :
+    # la plupart des requêtes ne décodent pas le JWT et ne lisent pas la table users
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -215,10 +233,13 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
             raise credentials_exception
     except JWTError:
         raise credentials_exception
+    epoch = principal_cache.epoch
     user = db.query(User).filter(User.username == username).first()
     if user is None:
         raise credentials_exception
-    return user
+    principal = Principal.from_user(user)
+    principal_cache.put(token, principal, payload.get("exp"), epoch)
+    return principal
 
 # --- Google Drive Service (Placeholder) ---
 # Note: Integration requires google-api-python-client & oauthlib
@@ -319,7 +340,7 @@ class GDriveService:
 gdrive_service = GDriveService()
 
 @app.post("/gdrive/sync")
-async def gdrive_sync(request: GDriveSyncRequest, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def gdrive_sync(request: GDriveSyncRequest, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
     db_path = os.path.join(BASE_DIR, "quran_app.db")
     
     if request.action == "upload":
@@ -333,13 +354,13 @@ async def gdrive_sync(request: GDriveSyncRequest, current_user: User = Depends(g
 
 # --- Goals Endpoints ---
 @app.get("/goals")
-async def get_goals(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_goals(current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
     # Simulating goals for now - could be added to database.py later
     # For now, we use a simple list or just return empty
     return {"goals": []}
 
 @app.post("/goals")
-async def create_goal(goal: GoalCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def create_goal(goal: GoalCreate, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
     return {"status": "success", "goal": goal}
 
 # Enable CORS
@@ -349,6 +370,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Fix MIME Types for Windows
@@ -367,6 +389,11 @@ except Exception as e:
 
 OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434/api/generate")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.1:8b")
+
+# Client Ollama partagé (pool de connexions, limite de concurrence, disjoncteur)
+from backend.app.services.ollama_client import ollama, OllamaUnavailable
+from backend.app.services.feedback_cache import feedback_cache, feedback_signature
+from backend.app.services.llm_tiering import governor, PRIMARY, TEMPLATE
 RUNNING_IN_DOCKER = os.getenv("RUNNING_IN_DOCKER", "false").lower() == "true"
 
 def ensure_ffmpeg_ready():
@@ -451,6 +478,9 @@ def ensure_model_pulled(model_name):
             print(f"Modèle {model_name} prêt.")
         else:
             print(f"Modèle {model_name} déjà disponible.")
+        # Charger le modèle en mémoire et le garder résident entre les appels
+        from backend.app.services.feedback import preload_model
+        preload_model(model_name)
     except Exception as e:
         print(f"Erreur lors de la vérification/téléchargement du modèle : {e}")
 
@@ -461,26 +491,27 @@ async def favicon():
 
 @app.get("/quran_pages/{page_request}")
 @app.get("/api/v1/quran_pages/{page_request}")
-async def get_quran_page(page_request: str):
-    # The frontend requests /api/v1/quran_pages/{page}.jpg
+def get_quran_page(page_request: str, request: Request, w: Optional[int] = None, fmt: Optional[str] = Query(None, alias="format")):
+    # The frontend requests /api/v1/quran_pages/{page}.jpg[?w=480&format=webp]
     # Files on disk: Quran_Page_003.jpg = Page 1, so page N -> Quran_Page_{N+2}.jpg
     try:
-        clean_name = page_request.split('.')[0]
-        page_num = int(clean_name)
-        
-        # Mapping: page 1 -> file 003, page 2 -> 004, etc.
-        target_num = page_num + 2
-        filename = f"Quran_Page_{str(target_num).zfill(3)}.jpg"
-        
-        file_path = os.path.join(QURAN_PAGES_DIR, filename)
-        logger.info(f"Looking for quran page: {file_path} (exists: {os.path.exists(file_path)})")
-        if os.path.exists(file_path):
-            return FileResponse(file_path, media_type="image/jpeg")
-            
-    except Exception as e:
-        logger.error(f"Error serving local page {page_request}: {e}")
-        
-    raise HTTPException(status_code=404, detail=f"Page image not found: {page_request}")
+        page_num = int(page_request.split('.')[0])
+    except ValueError:
+        raise HTTPException(status_code=404, detail=f"Page image not found: {page_request}")
+
+    filename = page_images.page_filename(page_num)
+    # Format (Accept ou ?format=) et largeur (?w=) : dérivés WebP / AVIF mis en cache sur disque
+    variant, from_accept = page_images.negotiate(request.headers.get("accept", ""), fmt, w)
+    # Images immuables : stat et hash une seule fois, puis 304 / cache navigateur
+    resolved = page_images.resolve(filename, variant, QURAN_PAGES_DIR)
+    if resolved is None:
+        raise HTTPException(status_code=404, detail=f"Page image not found: {page_request}")
+    info, variant = resolved
+    return serve_file(
+        request, info, variant.media_type, IMMUTABLE,
+        offload_path=page_images.offload_path(info.path, variant),
+        extra_headers={"Vary": "Accept"} if from_accept else None,
+    )
 
 # --- Auth Endpoints ---
 
@@ -507,12 +538,19 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
 @app.post("/api/v1/auth/token", response_model=Token)
 def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     user = db.query(User).filter(User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    valid, new_hash = False, None
+    if user:
+        valid, new_hash = password_hasher.verify_and_update(form_data.password, user.hashed_password)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        # Hash créé avec d'autres paramètres Argon2 : mis à niveau maintenant qu'on a le mot de passe
+        user.hashed_password = new_hash
+        db.commit()
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user.username}, expires_delta=access_token_expires
@@ -520,64 +558,65 @@ def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db:
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/api/v1/users/me")
-async def read_users_me(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    # Logique de Streak
-    now = datetime.now(timezone.utc).replace(tzinfo=None) # Simplification pour SQLite
-    today = now.date()
-    
-    if current_user.last_active_date:
-        last_active = current_user.last_active_date.date()
-        diff = (today - last_active).days
-        
-        if diff == 1:
-            current_user.daily_streak += 1
-            current_user.last_active_date = now
-        elif diff > 1:
-            current_user.daily_streak = 1
-            current_user.last_active_date = now
-        # Si diff == 0, on ne change rien au streak aujourd'hui
-    else:
-        current_user.daily_streak = 1
-        current_user.last_active_date = now
-    
-    db.commit()
-
+async def read_users_me(current_user: Principal = Depends(get_current_user)):
+    # Lecture pure : le streak est tenu à jour par les événements d'activité (POST /me/activity)
+    today = datetime.now(timezone.utc).date()
     return {
         "username": current_user.username, 
         "id": current_user.id,
         "mushaf_type": current_user.mushaf_type or "madani",
         "difficulty_level": current_user.difficulty_level or 1,
-        "daily_streak": current_user.daily_streak,
+        "daily_streak": current_streak(current_user.daily_streak, current_user.last_active_date, today),
         "last_active_date": current_user.last_active_date
     }
 
+@app.post("/api/v1/users/me/activity")
+async def record_activity(current_user: Principal = Depends(get_current_user)):
+    # Au plus une écriture (write-behind) par utilisateur et par jour, quel que soit le nombre d'appels
+    now = datetime.now(timezone.utc).replace(tzinfo=None) # Simplification pour SQLite
+    activity.record(current_user.id, now)
+    return {"daily_streak": streak_after_activity(current_user.daily_streak, current_user.last_active_date, now.date())}
+
 class SettingsUpdate(BaseModel):
     mushaf_type: str
     difficulty_level: int
 
 @app.put("/api/v1/users/me/settings")
-async def update_settings(settings: SettingsUpdate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    current_user.mushaf_type = settings.mushaf_type
-    current_user.difficulty_level = settings.difficulty_level
+async def update_settings(settings: SettingsUpdate, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    db.query(User).filter(User.id == current_user.id).update(
+        {"mushaf_type": settings.mushaf_type, "difficulty_level": settings.difficulty_level}
+    )
     db.commit()
+    principal_cache.invalidate(current_user.id)
     return {
         "status": "updated", 
-        "mushaf_type": current_user.mushaf_type,
-        "difficulty_level": current_user.difficulty_level
+        "mushaf_type": settings.mushaf_type,
+        "difficulty_level": settings.difficulty_level
     }
 
 @app.delete("/api/v1/users/me")
-async def delete_user(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    # Supprimer d'abord la progression associée
+async def delete_user(current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    # Supprimer d'abord la progression et les statistiques associées
     db.query(Progress).filter(Progress.user_id == current_user.id).delete()
+    db.query(RuleStat).filter(RuleStat.user_id == current_user.id).delete()
+    db.query(PageStat).filter(PageStat.user_id == current_user.id).delete()
     # Supprimer l'utilisateur
-    db.delete(current_user)
+    db.query(User).filter(User.id == current_user.id).delete()
     db.commit()
+    principal_cache.invalidate(current_user.id)
     return {"status": "user deleted"}
 
 @app.get("/api/v1/users/all")
-def get_all_users(db: Session = Depends(get_db)):
-    users = db.query(User).all()
+def get_all_users(response: Response, limit: Optional[int] = None, cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    # Pagination par clé (id) : le curseur de la page suivante est dans X-Next-Cursor
+    size = page_size(limit, app_settings.USERS_PAGE_SIZE, app_settings.USERS_MAX_PAGE_SIZE)
+    query = db.query(User.id, User.username)
+    after = users_after(User, cursor)
+    if after is not None:
+        query = query.filter(after)
+    users, next_cursor = split_page(query.order_by(User.id).limit(size + 1).all(), size, lambda u: (u.id,))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     return [{"id": u.id, "username": u.username} for u in users]
 
 @app.delete("/admin/users/{user_id}")
@@ -585,91 +624,130 @@ def admin_delete_user(user_id: int, db: Session = Depends(get_db)):
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
-    # Supprimer la progression
+    # Supprimer la progression et les statistiques
     db.query(Progress).filter(Progress.user_id == user_id).delete()
+    db.query(RuleStat).filter(RuleStat.user_id == user_id).delete()
+    db.query(PageStat).filter(PageStat.user_id == user_id).delete()
     # Supprimer l'utilisateur
     db.delete(user)
     db.commit()
+    principal_cache.invalidate(user_id)
     return {"status": "utilisateurs supprimé"}
 
+@app.get("/api/v1/users/me/stats")
+def read_user_stats(weak_pages: Optional[int] = None, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    # Agrégats précalculés (core/rule_stats.py) : indépendants du nombre d'enregistrements
+    user_id = current_user.id
+    rules = db.query(RuleStat).filter(RuleStat.user_id == user_id).all()
+    rules = sorted((rule_entry(r) for r in rules), key=lambda r: (r["success_rate"], -r["attempts"]))
+    limit = page_size(weak_pages, app_settings.STATS_WEAK_PAGES, TOTAL_PAGES)
+    pages = db.query(PageStat).filter(PageStat.user_id == user_id).order_by(PageStat.score, PageStat.page_number).limit(limit).all()
+    totals = db.query(func.count(PageStat.id), func.coalesce(func.sum(PageStat.attempts), 0)).filter(PageStat.user_id == user_id).one()
+    return {
+        "rules": rules,
+        "weak_pages": [page_entry(p) for p in pages],
+        "pages_recited": totals[0],
+        "recitations": totals[1],
+    }
+
 
 # --- Sync Endpoints ---
 
 @app.get("/api/v1/users/me/progress")
-def get_user_progress(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_user_progress(current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
     progress_items = db.query(Progress).filter(Progress.user_id == current_user.id).all()
     # return {str(item.page_number): item.status for item in progress_items}
     # Wait, the frontend might expect integer keys or string keys. page.tsx uses parseInt(page).
     # { "1": "mastered" } is fine.
     return {str(item.page_number): item.status for item in progress_items}
 
+@app.get("/api/v1/users/me/progress/snapshot")
+def get_progress_snapshot(packed: bool = False, if_none_match: Optional[str] = Header(None), current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Progression compacte (604 slots, agrégats juz/sourate) pour la vue immeuble.
+    L'ETag suit la version de progression : sans changement → 304 sans lire la table.
+    """
+    version = progress_version(db, Progress, current_user.id)   # lu en base : le principal en cache peut être en retard
+    etag = snapshot_etag(current_user.id, version, packed)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    rows = db.query(Progress.page_number, Progress.status).filter(Progress.user_id == current_user.id).all()
+    return JSONResponse(build_snapshot(rows, version, packed), headers=headers)
+
 @app.post("/api/v1/users/me/progress")
-def update_user_progress(item: ProgressItem, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    existing = db.query(Progress).filter(
-        Progress.user_id == current_user.id,
-        Progress.page_number == item.page
-    ).first()
-    
-    if existing:
-        existing.status = str(item.status)
-        existing.last_updated = datetime.now(timezone.utc)
-    else:
-        new_prog = Progress(
-            user_id=current_user.id,
-            page_number=item.page,
-            status=str(item.status)
-        )
-        db.add(new_prog)
-    
+def update_user_progress(item: ProgressItem, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    upsert_progress(db, Progress, current_user.id, [(item.page, item.status)])
     db.commit()
+    activity.record(current_user.id, datetime.now(timezone.utc).replace(tzinfo=None))
     return {"status": "updated", "page": item.page, "new_status": item.status}
 
+def _sync_items(rows):
+    return [{"page": page, "status": status, "version": version} for page, status, version in rows]
+
 @app.get("/sync_progress")
-def get_sync_progress(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    progress_items = db.query(Progress).filter(Progress.user_id == current_user.id).all()
-    return {
-        "progress": [
-            {"page": item.page_number, "status": item.status} for item in progress_items
-        ]
-    }
+def get_sync_progress(since: Optional[int] = None, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Sync delta : avec `since`, seules les pages modifiées après cette version
+    sont renvoyées (index (user_id, version)) ; sans, toute la progression.
+    `cursor` est la version à renvoyer au prochain appel.
+    """
+    cursor = progress_version(db, Progress, current_user.id)
+    if since is None:
+        progress_items = db.query(Progress).filter(Progress.user_id == current_user.id).all()
+        rows = [(item.page_number, item.status, item.version or 0) for item in progress_items]
+    else:
+        rows = progress_changes(db, Progress, current_user.id, since)
+    return {"progress": _sync_items(rows), "cursor": cursor}
 
 @app.post("/sync_progress")
-def sync_progress(data: SyncRequest, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    # Simple strategy: Overwrite or Merge. Let's Merge/Update.
-    for item in data.progress:
-        existing = db.query(Progress).filter(
-            Progress.user_id == current_user.id,
-            Progress.page_number == item.page
-        ).first()
-        
-        if existing:
-            existing.status = str(item.status)
-            existing.last_updated = datetime.now(timezone.utc)
-        else:
-            new_prog = Progress(
-                user_id=current_user.id,
-                page_number=item.page,
-                status=str(item.status)
-            )
-            db.add(new_prog)
-    
+def sync_progress(data: SyncRequest, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Applique les changements du client en un seul upsert groupé, puis renvoie
+    les changements du serveur depuis `since` (hors ceux que le client vient
+    d'envoyer) et le nouveau curseur. Dernière écriture gagnante.
+    """
+    version = upsert_progress(db, Progress, current_user.id, [(item.page, item.status) for item in data.progress])
+    changes = []
+    if data.since is not None:
+        changes = progress_changes(db, Progress, current_user.id, data.since, exclude_version=version)
+    cursor = version if version is not None else progress_version(db, Progress, current_user.id)
     db.commit()
-    return {"status": "synced"}
+    if version is not None:
+        activity.record(current_user.id, datetime.now(timezone.utc).replace(tzinfo=None))
+    return {"status": "synced", "applied": len(data.progress), "changes": _sync_items(changes), "cursor": cursor}
 
 @app.get("/api/v1/recitation/history/{page}")
-def get_recording_history(page: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_recording_history(
+    page: int,
+    response: Response,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Pagination par clé (timestamp, id) : le curseur de la page suivante est dans X-Next-Cursor
+    size = page_size(limit, app_settings.HISTORY_PAGE_SIZE, app_settings.HISTORY_MAX_PAGE_SIZE)
+    after = history_after(Recording, cursor)
     try:
-        recordings = db.query(Recording).filter(
+        query = db.query(Recording).filter(
             Recording.user_id == current_user.id,
             Recording.page_number == page
-        ).order_by(Recording.timestamp.desc()).limit(10).all()
+        )
+        if after is not None:
+            query = query.filter(after)
+        recordings, next_cursor = split_page(
+            query.order_by(*history_order(Recording)).limit(size + 1).all(), size, lambda r: (r.timestamp, r.id)
+        )
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
         
         history = []
         for r in recordings:
             # Reconstruire l'URL manuellement car r.file_path peut contenir un chemin relatif ou absolu
-            filename = os.path.basename(r.file_path)
-            # URL relative pour pointer vers le point de montage /recordings/
-            url = f"/recordings/{filename}"
+            filename = key_of(r.file_path)
+            # URL relative pour pointer vers le point de montage /recordings/ (None : audio purgé par la rétention)
+            url = f"/recordings/{filename}" if filename else None
             
             # Parsing sécurisé des détails
             details = []
@@ -713,19 +791,17 @@ def get_quran_page_text(page_number):
 async def validate_recitation(
     page: int = Form(...), 
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     print(f"Received request for Page {page}")
     
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"page_{page}_{timestamp}.webm"
-    file_path = os.path.join(RECORDINGS_DIR, filename)
-    
+    filename = ""
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
+        # Écriture atomique (fichier temporaire + renommage), nommée par le hash du contenu
+        stored = await run_in_threadpool(recording_store.save, file.file)
+        file_path, filename = stored.path, stored.key
+
         logger.info(f"File saved: {file_path}")
         
         # 2. Transcription Whisper
@@ -745,7 +821,12 @@ async def validate_recitation(
                 "details": []
             }
 
-        expected_text = get_quran_page_text(page)
+        # Auto-détection du passage récité (mauvaise page ou débordement sur la suivante)
+        from backend.app.services.passage_index import resolve_expected_pages, expected_text_for
+        pages, detected_passage = resolve_expected_pages(page, transcribed_text)
+        recorded_page = page if page in pages else pages[0]
+
+        expected_text = expected_text_for(pages, get_quran_page_text)
         if not expected_text:
             return {"valid": True, "feedback": "Texte Coranique introuvable, validation simulée.", "audio_url": f"/recordings/{filename}", "details": []}
 
@@ -804,8 +885,9 @@ async def validate_recitation(
         #  - Récitation en continu sans pause entre versets
         #  - Fenêtre de recherche large pour décalages Whisper
         # ============================================================
-        import difflib
-        
+        from backend.app.services.similarity import best_match_in_window
+        from backend.app.services.vocabulary import cached_word_similarity
+
         expected_words = clean_expected.split()
         student_words = clean_student.split()
         n_student = len(student_words)
@@ -813,49 +895,20 @@ async def validate_recitation(
         # Seuil de similarité pour valider un match
         FUZZY_THRESHOLD = 0.40  # Réajusté (0.40) : compromis entre rigueur et tolérance aux erreurs Whisper
         
-        def word_similarity(a, b):
-            """Similarité entre deux mots arabes normalisés.
-            Combine ratio de séquence + heuristique trigrammes."""
-            if a == b:
-                return 1.0
-            if not a or not b:
-                return 0.0
-            # Bonus si l'un contient l'autre (ex: "وسوس" dans "يوسوس")
-            if a in b or b in a:
-                return 0.80
-            # Heuristique trigrammes
-            min_len = min(len(a), len(b))
-            if min_len >= 3:
-                trigrams_a = {a[i:i+3] for i in range(len(a)-2)}
-                trigrams_b = {b[i:i+3] for i in range(len(b)-2)}
-                shared = trigrams_a & trigrams_b
-                if shared:
-                    trigram_score = len(shared) / max(len(trigrams_a), len(trigrams_b), 1)
-                    return max(difflib.SequenceMatcher(None, a, b).ratio(), trigram_score * 0.8)
-            return difflib.SequenceMatcher(None, a, b).ratio()
-        
         def find_best_match_in_window(expected_w, student_list, cursor, window_forward=40, window_back=5):
             """
             Cherche le meilleur match dans une fenêtre, autorisant un léger recul
             pour les bégaiements ou erreurs de segmentation Whisper.
+            La fenêtre entière est scorée par le noyau bit-parallèle (services/similarity.py).
             """
-            best_score = 0.0
-            best_idx = -1
             # Ajustement : mots courts (particules) restent un peu plus strictes
             min_score = FUZZY_THRESHOLD if len(expected_w) > 2 else 0.50
-            
-            search_start = max(0, cursor - window_back)
-            search_end = min(n_student, cursor + window_forward)
-            
-            for i in range(search_start, search_end):
-                s = word_similarity(expected_w, student_list[i])
-                if s > best_score:
-                    best_score = s
-                    best_idx = i
-            
-            if best_score >= min_score:
-                return best_idx, best_score
-            return -1, best_score
+            return best_match_in_window(
+                expected_w, student_list,
+                cursor - window_back, cursor + window_forward,
+                min_score,
+                scorer=cached_word_similarity,
+            )
         
         # Alignement flou séquentiel avec curseur souple
         matched_count = 0
@@ -899,8 +952,12 @@ async def validate_recitation(
         
         logger.info(f"Missing passages ({len(missing_passages)}): {missing_passages}")
 
+        # Signature des mots non retrouvés (clé du cache de feedback IA)
+        missing_indices = [i for i, (_, matched, _) in enumerate(word_matches) if not matched]
+
         is_valid = False
         feedback_text = ""
+        feedback_tier = "static"
         details_list = []
         
         # Seuils de décision réajustés pour plus de souplesse (Whisper est difficile sur l'Arabe)
@@ -956,25 +1013,44 @@ Réponse STRICTEMENT en JSON :
     ]
 }}"""
             
-            ollama_payload = { "model": OLLAMA_MODEL, "prompt": prompt, "stream": False, "format": "json" }
-            try:
-                ai_resp = requests.post(OLLAMA_URL, json=ollama_payload, timeout=120)
-                if ai_resp.status_code == 200:
+            cache_key = feedback_signature(recorded_page, difficulty, similarity_ratio, missing_indices, "legacy-valid")
+            cached = await asyncio.to_thread(feedback_cache.get, cache_key)
+            feedback_tier = "cache" if cached else governor.select()
+            if cached:
+                logger.info("Feedback cache hit")
+                feedback_text = cached["feedback"]
+                details_list = cached.get("errors", [])
+            elif feedback_tier == TEMPLATE:
+                # Surcharge : pas d'appel LLM, résumé des passages manquants
+                feedback_text = f"Bonne récitation ! {matched_count} mots sur {len(expected_words)} reconnus. Continuez à vous entraîner."
+                for passage in missing_passages[:3]:
+                    details_list.append({
+                        "type": "passage_manquant",
+                        "word": passage,
+                        "context": "Ce passage n'a pas été détecté dans votre récitation."
+                    })
+            else:
+                try:
+                    llm_start = time.monotonic()
+                    response_text = await ollama.generate(prompt, model=governor.model_for(feedback_tier))
+                    governor.observe(feedback_tier, time.monotonic() - llm_start)
                     try:
-                        ai_json = json.loads(ai_resp.json().get("response", "{}"))
+                        ai_json = json.loads(response_text or "{}")
                         feedback_text = ai_json.get("feedback", "Bonne récitation, continuez vos efforts !")
                         details_list = ai_json.get("errors", [])
+                        if ai_json.get("feedback") and feedback_tier == PRIMARY:
+                            await asyncio.to_thread(feedback_cache.put, cache_key, {"feedback": feedback_text, "errors": details_list})
                     except:
                         feedback_text = f"Bonne récitation ! {matched_count} mots sur {len(expected_words)} reconnus. Continuez à vous entraîner."
-                else:
-                    logger.error(f"Ollama error {ai_resp.status_code}")
-                    feedback_text = f"Récitation enregistrée. {matched_count} mots sur {len(expected_words)} détectés par le système."
-            except requests.exceptions.Timeout:
-                logger.error("IA Timeout")
-                feedback_text = f"Récitation enregistrée. {matched_count} mots sur {len(expected_words)} détectés. L'analyse détaillée n'a pas pu aboutir."
-            except Exception as e:
-                logger.error(f"IA Error: {e}")
-                feedback_text = f"Récitation enregistrée. {matched_count} mots sur {len(expected_words)} détectés."
+                except OllamaUnavailable as e:
+                    logger.error(f"IA unavailable: {e.reason}")
+                    if e.reason == "timeout":
+                        governor.observe(feedback_tier, time.monotonic() - llm_start)
+                    feedback_tier = "fallback"
+                    if e.reason == "timeout":
+                        feedback_text = f"Récitation enregistrée. {matched_count} mots sur {len(expected_words)} détectés. L'analyse détaillée n'a pas pu aboutir."
+                    else:
+                        feedback_text = f"Récitation enregistrée. {matched_count} mots sur {len(expected_words)} détectés par le système."
         
         # Cas score bas (< 60%) : encouragement + conseils
         else:
@@ -1002,45 +1078,58 @@ Réponse STRICTEMENT en JSON :
     "errors": []
 }}"""
             
-            ollama_payload = { "model": OLLAMA_MODEL, "prompt": prompt, "stream": False, "format": "json" }
-            try:
-                ai_resp = requests.post(OLLAMA_URL, json=ollama_payload, timeout=120)
-                if ai_resp.status_code == 200:
+            cache_key = feedback_signature(recorded_page, difficulty, similarity_ratio, missing_indices, "legacy-low")
+            cached = await asyncio.to_thread(feedback_cache.get, cache_key)
+            feedback_tier = "cache" if cached else governor.select()
+            if cached:
+                logger.info("Feedback cache hit")
+                feedback_text = cached["feedback"]
+            elif feedback_tier == TEMPLATE:
+                feedback_text = "Bel effort ! Continuez à réciter régulièrement, chaque tentative vous rapproche de la maîtrise."
+            else:
+                try:
+                    llm_start = time.monotonic()
+                    response_text = await ollama.generate(prompt, model=governor.model_for(feedback_tier))
+                    governor.observe(feedback_tier, time.monotonic() - llm_start)
                     try:
-                        ai_json = json.loads(ai_resp.json().get("response", "{}"))
+                        ai_json = json.loads(response_text or "{}")
                         feedback_text = ai_json.get("feedback", "Bon effort ! Continuez à vous entraîner, la persévérance est la clé.")
+                        if ai_json.get("feedback") and feedback_tier == PRIMARY:
+                            await asyncio.to_thread(feedback_cache.put, cache_key, {"feedback": feedback_text, "errors": []})
                     except:
                         feedback_text = "Bel effort ! Continuez à réciter régulièrement, chaque tentative vous rapproche de la maîtrise."
-                else:
+                except OllamaUnavailable as e:
+                    logger.error(f"IA unavailable: {e.reason}")
+                    if e.reason == "timeout":
+                        governor.observe(feedback_tier, time.monotonic() - llm_start)
+                    feedback_tier = "fallback"
                     feedback_text = "Bel effort ! Le système n'a pas pu analyser en détail, mais continuez à vous entraîner."
-            except:
-                feedback_text = "Bel effort ! Continuez à réciter régulièrement pour vous améliorer."
 
         # Sauvegarde en Base de Données (CRUCIAL pour l'historique)
         try:
             # Correction des chemins pour la DB (slash vs backslash)
             # IMPORTANT: Toujours stocker avec des slashes pour compatibilité URL
-            db_file_path = f"recordings/{filename}"
+            db_file_path = db_path(filename)
             
-            new_recording = Recording(
+            # Historique : insertion différée (write-behind), en lot avec les autres requêtes
+            recording_fields = dict(
                 user_id=current_user.id,
-                page_number=page,
+                page_number=recorded_page,
                 file_path=db_file_path,
                 score=int(similarity_ratio * 100),
                 feedback=feedback_text,
                 details=json.dumps(details_list) if 'details_list' in locals() else None
             )
-            db.add(new_recording)
+            def insert(session: Session) -> None:
+                session.add(Recording(**recording_fields))
+                # Statistiques par page (même transaction) : /validate ne compte que le score
+                record_recitation(session, RuleStat, PageStat, recording_fields["user_id"],
+                                  recording_fields["page_number"], recording_fields["score"])
+            write_behind.submit(insert)
             
             # Mise à jour progression si validé
             if is_valid:
-                prog = db.query(Progress).filter(Progress.user_id==current_user.id, Progress.page_number==page).first()
-                if not prog:
-                    prog = Progress(user_id=current_user.id, page_number=page, status="mastered")
-                    db.add(prog)
-                else:
-                    prog.status = "mastered"
-                    prog.last_updated = datetime.now()
+                upsert_progress(db, Progress, current_user.id, [(recorded_page, "mastered")])
             
             db.commit()
             logger.info("Recording saved to DB.")
@@ -1051,8 +1140,11 @@ Réponse STRICTEMENT en JSON :
         return {
             "valid": is_valid,
             "feedback": feedback_text,
+            "feedback_tier": feedback_tier,
             "details": details_list if 'details_list' in locals() else [],
             "audio_url": f"/recordings/{filename}",
+            "page": recorded_page,
+            "detected_passage": detected_passage,
             "debug": {
                 "whisper_raw": transcribed_text,
                 "fuzzy_coverage": f"{matched_count}/{len(expected_words)}",
@@ -1151,6 +1243,8 @@ async def check_heartbeat():
         timeout = 30 if first_heartbeat_received else 300
         if time.time() - last_heartbeat > timeout:
             print("Aucun signal détecté (heartbeat). Arrêt automatique du serveur...")
+            # Vider la file d'écriture avant l'arrêt brutal
+            write_behind.close()
             # On utilise _exit pour fermer brutalement le processus uvicorn
             import os as os_native
             
@@ -1162,12 +1256,34 @@ async def check_heartbeat():
                 pass
             os_native._exit(0)
 
+@app.get("/api/v1/system/ollama")
+async def ollama_status():
+    return {**ollama.stats(), "tiering": governor.stats(), "health": await ollama.health()}
+
+@app.get("/api/v1/system/db")
+async def db_status():
+    return {"write_behind": write_behind.stats(), "engines": db_metrics(), "auth_cache": principal_cache.stats(), "password_hasher": password_hasher.stats(),
+            "maintenance": recording_maintenance.stats()}
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await ollama.aclose()
+    write_behind.close()
+    recording_maintenance.stop()
+    password_hasher.shutdown()
+
 @app.on_event("startup")
 async def startup_event():
+    apply_threadpool_budget()
+    recording_store.purge_temp()
+    recording_maintenance.start()
     asyncio.create_task(check_heartbeat())
     # Exécuter l'auto-installation dans un thread séparé pour ne pas bloquer le démarrage du serveur web
     threading.Thread(target=ensure_ffmpeg_ready, daemon=True).start()
     threading.Thread(target=ensure_ollama_ready, daemon=True).start()
+    # Index n-grammes du Mushaf pour l'auto-détection du passage récité
+    from backend.app.services.passage_index import ensure_index
+    threading.Thread(target=ensure_index, daemon=True).start()
     # Lancer le navigateur automatiquement (fonctionne en mode dev ET en mode exe)
     if not RUNNING_IN_DOCKER:
         threading.Thread(target=open_browser, daemon=True).start()
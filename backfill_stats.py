@@ -0,0 +1,97 @@
+"""
+Rebuild the per-user rule / page statistics (core/rule_stats.py) from the
+existing recordings.
+
+Usage:
+    python backfill_stats.py [--user ID ...] [--batch 500] [--dry-run]
+
+The stats tables are maintained on each analysis from now on; recordings
+made before they existed are not counted. This tool replays every recording
+of the selected users (all users by default) in chronological order,
+through the same `record_recitation` as the live path, so rolling averages
+come out as if the tables had always existed. Recordings with an encoded
+analysis (recording_analyses) also feed the rule stats and word counts;
+older ones only count towards the page score.
+
+Each user is rebuilt in its own transaction: its stats rows are deleted,
+then its recordings are streamed by keyset batches of --batch rows.
+Safe to run again; stop the server first, or recitations made during the
+run may be counted twice.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.app.core.database import Base, SessionLocal, engine
+from backend.app.core.rule_stats import record_recitation
+from backend.app.models.models import PageStat, Recording, RecordingAnalysis, RuleStat, User
+from backend.app.services.analysis_codec import decode_analysis
+
+
+def backfill_user(db, user_id: int, batch: int) -> dict:
+    db.query(RuleStat).filter(RuleStat.user_id == user_id).delete()
+    db.query(PageStat).filter(PageStat.user_id == user_id).delete()
+    counts = {"recordings": 0, "analyses": 0, "undecodable": 0}
+    last = None
+    while True:
+        query = db.query(
+            Recording.id, Recording.page_number, Recording.score, Recording.timestamp, RecordingAnalysis.data
+        ).outerjoin(RecordingAnalysis, RecordingAnalysis.recording_id == Recording.id).filter(
+            Recording.user_id == user_id
+        )
+        if last is not None:
+            query = query.filter(Recording.id > last)
+        rows = query.order_by(Recording.id).limit(batch).all()
+        if not rows:
+            return counts
+        # Recordings are inserted in FIFO order (write-behind), so id order is chronological
+        for row in rows:
+            words = None
+            if row.data is not None:
+                try:
+                    words = decode_analysis(row.data)["words"]
+                    counts["analyses"] += 1
+                except (ValueError, IndexError):
+                    counts["undecodable"] += 1
+            if row.page_number is not None:
+                record_recitation(db, RuleStat, PageStat, user_id, row.page_number, row.score, words, row.timestamp)
+                counts["recordings"] += 1
+        last = rows[-1].id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--user", type=int, action="append", help="user id (repeatable); default: all users")
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="replay, report, then roll back")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)   # creates rule_stats / page_stats on old databases
+    db = SessionLocal()
+    try:
+        user_ids = args.user or [uid for (uid,) in db.query(User.id).order_by(User.id)]
+        total = {"recordings": 0, "analyses": 0, "undecodable": 0}
+        start = time.perf_counter()
+        for user_id in user_ids:
+            counts = backfill_user(db, user_id, args.batch)
+            if args.dry_run:
+                db.rollback()
+            else:
+                db.commit()
+            for key, value in counts.items():
+                total[key] += value
+            print(f"user {user_id}: {counts['recordings']} recordings, {counts['analyses']} analyses")
+        elapsed = time.perf_counter() - start
+        print(
+            f"{len(user_ids)} users, {total['recordings']} recordings ({total['analyses']} with analysis, "
+            f"{total['undecodable']} undecodable) in {elapsed:.1f}s" + (" [dry run]" if args.dry_run else "")
+        )
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
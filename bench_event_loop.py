@@ -0,0 +1,95 @@
+"""
+Concurrency check for the async DB layer: hammer the async user routes and
+measure how late a 10 ms heartbeat ticker wakes up on the same event loop.
+
+Usage:
+    python bench_event_loop.py [--requests 400] [--concurrency 32]
+
+Runs the users router in-process (httpx ASGI transport) against a throwaway
+SQLite database. With DB calls on the event loop, every query delays the
+ticker; with the async session layer the lag stays near zero.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+_tmp = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'bench.db')}"
+
+import httpx
+from fastapi import FastAPI
+
+from backend.app.api.v1 import users
+from backend.app.core.database import Base, SessionLocal, engine, write_behind
+from backend.app.core.security import create_access_token, get_password_hash
+from backend.app.models.models import User
+
+
+async def ticker(stop: asyncio.Event, lags: list, period: float = 0.01):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(period)
+        lags.append((time.perf_counter() - start - period) * 1000)
+
+
+async def run(n_requests: int, concurrency: int):
+    app = FastAPI()
+    app.include_router(users.router, prefix="/api/v1/users")
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'bench'})}"}
+
+    lags: list = []
+    stop = asyncio.Event()
+    tick = asyncio.create_task(ticker(stop, lags))
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def one(i):
+            async with semaphore:
+                start = time.perf_counter()
+                if i % 3 == 0:
+                    r = await client.put("/api/v1/users/me/settings", json={"mushaf_type": "madani", "difficulty_level": 1 + i % 3}, headers=headers)
+                elif i % 3 == 1:
+                    r = await client.post("/api/v1/users/me/progress", json={"page": 1 + i % 604, "status": "mastered"}, headers=headers)
+                else:
+                    r = await client.get("/api/v1/users/me", headers=headers)
+                r.raise_for_status()
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(n_requests)))
+        elapsed = time.perf_counter() - start
+
+    stop.set()
+    await tick
+    return elapsed, latencies, lags
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    db.add(User(username="bench", hashed_password=get_password_hash("bench")))
+    db.commit()
+    db.close()
+
+    elapsed, latencies, lags = asyncio.run(run(args.requests, args.concurrency))
+    write_behind.close()
+    lags.sort()
+    print(f"{args.requests} requests, concurrency {args.concurrency}: {args.requests / elapsed:.0f} req/s")
+    print(f"  request latency   median {statistics.median(latencies):7.2f} ms   max {max(latencies):7.2f} ms")
+    print(f"  event-loop lag    median {statistics.median(lags):7.2f} ms   p99 {lags[int(len(lags) * 0.99)]:7.2f} ms   max {lags[-1]:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
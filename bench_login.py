@@ -0,0 +1,101 @@
+"""
+Login latency under analysis load: Argon2 inline in the threadpool (before)
+vs the bounded password executor (after).
+
+Usage:
+    python bench_login.py [--logins 32] [--analyses 2] [--workers 2]
+
+"Analyses" are threads doing fixed chunks of GIL-free CPU work (zlib), like
+Whisper / alignment jobs; their per-chunk latency shows how much CPU the
+login burst takes from them. Each login verifies one Argon2 hash with the
+configured costs (ARGON2_* settings).
+  - inline:  every login verifies on its own threadpool thread, as the sync
+             /token route did (anyio's 40 threads);
+  - bounded: logins await password_hasher (PASSWORD_HASH_WORKERS workers).
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import threading
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from starlette.concurrency import run_in_threadpool
+
+from backend.app.core.config import settings
+from backend.app.core.passwords import PasswordHasher, _ctx
+
+PAYLOAD = os.urandom(1 << 20)
+
+
+def analysis_worker(stop: threading.Event, latencies: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        for _ in range(4):
+            zlib.compress(PAYLOAD, 6)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+
+def pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def burst(verify, n: int):
+    async def one():
+        start = time.perf_counter()
+        await verify()
+        return (time.perf_counter() - start) * 1000
+
+    return await asyncio.gather(*(one() for _ in range(n)))
+
+
+def run(label, verify, logins, analyses, baseline):
+    stop, latencies = threading.Event(), []
+    threads = [threading.Thread(target=analysis_worker, args=(stop, latencies)) for _ in range(analyses)]
+    for t in threads:
+        t.start()
+    time.sleep(1.0)
+    latencies.clear()
+    login_ms = asyncio.run(burst(verify, logins))
+    stop.set()
+    for t in threads:
+        t.join()
+    print(f"  {label:<8} login p50 {statistics.median(login_ms):8.0f} ms  p99 {pct(login_ms, 0.99):8.0f} ms   "
+          f"analysis chunk median {statistics.median(latencies):7.0f} ms  max {max(latencies):7.0f} ms "
+          f"(idle {baseline:.0f} ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logins", type=int, default=32)
+    parser.add_argument("--analyses", type=int, default=2)
+    parser.add_argument("--workers", type=int, default=settings.PASSWORD_HASH_WORKERS)
+    args = parser.parse_args()
+
+    params = (settings.ARGON2_TIME_COST, settings.ARGON2_MEMORY_COST_KB, settings.ARGON2_PARALLELISM)
+    hashed = _ctx(params).hash("correct horse")
+    hasher = PasswordHasher(*params, workers=args.workers, max_pending=args.logins)
+
+    stop, idle = threading.Event(), []
+    t = threading.Thread(target=analysis_worker, args=(stop, idle))
+    t.start()
+    time.sleep(1.0)
+    stop.set()
+    t.join()
+    baseline = statistics.median(idle)
+
+    print(f"{os.cpu_count()} CPUs, {args.logins} concurrent logins, {args.analyses} analysis threads, "
+          f"argon2 t={params[0]} m={params[1]}KB p={params[2]}")
+    run("inline", lambda: run_in_threadpool(_ctx(params).verify, "correct horse", hashed), args.logins, args.analyses, baseline)
+    run("bounded", lambda: hasher.verify_and_update_async("correct horse", hashed), args.logins, args.analyses, baseline)
+    print(f"  executor: {hasher.stats()}")
+    hasher.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Compare the size (and optionally the latency) of the AI coaching prompt:
+full-text prompt (before) vs diff-based prompt with token budget (after).
+
+Usage:
+    python bench_prompt.py transcripts.tsv [--ollama] [--limit 10]
+
+Recitations are read from a transcript file, as in bench_vocabulary.py. With
+--ollama, each prompt is also sent to the local Ollama server and the
+prompt evaluation time / total latency reported by Ollama are compared.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.app.services.quran import get_quran_page_text, normalize_arabic
+from backend.app.services.prompt_builder import build_feedback_prompt, estimate_tokens
+from bench_vocabulary import load_traffic
+
+
+def legacy_prompt(expected_text, student_text, similarity_ratio):
+    """The prompt get_ai_feedback used to send: both texts in full."""
+    return f"""
+    Tu es un expert Tajwid. Analyse ces deux textes normalisés (sans voyelles).
+
+    Attendu : {expected_text}
+    Entendu : {student_text}
+
+    Les textes se ressemblent à {int(similarity_ratio*100)}%.
+    Explique brièvement les différences majeures (Mots oubliés ? Mots ajoutés ?).
+    Ne sois PAS scolaire. Donne un conseil concis en français.
+
+    Réponse (JSON) :
+    {{ "feedback": "Ton conseil ici..." }}
+    """
+
+
+async def time_prompt(prompt):
+    from backend.app.services.ollama_client import ollama
+
+    start = time.perf_counter()
+    await ollama.generate(prompt)
+    return time.perf_counter() - start
+
+
+def summary(label, values, unit=""):
+    if not values:
+        return
+    print(f"  {label:<22} median {statistics.median(values):8.1f}{unit}   max {max(values):8.1f}{unit}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("transcripts", help="page<TAB>transcript per line")
+    parser.add_argument("--ollama", action="store_true", help="also time the prompts against Ollama")
+    parser.add_argument("--limit", type=int, default=10, help="recitations sent to Ollama")
+    args = parser.parse_args()
+
+    samples = load_traffic(args.transcripts)
+    if not samples:
+        print(f"No transcripts found in {args.transcripts}")
+        return
+    page_texts = {page: get_quran_page_text(page) for page in {p for p, _ in samples}}
+
+    rows = []
+    for page, transcript in samples:
+        expected = page_texts.get(page)
+        if not expected:
+            continue
+        clean_expected, clean_student = normalize_arabic(expected), normalize_arabic(transcript)
+        ratio = len(set(clean_student.split()) & set(clean_expected.split())) / max(1, len(clean_expected.split()))
+        before = legacy_prompt(clean_expected, clean_student, ratio)
+        after, meta = build_feedback_prompt(clean_expected, clean_student, ratio)
+        rows.append((before, after, meta))
+
+    print(f"{len(rows)} recitations")
+    print("before (full texts):")
+    summary("chars", [len(b) for b, _, _ in rows])
+    summary("estimated tokens", [estimate_tokens(b) for b, _, _ in rows])
+    print("after (diff, budgeted):")
+    summary("chars", [len(a) for _, a, _ in rows])
+    summary("estimated tokens", [m["tokens"] for _, _, m in rows])
+    summary("items omitted", [m["omitted"] for _, _, m in rows])
+
+    if args.ollama:
+        from backend.app.services.ollama_client import ollama
+
+        async def run():
+            timings = {"before": [], "after": []}
+            for before, after, _ in rows[:args.limit]:
+                timings["before"].append(await time_prompt(before))
+                timings["after"].append(await time_prompt(after))
+            return timings
+
+        timings = asyncio.run(run())
+        print("Ollama latency:")
+        summary("before", timings["before"], "s")
+        summary("after", timings["after"], "s")
+        print(f"  {ollama.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Replay recitation transcripts against the word-matching caches
+(services/vocabulary.py) and report cold vs warm timings and hit rates.
+
+Usage:
+    python bench_vocabulary.py transcripts.tsv [--passes 2]
+
+The transcript file holds one recitation per line: the page number, a tab,
+then the Whisper transcript. Blank lines and lines starting with # are
+ignored. Page texts are fetched once from the Quran API and reused across
+passes.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.app.services.quran import get_quran_page_text
+from backend.app.services.tajweed_engine import TajweedEngine
+from backend.app.services import vocabulary
+
+def load_traffic(path):
+    """[(page, transcript)] from a `page<TAB>transcript` file."""
+    samples = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            page, sep, transcript = line.partition("\t")
+            if not sep or not page.strip().isdigit():
+                sys.exit(f"{path}:{number}: expected '<page><TAB><transcript>'")
+            samples.append((int(page), transcript.strip()))
+    return samples
+
+
+def replay(samples, page_texts):
+    start = time.perf_counter()
+    for page, transcript in samples:
+        expected = page_texts.get(page)
+        if not expected:
+            continue
+        heard = transcript.split()
+        for i, word in enumerate(expected.split()):
+            student = heard[i] if i < len(heard) else ""
+            TajweedEngine.analyze_word(word, student, level=1)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("transcripts", help="page<TAB>transcript per line")
+    parser.add_argument("--passes", type=int, default=2)
+    args = parser.parse_args()
+
+    samples = load_traffic(args.transcripts)
+    if not samples:
+        print(f"No transcripts found in {args.transcripts}")
+        return
+    pages = {page for page, _ in samples}
+    print(f"{len(samples)} recitations over {len(pages)} pages")
+    page_texts = {page: get_quran_page_text(page) for page in pages}
+
+    vocabulary.reset_caches()
+    for n in range(args.passes):
+        elapsed = replay(samples, page_texts)
+        label = "cold" if n == 0 else "warm"
+        print(f"pass {n + 1} ({label}): {elapsed * 1000:.1f} ms")
+        print(f"  {vocabulary.cache_stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Pre-build the resized WebP / AVIF page images (services/page_images.py).
+
+Usage:
+    python build_page_images.py [--src quran_pages] [--out quran_pages_cache]
+                                [--formats avif,webp] [--widths 320,480,768,1080] [--no-full]
+
+The server renders a missing derivative on its first request; running this
+once (or at build time) removes that first-view delay. The PWA is served
+as static files by GitHub Pages, with no negotiation, so its deploy runs
+this into the export next to the JPEGs and `<picture>` picks the variant.
+
+Widths at or above a page's own width are skipped (the `.full` variant
+covers them). Up-to-date files are kept, so it is safe to run again.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.app.core.config import settings
+from backend.app.services import page_images
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--src", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "quran_pages"))
+    parser.add_argument("--out", default=settings.PAGE_IMAGE_CACHE_DIR)
+    parser.add_argument("--formats", default=",".join(settings.PAGE_IMAGE_FORMATS))
+    parser.add_argument("--widths", default=",".join(str(w) for w in settings.PAGE_IMAGE_WIDTHS))
+    parser.add_argument("--no-full", action="store_true", help="only the width-limited variants")
+    args = parser.parse_args()
+
+    if not page_images.PIL_AVAILABLE:
+        sys.exit("Pillow is not installed: pip install pillow")
+    formats = [f.strip().lower() for f in args.formats.split(",") if f.strip()]
+    for fmt in formats:
+        if fmt not in page_images.MEDIA_TYPES or not page_images._can_save(fmt):
+            sys.exit(f"Format not supported by this Pillow build: {fmt}")
+    widths = sorted(int(w) for w in args.widths.split(",") if w.strip())
+
+    start = time.perf_counter()
+    counts = page_images.build_all(args.src, args.out, formats, widths, full=not args.no_full)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{counts['pages']} pages ({counts['bytes_source'] / 1e6:.1f} MB): {counts['written']} files written "
+        f"({counts['bytes_written'] / 1e6:.1f} MB), {counts['skipped']} up to date, in {elapsed:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -56,6 +56,8 @@ PyInstaller.__main__.run([
     '--hidden-import=googleapiclient.discovery',
     '--hidden-import=google_auth_oauthlib.flow',
     '--hidden-import=sqlalchemy.dialects.postgresql',
+    '--hidden-import=sqlalchemy.dialects.sqlite.aiosqlite',
+    '--hidden-import=aiosqlite',
     '--hidden-import=fasthtml',
     # ── Analyse audio (nouveau moteur Tajwid) ──────────────────────────────
     '--hidden-import=backend.app.services.audio_analysis',
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Index, Float
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
@@ -6,6 +6,10 @@ from datetime import datetime
 import os
 import sys
 
+from backend.app.core.engine_profile import build_engine
+from backend.app.core.write_behind import WriteBehindQueue
+from backend.app.core.config import settings
+
 # Get Base Directory for DB relative to executable or script
 if getattr(sys, 'frozen', False):
     BASE_DIR = os.path.dirname(sys.executable)
@@ -17,13 +21,19 @@ db_path = os.path.join(BASE_DIR, "quran_app.db")
 SQLALCHEMY_DATABASE_URL = f"sqlite:///{db_path}"
 
 # Create Engine
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+engine = build_engine(SQLALCHEMY_DATABASE_URL, name="legacy")
 
 # SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Non-critical writes (recording inserts, streak updates), committed in batches
+write_behind = WriteBehindQueue(
+    SessionLocal,
+    batch_size=settings.WRITE_BEHIND_BATCH_SIZE,
+    flush_interval=settings.WRITE_BEHIND_FLUSH_INTERVAL,
+    name="legacy",
+)
+
 # Base class for models
 Base = declarative_base()
 
@@ -37,6 +47,7 @@ class User(Base):
     difficulty_level = Column(Integer, default=1) # 1: Beginner, 2: Intermediate, 3: Expert
     daily_streak = Column(Integer, default=0)
     last_active_date = Column(DateTime, nullable=True)
+    progress_version = Column(Integer, default=0)  # bumped on every progress write (sync cursor)
     
     progress = relationship("Progress", back_populates="user")
     recordings = relationship("Recording", back_populates="user")
@@ -49,9 +60,17 @@ class Progress(Base):
     page_number = Column(Integer, index=True)
     status = Column(String)  # "mastered", "revise", "locked", "started"
     last_updated = Column(DateTime, default=datetime.utcnow)
+    version = Column(Integer, default=0)  # user's progress_version when last written
 
     user = relationship("User", back_populates="progress")
 
+    __table_args__ = (
+        # One row per (user, page): target of the ON CONFLICT upserts
+        Index("uq_progress_user_page", "user_id", "page_number", unique=True),
+        # Delta sync: rows of a user changed since a version
+        Index("ix_progress_user_version", "user_id", "version"),
+    )
+
 class Recording(Base):
     __tablename__ = "recordings"
 
@@ -66,5 +85,39 @@ class Recording(Base):
 
     user = relationship("User", back_populates="recordings")
 
+    # History query: user_id = ? AND page_number = ? ORDER BY timestamp DESC
+    __table_args__ = (Index("ix_recordings_user_page_ts_id", "user_id", "page_number", "timestamp", "id"),)
+
+class RuleStat(Base):
+    """Agrégat par utilisateur d'une règle de Tajwid (backend/app/core/rule_stats.py)."""
+    __tablename__ = "rule_stats"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    rule = Column(String)
+    subtype = Column(String, default="")
+    attempts = Column(Integer, default=0)
+    successes = Column(Integer, default=0)
+    confidence = Column(Float, default=0.0)  # moyenne glissante sur les récitations
+    last_updated = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (Index("uq_rule_stats_user_rule", "user_id", "rule", "subtype", unique=True),)
+
+class PageStat(Base):
+    """Agrégat par utilisateur d'une page (backend/app/core/rule_stats.py)."""
+    __tablename__ = "page_stats"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    page_number = Column(Integer)
+    attempts = Column(Integer, default=0)
+    word_attempts = Column(Integer, default=0)
+    word_successes = Column(Integer, default=0)
+    score = Column(Float, default=0.0)  # moyenne glissante sur les récitations
+    best_score = Column(Integer, default=0)
+    last_updated = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (Index("uq_page_stats_user_page", "user_id", "page_number", unique=True),)
+
 def init_db():
     Base.metadata.create_all(bind=engine)
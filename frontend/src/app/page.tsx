@@ -9,6 +9,9 @@ import ShareModal from '@/components/dashboard/ShareModal';
 
 type PageStatus = 'locked' | 'started' | 'revise' | 'mastered';
 
+// Slot codes of /users/me/progress/snapshot (backend/app/core/progress_snapshot.py)
+const SLOT_STATUSES: PageStatus[] = ['locked', 'started', 'revise', 'mastered'];
+
 export default function DashboardPage() {
   const [selectedPage, setSelectedPage] = useState<number | null>(null);
   const [progress, setProgress] = useState<Record<number, PageStatus>>({});
@@ -54,21 +57,25 @@ export default function DashboardPage() {
 
   const fetchData = async (headers: HeadersInit, userData: any) => {
     try {
-      // 2. Fetch Progress (Using passed headers)
-      const progressRes = await fetch('http://localhost:8001/api/v1/users/me/progress', { headers });
-      const progressData: Record<number, string> = progressRes.ok ? await progressRes.json() : {};
+      // 2. Fetch Progress: compact snapshot (one status digit per page + server-side totals).
+      // The browser revalidates it with its ETag: unchanged progress comes back as a 304.
+      const progressRes = await fetch('http://localhost:8001/api/v1/users/me/progress/snapshot', { headers });
+      const snapshot = progressRes.ok ? await progressRes.json() : null;
 
-      // Convert backend status to frontend status if needed (strings match mostly)
       const formattedProgress: Record<number, PageStatus> = {};
-      Object.entries(progressData).forEach(([page, status]) => {
-        formattedProgress[parseInt(page)] = status as PageStatus;
-      });
+      const slots: string = snapshot?.slots || '';
+      for (let i = 0; i < slots.length; i++) {
+        const code = slots.charCodeAt(i) - 48;
+        if (code > 0) formattedProgress[i + 1] = SLOT_STATUSES[code];
+      }
 
-      // 3. Calculate Stats
-      let masteredCount = 0;
-      Object.values(formattedProgress).forEach(status => {
-        if (status === 'mastered') masteredCount++;
-      });
+      // 3. Stats (computed by the server)
+      const masteredCount: number = snapshot?.totals?.mastered || 0;
+
+      // 4. Daily activity event (streak): idempotent server-side, written at most once a day
+      let streak = userData.daily_streak || 0;
+      const activityRes = await fetch('http://localhost:8001/api/v1/users/me/activity', { method: 'POST', headers });
+      if (activityRes.ok) streak = (await activityRes.json()).daily_streak;
 
       const total = 604;
       const percentage = (masteredCount / total) * 100;
@@ -78,7 +85,7 @@ export default function DashboardPage() {
         mastered: masteredCount,
         total,
         percentage,
-        streak: userData.daily_streak || 0
+        streak
       });
 
     } catch (e) {
@@ -11,7 +11,7 @@ interface RecordingHistoryProps {
 
 interface Recording {
     id: number;
-    url: string;
+    url: string | null;  // null: audio removed by retention, score kept
     timestamp: string;
     score: number;
     feedback: string;
@@ -21,20 +21,24 @@ export default function RecordingHistory({ page, refreshTrigger }: RecordingHist
     const [history, setHistory] = useState<Recording[]>([]);
     const [isLoading, setIsLoading] = useState(false);
     const [playingId, setPlayingId] = useState<number | null>(null);
+    // Curseur de la page suivante (en-tête X-Next-Cursor), null = fin de l'historique
+    const [nextCursor, setNextCursor] = useState<string | null>(null);
     const audioRef = useRef<HTMLAudioElement | null>(null);
 
-    const fetchHistory = async () => {
+    const fetchHistory = async (cursor: string | null = null) => {
         setIsLoading(true);
         try {
             const token = sessionStorage.getItem('access_token');
-            const response = await fetch(`http://localhost:8001/api/v1/recitation/history/${page}`, {
+            const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+            const response = await fetch(`http://localhost:8001/api/v1/recitation/history/${page}${query}`, {
                 headers: {
                     'Authorization': token ? `Bearer ${token}` : ''
                 }
             });
             if (response.ok) {
                 const data = await response.json();
-                setHistory(data);
+                setHistory(prev => cursor ? [...prev, ...data] : data);
+                setNextCursor(response.headers.get('X-Next-Cursor'));
             }
         } catch (err) {
             console.error("Failed to fetch history:", err);
@@ -48,6 +52,7 @@ export default function RecordingHistory({ page, refreshTrigger }: RecordingHist
     }, [page, refreshTrigger]);
 
     const playRecording = (rec: Recording) => {
+        if (!rec.url) return;
         if (playingId === rec.id) {
             audioRef.current?.pause();
             setPlayingId(null);
@@ -102,8 +107,10 @@ export default function RecordingHistory({ page, refreshTrigger }: RecordingHist
                     <div className="flex items-center gap-3">
                         <button
                             onClick={() => playRecording(rec)}
+                            disabled={!rec.url}
+                            title={rec.url ? undefined : "Audio archivé"}
                             className={clsx(
-                                "w-10 h-10 rounded-full flex items-center justify-center transition-colors",
+                                "w-10 h-10 rounded-full flex items-center justify-center transition-colors disabled:opacity-40 disabled:cursor-not-allowed",
                                 playingId === rec.id ? "bg-primary text-white" : "bg-slate-100 text-slate-600 hover:bg-slate-200"
                             )}
                         >
@@ -134,6 +141,15 @@ export default function RecordingHistory({ page, refreshTrigger }: RecordingHist
                     </div>
                 </div>
             ))}
+            {nextCursor && (
+                <button
+                    onClick={() => fetchHistory(nextCursor)}
+                    disabled={isLoading}
+                    className="w-full py-2 text-xs font-bold text-slate-400 hover:text-primary transition-colors"
+                >
+                    {isLoading ? <Loader2 className="w-4 h-4 animate-spin mx-auto" /> : "Voir plus"}
+                </button>
+            )}
         </div>
     );
 }
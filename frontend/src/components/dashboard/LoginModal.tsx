@@ -2,17 +2,13 @@
 
 import React, { useState, useEffect } from 'react';
 import { User, Lock, UserPlus, LogIn, Loader2, AlertCircle } from 'lucide-react';
+import { fetchAllUsers, UserSummary } from '../../utils/users';
 
 interface LoginModalProps {
     isOpen: boolean;
     onLoginSuccess: (token: string, user: any) => void;
 }
 
-interface UserSummary {
-    id: number;
-    username: string;
-}
-
 export default function LoginModal({ isOpen, onLoginSuccess }: LoginModalProps) {
     const [view, setView] = useState<'login' | 'register'>('login');
     const [users, setUsers] = useState<UserSummary[]>([]);
@@ -31,15 +27,12 @@ export default function LoginModal({ isOpen, onLoginSuccess }: LoginModalProps)
 
     const fetchUsers = async () => {
         try {
-            const res = await fetch('http://localhost:8001/api/v1/users/all');
-            if (res.ok) {
-                const data = await res.json();
-                setUsers(data);
-                if (data.length === 0) {
-                    setView('register');
-                } else if (!selectedUser && data.length > 0) {
-                    setSelectedUser(data[0].username);
-                }
+            const data = await fetchAllUsers();
+            setUsers(data);
+            if (data.length === 0) {
+                setView('register');
+            } else if (!selectedUser && data.length > 0) {
+                setSelectedUser(data[0].username);
             }
         } catch (e) {
             console.error("Failed to fetch users", e);
@@ -136,8 +136,12 @@ export default function PageModal({ page, isOpen, onClose, onNext, onPrev, curre
                             "w-full h-full p-4 md:p-12 flex items-center justify-center transition-all duration-500",
                             (isRecording && !showPage) ? "scale-90 blur-sm grayscale opacity-20" : "scale-100 opacity-100"
                         )}>
+                            {/* Dérivé 320 px (?w=) pour les petites fenêtres, page entière (455 px) sinon ;
+                                le serveur choisit AVIF / WebP selon l'en-tête Accept */}
                             <img
                                 src={`http://localhost:8001/api/v1/quran_pages/${page}.jpg`}
+                                srcSet={`http://localhost:8001/api/v1/quran_pages/${page}.jpg?w=320 320w, http://localhost:8001/api/v1/quran_pages/${page}.jpg 455w`}
+                                sizes="(max-width: 480px) 100vw, 455px"
                                 alt={`Page ${page}`}
                                 className="max-w-full max-h-full object-contain shadow-lg rounded-sm"
                                 onError={(e) => {
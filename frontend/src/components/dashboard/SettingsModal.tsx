@@ -2,6 +2,7 @@
 
 import React, { useState, useEffect } from 'react';
 import { X, UserPlus, Users, Trash2, LogOut, CheckCircle, AlertCircle } from 'lucide-react';
+import { fetchAllUsers } from '../../utils/users';
 
 interface SettingsModalProps {
     isOpen: boolean;
@@ -32,15 +33,8 @@ export default function SettingsModal({ isOpen, onClose }: SettingsModalProps) {
 
     const fetchUsers = async () => {
         try {
-            const res = await fetch('http://localhost:8001/api/v1/users/all'); // Check path! users.py router is under /users? 
-            // In api.py: api_router.include_router(users.router, prefix="/users", tags=["users"])
-            // users.py: @router.get("/all")
-            // So path is /api/v1/users/all
-            if (res.ok) {
-                const data = await res.json();
-                // Data is list of {id, username}
-                setUsers(data);
-            }
+            // Data is list of {id, username}, every page of /api/v1/users/all
+            setUsers(await fetchAllUsers());
         } catch (e) {
             console.error("Error fetching users:", e);
         }
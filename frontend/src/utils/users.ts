@@ -0,0 +1,21 @@
+export interface UserSummary {
+    id: number;
+    username: string;
+}
+
+// /users/all est paginé (curseur dans l'en-tête X-Next-Cursor) : on suit le
+// curseur jusqu'au bout, le sélecteur doit proposer tous les élèves.
+export async function fetchAllUsers(): Promise<UserSummary[]> {
+    const users: UserSummary[] = [];
+    let cursor: string | null = null;
+    do {
+        const query: string = cursor ? `&cursor=${encodeURIComponent(cursor)}` : '';
+        const res: Response = await fetch(`http://localhost:8001/api/v1/users/all?limit=200${query}`);
+        if (!res.ok) {
+            throw new Error(`HTTP ${res.status}`);
+        }
+        users.push(...(await res.json()));
+        cursor = res.headers.get('X-Next-Cursor');
+    } while (cursor);
+    return users;
+}
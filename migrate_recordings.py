@@ -0,0 +1,40 @@
+"""
+Move recordings saved before the sharded store (core/recording_store.py)
+into their content-addressed shards and update Recording.file_path.
+
+Usage:
+    python migrate_recordings.py [--dir RECORDINGS_DIR]
+
+Flat files keep being served until they are migrated, so this can run at
+any time, server up or down. It is resumable: each file is linked into its
+shard and its rows committed before the flat name is removed. Files with
+identical content are merged into one.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.app.core.config import settings
+from backend.app.core.database import SessionLocal
+from backend.app.core.recording_store import RecordingStore
+from backend.app.models.models import Recording
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--dir", default=settings.RECORDINGS_DIR, help="recordings directory (default: %(default)s)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    counts = RecordingStore(args.dir).migrate_flat(SessionLocal, Recording)
+    print(
+        f"{counts['moved']} files moved, {counts['deduplicated']} duplicates merged, "
+        f"{counts['rows']} rows updated in {time.perf_counter() - start:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
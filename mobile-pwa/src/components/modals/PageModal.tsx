@@ -41,6 +41,8 @@ export default function PageModal({
   const [imgError, setImgError]   = useState(false)
 
   const basePath = process.env.NEXT_PUBLIC_BASE_PATH ?? ''
+  // WebP variants are built next to the JPEG at deploy time (build_page_images.py); 455 px = page scan width
+  const pageImage = `${basePath}/quran_pages/Quran_Page_${String(pageNumber).padStart(3, '0')}`
 
   useEffect(() => {
     setLoading(true)
@@ -120,13 +122,20 @@ export default function PageModal({
             {/* Page image */}
             <div className="rounded-lg overflow-hidden border border-slate-700 bg-white">
               {!imgError ? (
-                <img
-                  src={`${basePath}/quran_pages/Quran_Page_${String(pageNumber).padStart(3, '0')}.jpg`}
-                  alt={`Page ${pageNumber} du Coran`}
-                  className="w-full object-contain"
-                  loading="lazy"
-                  onError={() => setImgError(true)}
-                />
+                <picture>
+                  <source
+                    type="image/webp"
+                    srcSet={`${pageImage}.w320.webp 320w, ${pageImage}.full.webp 455w`}
+                    sizes="(max-width: 480px) 100vw, 455px"
+                  />
+                  <img
+                    src={`${pageImage}.jpg`}
+                    alt={`Page ${pageNumber} du Coran`}
+                    className="w-full object-contain"
+                    loading="lazy"
+                    onError={() => setImgError(true)}
+                  />
+                </picture>
               ) : (
                 <div className="flex items-center justify-center h-48 bg-slate-100">
                   <p className="text-slate-400 text-sm text-center px-4">